@@ -21,10 +21,19 @@ def receiveSignal(signalNumber, frame):
         print("\nReload Requested")
         if app is not None:
             app.reload()
+    if signalNumber == signal.SIGUSR2:
+        print("\nRollback Requested")
+        if app is not None:
+            app.rollback()
+    if signalNumber == signal.SIGUSR1:
+        if app is not None:
+            app.log_status()
 
 
 signal.signal(signal.SIGTERM, receiveSignal)
 signal.signal(signal.SIGHUP, receiveSignal)
+signal.signal(signal.SIGUSR2, receiveSignal)
+signal.signal(signal.SIGUSR1, receiveSignal)
 
 
 def setup_debug_mode():
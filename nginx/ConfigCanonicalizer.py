@@ -0,0 +1,169 @@
+"""
+Semantic comparison of rendered nginx configs.
+
+Two configs are considered equivalent when they differ only in comments, whitespace, quoting, or in the order of
+blocks whose order nginx ignores:
+- ``upstream`` and ``map`` blocks
+- ``server`` blocks, as long as every listen socket keeps the same default server
+- prefix and exact ``location`` blocks inside a server (regex locations keep their relative order)
+- simple directives relative to sibling blocks
+"""
+
+from typing import List, Tuple, Union
+
+Node = Tuple  # ("directive", args) or ("block", args, children)
+
+_UNORDERED_BLOCKS = {"upstream", "map"}
+_REGEX_LOCATION_MODIFIERS = {"~", "~*"}
+
+
+class ConfigSyntaxError(ValueError):
+    pass
+
+
+def _tokenize(config_str: str) -> List[Union[str, Tuple[str]]]:
+    """
+    Split config into words and the special tokens ';', '{' and '}'.
+    Quoted words are returned unquoted, wrapped in a 1-tuple so that a quoted "{" is not mistaken for a brace.
+    Like nginx, '#' only starts a comment at the beginning of a word.
+    """
+    tokens = []
+    i = 0
+    length = len(config_str)
+    while i < length:
+        char = config_str[i]
+        if char.isspace():
+            i += 1
+        elif char == "#":
+            while i < length and config_str[i] != "\n":
+                i += 1
+        elif char in ";{}":
+            tokens.append(char)
+            i += 1
+        elif char in "\"'":
+            quote = char
+            i += 1
+            word = []
+            while i < length and config_str[i] != quote:
+                if config_str[i] == "\\" and i + 1 < length:
+                    word.append(config_str[i : i + 2])
+                    i += 2
+                    continue
+                word.append(config_str[i])
+                i += 1
+            if i >= length:
+                raise ConfigSyntaxError("unterminated quoted string")
+            i += 1
+            tokens.append(("".join(word),))
+        else:
+            start = i
+            while i < length and not config_str[i].isspace() and config_str[i] not in ";{}\"'":
+                i += 1
+            tokens.append(config_str[start:i])
+    return tokens
+
+
+def _parse(tokens, position=0, nested=False) -> Tuple[List[Node], int]:
+    nodes: List[Node] = []
+    args: List[str] = []
+    while position < len(tokens):
+        token = tokens[position]
+        position += 1
+        if token == ";":
+            if args:
+                nodes.append(("directive", tuple(args)))
+            args = []
+        elif token == "{":
+            children, position = _parse(tokens, position, nested=True)
+            nodes.append(("block", tuple(args), tuple(children)))
+            args = []
+        elif token == "}":
+            if not nested or args:
+                raise ConfigSyntaxError("unexpected '}'")
+            return nodes, position
+        else:
+            args.append(token[0] if isinstance(token, tuple) else token)
+    if nested or args:
+        raise ConfigSyntaxError("unexpected end of config")
+    return nodes, position
+
+
+def _is_block(node: Node, name: str = None) -> bool:
+    return node[0] == "block" and (name is None or (node[1] and node[1][0] == name))
+
+
+def _canonical_location_children(children) -> tuple:
+    directives = [child for child in children if not _is_block(child)]
+    ordered_blocks = []
+    unordered_blocks = []
+    for child in children:
+        if not _is_block(child):
+            continue
+        child = ("block", child[1], _canonical_location_children(child[2]))
+        if _is_block(child, "location") and len(child[1]) > 2 and child[1][1] in _REGEX_LOCATION_MODIFIERS:
+            ordered_blocks.append(child)
+        elif _is_block(child, "location") or _is_block(child, "limit_except"):
+            unordered_blocks.append(child)
+        else:
+            ordered_blocks.append(child)
+    return tuple(directives) + tuple(sorted(unordered_blocks, key=repr)) + tuple(ordered_blocks)
+
+
+def _listen_sockets(server: Node) -> List[Tuple[str, bool]]:
+    sockets = []
+    for child in server[2]:
+        if child[0] == "directive" and child[1][0] == "listen" and len(child[1]) > 1:
+            is_default = "default_server" in child[1][2:] or "default" in child[1][2:]
+            sockets.append((child[1][1], is_default))
+    return sockets
+
+
+def _canonical_top_level(nodes: List[Node]) -> tuple:
+    directives = [node for node in nodes if not _is_block(node)]
+    servers = []
+    unordered_blocks = []
+    ordered_blocks = []
+    for node in nodes:
+        if not _is_block(node):
+            continue
+        if _is_block(node, "server"):
+            servers.append(("block", node[1], _canonical_location_children(node[2])))
+        elif node[1] and node[1][0] in _UNORDERED_BLOCKS:
+            unordered_blocks.append(node)
+        else:
+            ordered_blocks.append(node)
+
+    # nginx uses the first server of a listen socket as default unless another one is marked default_server,
+    # so the default of every socket must be part of the canonical form when server order is ignored.
+    default_servers = {}
+    for server in servers:
+        for socket, is_default in _listen_sockets(server):
+            if is_default or socket not in default_servers:
+                if is_default or not default_servers.get(socket, (None, False))[1]:
+                    default_servers[socket] = (repr(server), is_default)
+    defaults = tuple(sorted((socket, server_repr) for socket, (server_repr, _) in default_servers.items()))
+
+    return (
+        tuple(directives),
+        tuple(sorted(unordered_blocks, key=repr)),
+        tuple(ordered_blocks),
+        tuple(sorted(servers, key=repr)),
+        defaults,
+    )
+
+
+def canonicalize(config_str: str) -> tuple:
+    """
+    Return a hashable canonical form of a config. Raises ConfigSyntaxError if the config cannot be tokenized.
+    """
+    nodes, _ = _parse(_tokenize(config_str))
+    return _canonical_top_level(nodes)
+
+
+def configs_equivalent(old_config: str, new_config: str) -> bool:
+    if old_config == new_config:
+        return True
+    try:
+        return canonicalize(old_config) == canonicalize(new_config)
+    except ConfigSyntaxError:
+        return False
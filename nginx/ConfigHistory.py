@@ -0,0 +1,163 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import List, Union
+
+
+@dataclass
+class HistoryEntry:
+    hash: str
+    timestamp: float
+    event: Union[str, None] = None
+    reload_duration: Union[float, None] = None
+
+
+def config_hash(config_str: str) -> str:
+    return hashlib.sha256(config_str.encode("utf-8")).hexdigest()
+
+
+class ConfigHistory:
+    """
+    Bounded, content-addressed history of nginx configs that were applied successfully.
+    Each distinct config is stored once as <sha256>.conf and index.json lists the applied versions, oldest first.
+    When the history grows beyond max_entries, the oldest versions and their files are evicted.
+    The index is re-read under a file lock before every change, as the rollback command reads it from another process.
+    """
+
+    index_file_name = "index.json"
+    lock_file_name = "index.lock"
+    rollback_request_file_name = "rollback.request"
+
+    def __init__(self, history_dir: str, max_entries: int = 20):
+        self.history_dir = history_dir
+        self.max_entries = max(1, int(max_entries))
+        self.index_path = os.path.join(history_dir, ConfigHistory.index_file_name)
+        self.lock_path = os.path.join(history_dir, ConfigHistory.lock_file_name)
+        self.rollback_request_path = os.path.join(history_dir, ConfigHistory.rollback_request_file_name)
+        self._entries: List[HistoryEntry] = self._load_index()
+
+    def _load_index(self) -> List[HistoryEntry]:
+        if not os.path.exists(self.index_path):
+            return []
+        try:
+            with open(self.index_path) as file:
+                data = json.load(file)
+            entries = [HistoryEntry(**entry) for entry in data]
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[WARN] Ignoring unreadable config history index {self.index_path}: {e}", file=sys.stderr)
+            return []
+        return [entry for entry in entries if os.path.exists(self.config_path(entry.hash))]
+
+    @contextlib.contextmanager
+    def _locked(self):
+        if not os.path.exists(self.history_dir):
+            pathlib.Path(self.history_dir).mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump([asdict(entry) for entry in self._entries], file, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def config_path(self, hash: str) -> str:
+        return os.path.join(self.history_dir, hash + ".conf")
+
+    def refresh(self):
+        """
+        Re-read the index written by other processes.
+        """
+        with self._locked():
+            self._entries = self._load_index()
+
+    def entries(self) -> List[HistoryEntry]:
+        return list(self._entries)
+
+    def latest(self) -> Union[HistoryEntry, None]:
+        return self._entries[-1] if self._entries else None
+
+    def record(self, config_str: str, event: str = None, reload_duration: float = None) -> HistoryEntry:
+        """
+        Store a successfully applied config. Re-applying a known config moves it to the end of the history.
+        """
+        hash = config_hash(config_str)
+        file_path = self.config_path(hash)
+        with self._locked():
+            self._entries = self._load_index()
+            if not os.path.exists(file_path):
+                with open(file_path, "w") as file:
+                    file.write(config_str)
+            self._entries = [entry for entry in self._entries if entry.hash != hash]
+            entry = HistoryEntry(hash=hash, timestamp=time.time(), event=event, reload_duration=reload_duration)
+            self._entries.append(entry)
+            self._evict()
+            self._save_index()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            evicted = self._entries.pop(0)
+            try:
+                os.remove(self.config_path(evicted.hash))
+            except OSError:
+                pass
+
+    def find(self, ref: str) -> Union[HistoryEntry, None]:
+        """
+        Find a history entry by hash prefix, or by position counted back from the newest entry ("-1" is the
+        version applied before the current one).
+        """
+        ref = str(ref).strip()
+        if ref.startswith("-") and ref[1:].isdigit():
+            position = len(self._entries) - 1 - int(ref[1:])
+            return self._entries[position] if 0 <= position < len(self._entries) else None
+        matches = [entry for entry in self._entries if entry.hash.startswith(ref)]
+        return matches[-1] if len(matches) == 1 and ref else None
+
+    def previous(self, current_hash: str = None) -> Union[HistoryEntry, None]:
+        for entry in reversed(self._entries):
+            if entry.hash != current_hash:
+                return entry
+        return None
+
+    def read(self, entry: HistoryEntry) -> Union[str, None]:
+        """
+        :return: None when the version was evicted since the entry was looked up
+        """
+        try:
+            with open(self.config_path(entry.hash)) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def request_rollback(self, hash: str):
+        """
+        Ask the running nginx-proxy to restore a version. It is picked up by take_rollback_request() when the
+        controller receives SIGUSR2, so that its own view of the live config stays current.
+        """
+        with self._locked():
+            temp_path = f"{self.rollback_request_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(hash)
+            os.replace(temp_path, self.rollback_request_path)
+
+    def take_rollback_request(self) -> Union[str, None]:
+        with self._locked():
+            try:
+                with open(self.rollback_request_path) as file:
+                    ref = file.read().strip()
+                os.remove(self.rollback_request_path)
+            except FileNotFoundError:
+                return None
+        return ref or None
@@ -2,10 +2,12 @@ import os
 import pathlib
 import difflib
 
+from nginx.Nginx import DrainingWorkers, write_file
+
 
 class DummyNginx:
 
-    def __init__(self, config_file_path, challenge_dir="/etc/nginx/challenges/"):
+    def __init__(self, config_file_path, challenge_dir="/etc/nginx/challenges/", history_dir=None, history_size=20):
         self.challenge_dir = challenge_dir
         self.config_file_path = config_file_path
         if os.path.exists(config_file_path):
@@ -37,6 +39,10 @@ class DummyNginx:
     def validate_config(self, config_str):
         return True, None
 
+    def apply_rollback_request(self) -> bool:
+        print("DummyNginx: Rollback is not supported")
+        return False
+
     def verify_domain(self, domain):
         return False
 
@@ -50,12 +56,11 @@ class DummyNginx:
                 tofile="new_config",
             )
             print("DummyNginx: Config Diff:\n" + "".join(diff))
-        with open(self.config_file_path, "w") as file:
-            file.write(config_str)
+        write_file(self.config_file_path, config_str)
         self.current_config = config_str
         return True
 
-    def update_config(self, config_str, force=False, validate=True) -> bool:
+    def update_config(self, config_str, force=False, validate=True, event=None) -> bool:
         """
         Change the nginx configuration.
         :param config_str: string containing configuration to be written into config file
@@ -75,8 +80,7 @@ class DummyNginx:
         self.last_diff = "".join(diff)
         print("DummyNginx: Config Diff:\n", self.last_diff, sep="")
 
-        with open(self.config_file_path, "w") as file:
-            file.write(config_str)
+        write_file(self.config_file_path, config_str)
         self.current_config = config_str
         return True
 
@@ -100,11 +104,13 @@ class DummyNginx:
                 tofile="new_config",
             )
             print("DummyNginx: Config Diff:\n" + "".join(diff))
-        with open(self.config_file_path, "w") as file:
-            file.write(config_str)
+        write_file(self.config_file_path, config_str)
         self.current_config = config_str
         return True
 
+    def draining_workers(self) -> DrainingWorkers:
+        return DrainingWorkers()
+
     def wait(self):
         print("DummyNginx: Wait (no actual wait performed)")
         pass
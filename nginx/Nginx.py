@@ -3,10 +3,13 @@ import os
 import pathlib
 import random
 import re
+import shutil
 import string
 import subprocess
 import sys
+import tempfile
 import time
+from dataclasses import dataclass, field
 from os import path
 from typing import Union, Tuple
 import socket
@@ -14,27 +17,75 @@ import socket
 import requests
 
 from nginx import Url
-
-
-def write_file(file_path: str, content: str):
-    """Utility function to write content to a file."""
-    with open(file_path, "w") as file:
-        file.write(content)
-        file.flush()
-        os.fsync(file.fileno())  # Ensure data is written to disk
+from nginx.ConfigCanonicalizer import configs_equivalent
+from nginx.ConfigHistory import ConfigHistory, HistoryEntry, config_hash
+
+
+def _fsync_directory(dir_path: str):
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_file(file_path: str, content: str, mode: int = 0o644):
+    """
+    Utility function to atomically replace a file with content.
+    The content is written and fsynced to a sibling temp file which is then renamed over the target,
+    so a reader (or a concurrent nginx reload) sees either the old or the new file, never a partial one.
+    """
+    directory, name = os.path.split(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix="." + name + ".", suffix=".staged", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())  # Ensure data is written to disk
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_directory(directory)
 
 
 def _decode_subprocess_output(output: bytes) -> str:
     return output.decode("utf-8", errors="replace")
 
 
+@dataclass
+class DrainingWorkers:
+    """Snapshot of old nginx worker processes that are still finishing requests after a reload."""
+
+    count: int = 0
+    rss_bytes: int = 0
+    generations: int = 0
+    pids: list = field(default_factory=list)
+
+
+def _read_proc_file(file_path: str, mode="r"):
+    try:
+        with open(file_path, mode) as file:
+            return file.read()
+    except OSError:
+        return None
+
+
 class Nginx:
+    draining_worker_title = "nginx: worker process is shutting down"
     command_config_test = ["nginx", "-t"]
     command_stop = ["nginx", "-s", "quit"]
     command_reload = ["nginx", "-s", "reload"]
     command_start = ["nginx"]
 
-    def __init__(self, config_file_path, challenge_dir="/etc/nginx/challenges/"):
+    def __init__(self, config_file_path, challenge_dir="/etc/nginx/challenges/", history_dir=None, history_size=20):
         self.challenge_dir = challenge_dir
         self.config_file_path = config_file_path
         if path.exists(config_file_path):
@@ -42,7 +93,9 @@ class Nginx:
                 self.last_working_config = file.read()
         else:
             self.last_working_config = ""
-        self.config_stack = [self.last_working_config]
+        self.history = ConfigHistory(
+            history_dir if history_dir is not None else config_file_path + ".history", max_entries=history_size
+        )
         if not os.path.exists(challenge_dir):
             pathlib.Path(self.challenge_dir).mkdir(parents=True)
 
@@ -74,16 +127,11 @@ class Nginx:
     def validate_config(self, config_str) -> tuple[bool, Union[str, None]]:
         """
         Validate a candidate managed config without reloading nginx or changing last_working_config.
-        The managed config file is restored to its previous contents after the test.
+        The candidate is swapped in atomically and the retained previous file is swapped back after the test.
         """
-        had_existing_config = path.exists(self.config_file_path)
-        previous_config = ""
-        if had_existing_config:
-            with open(self.config_file_path) as file:
-                previous_config = file.read()
-
+        previous_config = self.last_working_config
+        had_existing_config = self._install_config(config_str)
         try:
-            write_file(self.config_file_path, config_str)
             test_result = subprocess.run(Nginx.command_config_test, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             if test_result.returncode == 0:
                 return True, None
@@ -99,29 +147,68 @@ class Nginx:
                 print(error, file=sys.stderr)
             return False, error
         finally:
-            if had_existing_config:
-                write_file(self.config_file_path, previous_config)
-            elif path.exists(self.config_file_path):
-                os.remove(self.config_file_path)
-
-    def push_config(self, config_str):
+            self._restore_previous_config(had_existing_config)
 
+    def push_config(self, config_str, event=None):
         if config_str == self.last_working_config:
-            self.config_stack.append(config_str)
             return self.reload()
 
-        write_file(self.config_file_path, config_str)
+        had_existing_config = self._install_config(config_str)
+        start_time = time.monotonic()
         if not self.reload():
-            write_file(self.config_file_path, self.config_stack[-1])
+            self._restore_previous_config(had_existing_config)
             self.reload()
             return False
         else:
-            self.config_stack.append(config_str)
+            self.last_working_config = config_str
+            self.history.record(config_str, event=event, reload_duration=time.monotonic() - start_time)
             return True
 
     def pop_config(self):
-        write_file(self.config_file_path, self.config_stack.pop())
-        return self.reload()
+        return self.rollback()
+
+    def rollback(self, ref: str = None) -> bool:
+        """
+        Restore a config from the on-disk history without rendering or validating it again.
+        The version was validated and reloaded successfully when it was first applied.
+        :param ref: hash prefix or "-N" position in history. Defaults to the version before the current one.
+        :return: true if nginx reloaded with the restored config
+        """
+        self.history.refresh()
+        if ref is None:
+            entry = self.history.previous(config_hash(self.last_working_config))
+        else:
+            entry = self.history.find(ref)
+        config_str = self.history.read(entry) if entry is not None else None
+        if config_str is None:
+            print(f"ERROR: No config history entry found for {ref if ref else 'previous version'}", file=sys.stderr)
+            return False
+
+        had_existing_config = self._install_config(config_str)
+        start_time = time.monotonic()
+        if not self.reload():
+            self._restore_previous_config(had_existing_config)
+            self.reload()
+            return False
+        self.last_working_config = config_str
+        self.history.record(
+            config_str, event="rollback to " + entry.hash[:12], reload_duration=time.monotonic() - start_time
+        )
+        print("Nginx rolled back to config " + entry.hash[:12])
+        return True
+
+    def apply_rollback_request(self) -> bool:
+        """
+        Restore the version the rollback command asked for, so last_working_config and the history stay in step.
+        """
+        ref = self.history.take_rollback_request()
+        if ref is None:
+            print("[WARN] Rollback requested but no config version was given", file=sys.stderr)
+            return False
+        return self.rollback(ref)
+
+    def history_entries(self) -> list[HistoryEntry]:
+        return self.history.entries()
 
     def force_start(self, config_str) -> bool:
         """
@@ -130,14 +217,49 @@ class Nginx:
         :param config_str:
         :return:
         """
-        write_file(self.config_file_path, config_str)
+        had_existing_config = self._install_config(config_str)
+        start_time = time.monotonic()
         if not self.start():
-            write_file(self.config_file_path, self.last_working_config)
+            self._restore_previous_config(had_existing_config)
             return False
         else:
             self.last_working_config = config_str
+            self.history.record(config_str, event="start", reload_duration=time.monotonic() - start_time)
             return True
 
+    @property
+    def previous_config_path(self) -> str:
+        directory, name = os.path.split(self.config_file_path)
+        return os.path.join(directory, "." + name + ".previous")
+
+    def _install_config(self, config_str) -> bool:
+        """
+        Atomically make config_str the live config file while retaining the current file as the rollback target.
+        The retained file is a hard link to the replaced inode, so keeping it costs no extra write.
+        :return: true if there was a live config file to retain
+        """
+        previous_path = self.previous_config_path
+        if path.exists(previous_path):
+            os.remove(previous_path)
+        had_existing_config = path.exists(self.config_file_path)
+        if had_existing_config:
+            try:
+                os.link(self.config_file_path, previous_path)
+            except OSError:
+                shutil.copy2(self.config_file_path, previous_path)
+        write_file(self.config_file_path, config_str)
+        return had_existing_config
+
+    def _restore_previous_config(self, had_existing_config: bool):
+        """
+        Roll the live config file back to the one retained by _install_config with a single rename.
+        """
+        if had_existing_config:
+            os.replace(self.previous_config_path, self.config_file_path)
+        elif path.exists(self.config_file_path):
+            os.remove(self.config_file_path)
+        _fsync_directory(os.path.dirname(os.path.abspath(self.config_file_path)))
+
     def _parse_error_line(self, error_msg):
         if not error_msg:
             return None
@@ -231,12 +353,14 @@ class Nginx:
             # Fallback for special diff lines such as "\\ No newline at end of file"
             print(line, file=sys.stderr)
 
-    def update_config(self, config_str, force=False, validate=True) -> bool:
+    def update_config(self, config_str, force=False, validate=True, event=None) -> bool:
         """
         Change the nginx configuration.
         :param config_str: string containing configuration to be written into config file
-        :param force: Force reload even if the configuration is same as previous
+        :param force: Force reload even if the configuration is same as previous, or differs only in comments,
+                      whitespace or order of order-independent blocks
         :param validate: Run nginx config test before reloading
+        :param event: description of what triggered the change, kept in the config history
         :return: true if the new config was used false if error or if the new configuration is same as previous
         """
 
@@ -244,14 +368,21 @@ class Nginx:
             print("Configuration not changed, skipping nginx reload")
             return False
 
+        if not force and configs_equivalent(self.last_working_config, config_str):
+            # only comments, whitespace or block order changed: nginx would end up in the same state after a reload
+            print("Configuration semantically unchanged, skipping nginx reload")
+            return False
+
         if validate:
             valid, data = self.validate_config(config_str)
             if not valid:
                 print("ERROR: New change made nginx config invalid. Thus it's rolled back", file=sys.stderr)
                 return False
 
-        write_file(self.config_file_path, config_str)
+        had_existing_config = self._install_config(config_str)
+        start_time = time.monotonic()
         result, data = self.reload(return_error=True)
+        reload_duration = time.monotonic() - start_time
 
         if not result:
             printed_context = False
@@ -266,11 +397,12 @@ class Nginx:
             if data is not None:
                 print(data, file=sys.stderr)
             print("ERROR: New change made nginx to fail. Thus it's rolled back", file=sys.stderr)
-            write_file(self.config_file_path, self.last_working_config)
+            self._restore_previous_config(had_existing_config)
             return False
         else:
             print("Nginx Reloaded Successfully")
             self.last_working_config = config_str
+            self.history.record(config_str, event=event, reload_duration=reload_duration)
             return True
 
     def reload(self, return_error=False) -> Union[bool, Tuple[bool, Union[str, None]]]:
@@ -294,6 +426,40 @@ class Nginx:
         else:
             return result
 
+    def draining_workers(self, proc_dir="/proc") -> DrainingWorkers:
+        """
+        Count nginx workers left over from previous reloads that are still draining connections.
+        Workers started at the same time belong to the same configuration generation.
+        :return: DrainingWorkers snapshot with process count, resident memory and generation count
+        """
+        result = DrainingWorkers()
+        start_times = set()
+        try:
+            entries = os.listdir(proc_dir)
+        except OSError:
+            return result
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            cmdline = _read_proc_file(os.path.join(proc_dir, entry, "cmdline"), "rb")
+            if not cmdline:
+                continue
+            title = cmdline.replace(b"\0", b" ").decode("utf-8", errors="replace").strip()
+            if not title.startswith(Nginx.draining_worker_title):
+                continue
+            result.count += 1
+            result.pids.append(int(entry))
+            status = _read_proc_file(os.path.join(proc_dir, entry, "status")) or ""
+            rss_match = re.search(r"^VmRSS:\s+(\d+)\s+kB", status, re.MULTILINE)
+            if rss_match:
+                result.rss_bytes += int(rss_match.group(1)) * 1024
+            stat = _read_proc_file(os.path.join(proc_dir, entry, "stat")) or ""
+            # the process name in stat may contain spaces, fields are counted after the closing parenthesis
+            stat_fields = stat.rsplit(")", 1)[-1].split()
+            start_times.add(stat_fields[19] if len(stat_fields) > 19 else entry)
+        result.generations = len(start_times)
+        return result
+
     def verify_domain(self, _domain: list | str):
         domain = [_domain] if type(_domain) is str else _domain
         ## when not included, one invalid domain in a list of 100 will make all domains to be unverified due to nginx failing to start.
@@ -18,6 +18,13 @@ class BackendTarget:
         ports: dict = None,
         backend_type: str = "container",
         backup: bool = False,
+        weight: str = None,
+        max_conns: str = None,
+        cpu_limit: float = None,
+        max_fails: str = None,
+        fail_timeout: str = None,
+        down: bool = False,
+        tasks: list = None,
     ):
         self.name = name
         self.id = id
@@ -32,6 +39,14 @@ class BackendTarget:
         self.ports = ports if ports else {}
         self.type = backend_type
         self.backup = backup
+        self.weight = weight
+        self.max_conns = max_conns
+        self.cpu_limit: Union[float, None] = cpu_limit  # CPUs the backend may use, None when unlimited
+        # passive health of the upstream server, None uses the proxy wide default
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.down = down  # failing its active health check
+        self.tasks = tasks  # running SwarmTasks of a service, routed to directly instead of the VIP
 
     @staticmethod
     def from_container(container: DockerContainer):
@@ -40,6 +55,7 @@ class BackendTarget:
         container_name = container.attrs["Name"].replace("/", "")
         network_settings = container.attrs["NetworkSettings"]["Networks"]
         ports = container.attrs["NetworkSettings"]["Ports"]
+        host_config = container.attrs.get("HostConfig") or {}
 
         # Determine strict defaults, these should be refined during processing users of this object
         return BackendTarget(
@@ -50,6 +66,9 @@ class BackendTarget:
             network_settings=network_settings,
             ports=ports,
             backend_type="container",
+            cpu_limit=BackendTarget.get_cpu_limit(
+                host_config.get("NanoCpus"), host_config.get("CpuQuota"), host_config.get("CpuPeriod")
+            ),
         )
 
     @staticmethod
@@ -64,6 +83,7 @@ class BackendTarget:
         env = {x.split("=", 1)[0]: x.split("=", 1)[1] for x in env_list if "=" in x}
 
         labels = spec.get("Labels", {})
+        limits = (task_template.get("Resources") or {}).get("Limits") or {}
         name = service.attrs.get("Spec", {}).get("Name")
         endpoint = service.attrs.get("Endpoint", {})
         virtual_ips = endpoint.get("VirtualIPs", [])
@@ -74,6 +94,11 @@ class BackendTarget:
             addr = vip.get("Addr", "").split("/")[0]  # Strip CIDR
             if net_id:
                 network_settings[net_id] = {"NetworkID": net_id, "IPAddress": addr}
+        # dnsrr services have no VIP, their networks are only reachable through the task addresses
+        for network in task_template.get("Networks") or []:
+            net_id = network.get("Target")
+            if net_id and net_id not in network_settings:
+                network_settings[net_id] = {"NetworkID": net_id, "IPAddress": None}
 
         # Ports
         # endpoint['Ports'] -> [{'Protocol': 'tcp', 'TargetPort': 80, 'PublishedPort': 8080, ...}]
@@ -94,11 +119,18 @@ class BackendTarget:
             network_settings=network_settings,
             ports=ports,
             backend_type="service",
+            cpu_limit=BackendTarget.get_cpu_limit(limits.get("NanoCPUs")),
         )
 
     def add_network(self, network_id: str):
         self.networks.add(network_id)
 
+    def sort_key(self):
+        """
+        Ordering used when rendering, so that the same set of backends always renders in the same order.
+        """
+        return str(self.address), str(self.port), str(self.path or ""), self.type, str(self.id)
+
     def __hash__(self):
         return hash(self.id)
 
@@ -112,6 +144,30 @@ class BackendTarget:
     def __repr__(self):
         return str({"scheme": self.scheme, "address": self.address, "port": self.port, "path": self.path})
 
+    @staticmethod
+    def get_setting(backend: "BackendTarget", key: str) -> Union[str, None]:
+        """
+        Per backend nginx setting from the env, or from a label of the same name.
+        """
+        if key in backend.env:
+            value = backend.env[key]
+        elif key in backend.labels:
+            value = backend.labels[key]
+        else:
+            return None
+        return " ".join(str(value).split())
+
+    @staticmethod
+    def get_cpu_limit(nano_cpus=None, cpu_quota=None, cpu_period=None) -> Union[float, None]:
+        """
+        CPUs a container may use from its inspect data: NanoCpus (--cpus), or CpuQuota/CpuPeriod.
+        """
+        if nano_cpus:
+            return nano_cpus / 1e9
+        if cpu_quota and cpu_quota > 0:
+            return cpu_quota / (cpu_period or 100000)
+        return None
+
     @staticmethod
     def get_container_env_map(container: DockerContainer):
         container_env = container.attrs["Config"]["Env"]
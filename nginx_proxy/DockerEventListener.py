@@ -4,12 +4,14 @@ import re
 import subprocess
 import sys
 import threading
+import time
 import traceback
 from dataclasses import dataclass
 from typing import Any
 
 import docker
 
+from nginx_proxy import readiness_probe
 from nginx_proxy.BackendTarget import BackendTarget
 from nginx_proxy.WebServer import WebServer
 
@@ -17,6 +19,11 @@ from nginx_proxy.WebServer import WebServer
 SERVICE_EVENT_DELAY_SECONDS = 5
 SERVICE_EVENT_RETRY_DELAY_SECONDS = 20
 SERVICE_EVENT_MAX_ATTEMPTS = 2
+TASK_EVENT_DELAY_SECONDS = 1
+START_PROBE_INITIAL_DELAY_SECONDS = 0.1
+START_PROBE_MAX_DELAY_SECONDS = 2
+# signals sent with `docker kill -s` to reload or reopen logs rather than stop
+NON_STOP_SIGNALS = {"1", "10", "12", "28", "SIGHUP", "SIGUSR1", "SIGUSR2", "SIGWINCH", "HUP", "USR1", "USR2", "WINCH"}
 
 
 @dataclass(frozen=True)
@@ -49,6 +56,18 @@ class ActivateBackend:
     generation: int
 
 
+@dataclass(frozen=True)
+class AbandonBackend:
+    container_id: str
+    generation: int
+
+
+@dataclass(frozen=True)
+class FinishDrain:
+    container_id: str
+    generation: int
+
+
 @dataclass(frozen=True)
 class ProcessServiceUpsert:
     service_id: str
@@ -92,9 +111,14 @@ class DockerEventListener:
         self._dispatcher_thread_id: int | None = None
         self._pending_backend_timers: dict[str, threading.Timer] = {}
         self._pending_backend_generations: dict[str, int] = {}
+        # start probes reschedule their timers from the timer threads
+        self._pending_backend_lock = threading.RLock()
         self._pending_service_timers: dict[str, threading.Timer] = {}
         self._pending_service_generations: dict[str, int] = {}
         self._waiting_for_healthy: set[str] = set()
+        self._pending_drain_timers: dict[str, threading.Timer] = {}
+        self._pending_drain_generations: dict[str, int] = {}
+        self._task_refresh_timer: threading.Timer | None = None
         self._started_containers: set[str] = self._load_started_container_ids()
         self.web_server.docker_event_listener = self
 
@@ -171,6 +195,10 @@ class DockerEventListener:
             self._process_network_event(command.action, command.event)
         elif isinstance(command, ActivateBackend):
             self._process_backend_activation(command.container_id, command.generation)
+        elif isinstance(command, AbandonBackend):
+            self._process_backend_abandon(command.container_id, command.generation)
+        elif isinstance(command, FinishDrain):
+            self._process_drain_finish(command.container_id, command.generation)
         elif isinstance(command, ProcessServiceUpsert):
             self._process_scheduled_service_upsert(
                 command.service_id, command.action, command.attempt, command.generation
@@ -179,7 +207,7 @@ class DockerEventListener:
             self.web_server.remove_backend(command.backend_id)
         elif isinstance(command, RescanAndReload):
             self.web_server.rescan_all_container(bypass_start_grace=command.bypass_start_grace)
-            self.web_server._do_reload(command.force)
+            self.web_server._do_reload(command.force, event="rescan")
         elif isinstance(command, Reload):
             self.web_server._do_reload(command.force)
         elif callable(command):
@@ -189,6 +217,7 @@ class DockerEventListener:
 
     def run(self):
         self.start_dispatcher()
+        self._schedule_task_refresh()
         try:
             swarm_mode = self.web_server.config.get("docker_swarm", "ignore")
             if self.client == self.swarm_client:
@@ -226,7 +255,7 @@ class DockerEventListener:
             events.extend(["connect", "disconnect"])
             if swarm_mode != "strict":
                 types.append("container")
-                events.extend(["start", "stop", "die", "destroy"])
+                events.extend(["start", "kill", "stop", "die", "destroy"])
 
         if not types:
             print(f"No relevant event types to listen for client {client_url}")
@@ -285,13 +314,42 @@ class DockerEventListener:
             timer.cancel()
         self._pending_service_generations.pop(service_id, None)
 
+    def _schedule_task_refresh(self):
+        """
+        Poll the running tasks of services routed to directly, task state changes don't produce Docker events.
+        """
+        interval = float(self.web_server.config.get("swarm_task_refresh_seconds", 0) or 0)
+        if self.web_server.swarm_topology is None or interval <= 0 or self._dispatcher_stop.is_set():
+            return
+
+        def refresh():
+            self.enqueue(self._refresh_tasks)
+
+        self._task_refresh_timer = threading.Timer(interval, refresh)
+        self._task_refresh_timer.daemon = True
+        self._task_refresh_timer.start()
+
+    def _refresh_tasks(self):
+        try:
+            self.web_server.refresh_swarm_tasks()
+        finally:
+            self._schedule_task_refresh()
+
     def _cancel_all_timers(self):
-        for timer in self._pending_backend_timers.values():
-            timer.cancel()
+        with self._pending_backend_lock:
+            for timer in self._pending_backend_timers.values():
+                timer.cancel()
+            self._pending_backend_timers.clear()
+            self._pending_backend_generations.clear()
         for timer in self._pending_service_timers.values():
             timer.cancel()
-        self._pending_backend_timers.clear()
-        self._pending_backend_generations.clear()
+        if self._task_refresh_timer is not None:
+            self._task_refresh_timer.cancel()
+            self._task_refresh_timer = None
+        for timer in self._pending_drain_timers.values():
+            timer.cancel()
+        self._pending_drain_timers.clear()
+        self._pending_drain_generations.clear()
         self._pending_service_timers.clear()
         self._pending_service_generations.clear()
 
@@ -306,6 +364,7 @@ class DockerEventListener:
         try:
             service = self.swarm_client.services.get(service_id)
             backend = BackendTarget.from_service(service)
+            self.web_server.attach_swarm_tasks(backend, service)
             if not self._service_backend_has_reachable_vip(backend) and self._retry_service_event(
                 service_id, action, attempt, "has no reachable VIP"
             ):
@@ -339,7 +398,8 @@ class DockerEventListener:
         for detail in backend.network_settings.values():
             if detail.get("NetworkID") in known_networks and detail.get("IPAddress"):
                 return True
-        return False
+        # routed to the tasks directly, also without a VIP
+        return any(network in known_networks for task in backend.tasks or [] for network in task.addresses)
 
     def _process_container_event(self, action, event):
         container_id = event.get("Actor", {}).get("ID") or event.get("id")
@@ -348,16 +408,30 @@ class DockerEventListener:
         swarm_mode = self.web_server.config.get("docker_swarm", "ignore")
         if swarm_mode not in ("ignore", "prefer-local") and "com.docker.swarm.service.id" in attributes:
             # print(f"Skipping event {action} for service task container {container_id}")
+            if self.web_server.swarm_topology is not None and action in ("start", "die"):
+                # a task of a service routed to directly started or ended on this node
+                self._schedule_service_processing(
+                    attributes["com.docker.swarm.service.id"],
+                    "update",
+                    TASK_EVENT_DELAY_SECONDS,
+                    attempt=SERVICE_EVENT_MAX_ATTEMPTS,
+                )
             return
 
         if action == "start":
             self._started_containers.add(container_id)
+            self._cancel_backend_drain(container_id)
             self._handle_container_start(container_id, attributes)
+        elif action == "kill":
+            self._handle_container_kill(container_id, attributes)
         elif action == "stop" or action == "die" or action == "destroy":
             self._started_containers.discard(container_id)
             pending_startup = self._clear_pending_startup_state(container_id)
             if pending_startup:
                 self._log_container_event("Container crashed   ", container_id, attributes=attributes)
+            if container_id in self._pending_drain_timers:
+                # removed once the drain window has passed
+                return
             self.web_server.remove_backend(container_id)
 
     def _process_container_health_event(self, action, event):
@@ -375,6 +449,56 @@ class DockerEventListener:
         elif health_status == "unhealthy":
             self.web_server.remove_backend(container_id)
 
+    def _handle_container_kill(self, container_id: str, attributes):
+        """
+        `kill` is the first event of `docker stop`, ahead of `die`. The backend is marked down in its upstreams right
+        away and removed after BACKEND_DRAIN_SECONDS, so locations it serves alone keep it until a replacement is up.
+        """
+        drain_seconds = float(self.web_server.config.get("backend_drain_seconds", 0) or 0)
+        if drain_seconds <= 0 or str(attributes.get("signal", "")).upper() in NON_STOP_SIGNALS:
+            return
+        if container_id in self._pending_drain_timers or not self.web_server.drain_backend(container_id):
+            return
+        self._log_container_event("Container draining  ", container_id, attributes=attributes)
+        generation = self._pending_drain_generations.get(container_id, 0) + 1
+        self._pending_drain_generations[container_id] = generation
+
+        def finish():
+            self.enqueue(FinishDrain(container_id, generation))
+
+        timer = threading.Timer(drain_seconds, finish)
+        timer.daemon = True
+        self._pending_drain_timers[container_id] = timer
+        timer.start()
+
+    def _cancel_backend_drain(self, container_id: str) -> bool:
+        timer = self._pending_drain_timers.pop(container_id, None)
+        if timer is None:
+            return False
+        timer.cancel()
+        self._pending_drain_generations.pop(container_id, None)
+        self.web_server.undrain_backend(container_id)
+        return True
+
+    def _process_drain_finish(self, container_id: str, generation: int):
+        if self._pending_drain_generations.get(container_id) != generation:
+            return
+        self._pending_drain_timers.pop(container_id, None)
+        self._pending_drain_generations.pop(container_id, None)
+        try:
+            container = self.client.containers.get(container_id)
+            if self._container_is_running(container):
+                # the signal didn't stop it
+                self.web_server.undrain_backend(container_id)
+                return
+        except docker.errors.NotFound:
+            pass
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            print(f"Error inspecting drained container {container_id}: {e}", file=sys.stderr)
+        self.web_server.remove_backend(container_id)
+
     def _handle_container_start(self, container_id: str, attributes=None):
         try:
             container = self.client.containers.get(container_id)
@@ -388,6 +512,14 @@ class DockerEventListener:
                     )
                 return
 
+            if self.web_server.config.get("backend_start_probe"):
+                targets = readiness_probe.probe_targets(
+                    BackendTarget.from_container(container), self.web_server.networks.keys()
+                )
+                if targets:
+                    self._schedule_backend_probe(container_id, targets)
+                    return
+
             grace_seconds = float(self.web_server.config.get("backend_start_grace_seconds", 0) or 0)
             if grace_seconds > 0:
                 self._schedule_backend_activation(container_id, grace_seconds)
@@ -407,16 +539,58 @@ class DockerEventListener:
         def activate():
             self.enqueue(ActivateBackend(container_id, generation))
 
-        timer = threading.Timer(grace_seconds, activate)
+        with self._pending_backend_lock:
+            self._start_backend_timer(container_id, grace_seconds, activate)
+
+    def _schedule_backend_probe(self, container_id: str, targets):
+        """
+        Activate the container once all its targets accept connections, probing with exponential backoff until
+        BACKEND_START_PROBE_TIMEOUT has passed.
+        """
+        self._clear_pending_startup_state(container_id)
+        timeout = float(self.web_server.config.get("backend_start_probe_timeout", 60) or 0)
+        deadline = time.monotonic() + timeout
+        with self._pending_backend_lock:
+            generation = self._pending_backend_generations.get(container_id, 0) + 1
+            self._pending_backend_generations[container_id] = generation
+
+        def probe(delay):
+            ready = all(readiness_probe.is_ready(target) for target in targets)
+            remaining = deadline - time.monotonic()
+            with self._pending_backend_lock:
+                if self._pending_backend_generations.get(container_id) != generation:
+                    return
+                if ready:
+                    self.enqueue(ActivateBackend(container_id, generation))
+                elif remaining <= 0:
+                    self.enqueue(AbandonBackend(container_id, generation))
+                else:
+                    self._start_backend_timer(
+                        container_id, min(delay, remaining), probe, min(delay * 2, START_PROBE_MAX_DELAY_SECONDS)
+                    )
+
+        with self._pending_backend_lock:
+            self._start_backend_timer(container_id, 0, probe, START_PROBE_INITIAL_DELAY_SECONDS)
+
+    def probe_backend_start(self, container_id: str, targets):
+        """
+        Probe a container found by a rescan in the background, unless its start is already pending.
+        """
+        if not self._is_pending_startup(container_id):
+            self._schedule_backend_probe(container_id, targets)
+
+    def _start_backend_timer(self, container_id: str, delay: float, function, *args):
+        timer = threading.Timer(delay, function, args=args)
         timer.daemon = True
         self._pending_backend_timers[container_id] = timer
         timer.start()
 
     def _cancel_pending_backend_activation(self, container_id: str):
-        timer = self._pending_backend_timers.pop(container_id, None)
-        if timer is not None:
-            timer.cancel()
-        self._pending_backend_generations.pop(container_id, None)
+        with self._pending_backend_lock:
+            timer = self._pending_backend_timers.pop(container_id, None)
+            if timer is not None:
+                timer.cancel()
+            self._pending_backend_generations.pop(container_id, None)
 
     def _clear_pending_startup_state(self, container_id: str) -> bool:
         had_pending_timer = container_id in self._pending_backend_timers
@@ -442,10 +616,18 @@ class DockerEventListener:
     def _process_backend_activation(self, container_id: str, generation: int):
         if self._pending_backend_generations.get(container_id) != generation:
             return
-        self._pending_backend_timers.pop(container_id, None)
-        self._pending_backend_generations.pop(container_id, None)
+        with self._pending_backend_lock:
+            self._pending_backend_timers.pop(container_id, None)
+            self._pending_backend_generations.pop(container_id, None)
         self._activate_backend_if_running(container_id)
 
+    def _process_backend_abandon(self, container_id: str, generation: int):
+        if self._pending_backend_generations.get(container_id) != generation:
+            return
+        self._cancel_pending_backend_activation(container_id)
+        timeout = self.web_server.config.get("backend_start_probe_timeout", 60)
+        self._log_container_event("Container not ready ", container_id, detail=f"after {timeout}s, not registered")
+
     @staticmethod
     def _container_has_healthcheck(container) -> bool:
         healthcheck = container.attrs.get("Config", {}).get("Healthcheck")
@@ -5,8 +5,14 @@ from .BackendTarget import BackendTarget
 
 
 _BODY_SIZE_DIRECTIVES = {"client_max_body_size"}
-_PROXY_TIMEOUT_DIRECTIVES = {"proxy_connect_timeout", "proxy_send_timeout", "proxy_read_timeout"}
-_SCALAR_DIRECTIVES = _BODY_SIZE_DIRECTIVES | _PROXY_TIMEOUT_DIRECTIVES
+_PROXY_TIMEOUT_DIRECTIVES = {
+    "proxy_connect_timeout",
+    "proxy_send_timeout",
+    "proxy_read_timeout",
+    "proxy_next_upstream_timeout",
+}
+_RETRY_DIRECTIVES = {"proxy_next_upstream", "proxy_next_upstream_tries"}
+_SCALAR_DIRECTIVES = _BODY_SIZE_DIRECTIVES | _PROXY_TIMEOUT_DIRECTIVES | _RETRY_DIRECTIVES
 
 
 def _parse_injected_directive(raw_directive: str):
@@ -4,9 +4,11 @@ Handles nginx.conf configuration from environment variables.
 Environment variables supported (all prefixed with NGINX_):
 - NGINX_WORKER_PROCESSES: Number of worker processes (default: "auto")
 - NGINX_WORKER_CONNECTIONS: Number of worker connections (default: 65535)
+- NGINX_WORKER_SHUTDOWN_TIMEOUT: Upper bound for old workers to finish requests after reload (default: unset)
 """
 
 import os
+import re
 from jinja2 import Template
 
 
@@ -14,6 +16,7 @@ from jinja2 import Template
 NGINX_DEFAULTS = {
     "worker_processes": "auto",
     "worker_connections": 65535,
+    "worker_shutdown_timeout": None,
 }
 
 
@@ -25,6 +28,7 @@ def get_nginx_config():
     Supported variables:
     - NGINX_WORKER_PROCESSES: Number of worker processes (default: "auto")
     - NGINX_WORKER_CONNECTIONS: Number of worker connections (default: 65535)
+    - NGINX_WORKER_SHUTDOWN_TIMEOUT: Time after which draining workers are closed (default: unset)
 
     Returns:
         dict: Configuration dictionary with nginx settings
@@ -46,6 +50,16 @@ def get_nginx_config():
                 f"[WARNING] Invalid NGINX_WORKER_CONNECTIONS value: {worker_connections}, using default: {NGINX_DEFAULTS['worker_connections']}"
             )
 
+    # NGINX_WORKER_SHUTDOWN_TIMEOUT - nginx time value such as 30s, 10m or 1h
+    worker_shutdown_timeout = os.getenv("NGINX_WORKER_SHUTDOWN_TIMEOUT", "").strip()
+    if worker_shutdown_timeout:
+        if re.fullmatch(r"\d+(ms|s|m|h|d)?", worker_shutdown_timeout):
+            config["worker_shutdown_timeout"] = worker_shutdown_timeout
+        else:
+            print(
+                f"[WARNING] Invalid NGINX_WORKER_SHUTDOWN_TIMEOUT value: {worker_shutdown_timeout}, leaving it unset"
+            )
+
     return config
 
 
@@ -15,6 +15,7 @@ from docker import DockerClient
 from nginx_proxy.WebServer import WebServer
 from nginx_proxy.DockerEventListener import DockerEventListener
 from nginx_proxy.NginxConfig import render_nginx_conf
+from nginx_proxy.session_tickets import session_cache_size
 
 
 class CertApiConfig(TypedDict):
@@ -43,10 +44,51 @@ class NginxProxyAppConfig(TypedDict):
     enable_ipv6: bool
     docker_swarm: str
     swarm_docker_host: str | None
+    docker_swarm_routing: str
+    swarm_zone_label: str
+    swarm_task_refresh_seconds: float
     backend_start_grace_seconds: float
+    backend_start_probe: bool
+    backend_start_probe_timeout: float
+    backend_drain_seconds: float
     static_site_root: str
     default_ssl_domains: list[str]
     nginx_resolvers: list[str]
+    max_draining_workers: int
+    max_draining_memory: int
+    config_history_size: int
+    selfsigned_shared_placeholder: bool
+    cert_issuance_concurrency: int
+    cert_max_orders_per_hour: int
+    cert_max_san_per_order: int
+    cert_reload_batch_seconds: float
+    ssl_session_tickets: str
+    ssl_session_ticket_dir: str
+    ssl_session_ticket_rotate_hours: float
+    ssl_session_ticket_keep: int
+    ssl_session_cache_size: str
+    ssl_ocsp_prefetch: bool
+    ssl_dual_certificates: bool
+    ssl_certificate_loading: str
+    ssl_certificate_cache: int
+    upstream_keepalive: int
+    upstream_keepalive_requests: int
+    upstream_keepalive_timeout: str
+    upstream_cpu_weights: bool
+    upstream_max_fails: int
+    upstream_fail_timeout: str
+    proxy_next_upstream: str | None
+    proxy_next_upstream_tries: int | None
+    proxy_next_upstream_timeout: str | None
+    health_check: bool
+    health_check_interval: float
+    health_check_timeout: float
+    health_check_rise: int
+    health_check_fall: int
+    health_check_status: str
+    health_check_path: str
+    health_check_metrics_file: str
+    health_check_reload_interval: float
 
 
 def _strip_end(s: str, char="/") -> str:
@@ -57,6 +99,16 @@ def _split_resolver_override(value: str) -> list[str]:
     return [resolver for resolver in re.split(r"[\s,]+", value.strip()) if resolver]
 
 
+def _parse_size_bytes(value: str) -> int:
+    """Parse an nginx style size such as 512m or 2g into bytes. Empty or 0 means unlimited."""
+    match = re.fullmatch(r"(\d+)([kKmMgG]?)", value.strip())
+    if match is None:
+        print(f"[WARN] Invalid size value: {value}, treating it as unlimited", file=sys.stderr)
+        return 0
+    multiplier = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}[match.group(2).lower()]
+    return int(match.group(1)) * multiplier
+
+
 def _detect_nginx_resolvers(resolv_conf_path: str = "/etc/resolv.conf") -> list[str]:
     override = os.getenv("NGINX_RESOLVER", "").strip()
     if override:
@@ -145,10 +197,53 @@ class NginxProxyApp:
             enable_ipv6=os.getenv("ENABLE_IPV6", "false").strip().lower() == "true",
             docker_swarm=os.getenv("DOCKER_SWARM", "ignore").strip().lower(),
             swarm_docker_host=os.getenv("SWARM_DOCKER_HOST", "").strip() or None,
+            docker_swarm_routing=os.getenv("DOCKER_SWARM_ROUTING", "vip").strip().lower() or "vip",
+            swarm_zone_label=os.getenv("SWARM_ZONE_LABEL", "zone").strip() or "zone",
+            swarm_task_refresh_seconds=float(os.getenv("SWARM_TASK_REFRESH_SECONDS", "10").strip() or 0),
             backend_start_grace_seconds=float(os.getenv("BACKEND_START_GRACE_SECONDS", "10").strip()),
+            backend_start_probe=os.getenv("BACKEND_START_PROBE", "false").strip().lower() == "true",
+            backend_start_probe_timeout=float(os.getenv("BACKEND_START_PROBE_TIMEOUT", "60").strip() or 60),
+            backend_drain_seconds=float(os.getenv("BACKEND_DRAIN_SECONDS", "0").strip() or 0),
             static_site_root=_strip_end(os.getenv("STATIC_SITE_ROOT", "").strip() or "/static"),
             default_ssl_domains=default_ssl_domains,
             nginx_resolvers=_detect_nginx_resolvers(),
+            max_draining_workers=int(os.getenv("NGINX_MAX_DRAINING_WORKERS", "0").strip() or 0),
+            max_draining_memory=_parse_size_bytes(os.getenv("NGINX_MAX_DRAINING_MEMORY", "0").strip() or "0"),
+            config_history_size=int(os.getenv("NGINX_CONFIG_HISTORY_SIZE", "20").strip() or 20),
+            selfsigned_shared_placeholder=os.getenv("SSL_SELFSIGNED_SHARED", "false").strip().lower() == "true",
+            cert_issuance_concurrency=int(os.getenv("CERT_ISSUANCE_CONCURRENCY", "4").strip() or 4),
+            cert_max_orders_per_hour=int(os.getenv("CERT_MAX_ORDERS_PER_HOUR", "100").strip() or 100),
+            cert_max_san_per_order=int(os.getenv("CERT_MAX_SAN_PER_ORDER", "50").strip() or 50),
+            cert_reload_batch_seconds=float(os.getenv("CERT_RELOAD_BATCH_SECONDS", "30").strip() or 0),
+            ssl_session_tickets=os.getenv("SSL_SESSION_TICKETS", "off").strip().lower(),
+            ssl_session_ticket_dir=os.getenv("SSL_SESSION_TICKET_DIR", ssl_dir + "/session-tickets").strip(),
+            ssl_session_ticket_rotate_hours=float(os.getenv("SSL_SESSION_TICKET_ROTATE_HOURS", "12").strip() or 12),
+            ssl_session_ticket_keep=int(os.getenv("SSL_SESSION_TICKET_KEEP", "2").strip() or 2),
+            ssl_session_cache_size=session_cache_size(
+                int(os.getenv("SSL_SESSION_CACHE_CONNECTIONS", "0").strip() or 0)
+            ),
+            ssl_ocsp_prefetch=os.getenv("SSL_OCSP_PREFETCH", "true").strip().lower() == "true",
+            ssl_dual_certificates=os.getenv("SSL_DUAL_CERTIFICATES", "false").strip().lower() == "true",
+            ssl_certificate_loading=os.getenv("SSL_CERTIFICATE_LOADING", "static").strip().lower(),
+            ssl_certificate_cache=int(os.getenv("SSL_CERTIFICATE_CACHE", "1000").strip() or 0),
+            upstream_keepalive=int(os.getenv("UPSTREAM_KEEPALIVE", "0").strip() or 0),
+            upstream_keepalive_requests=int(os.getenv("UPSTREAM_KEEPALIVE_REQUESTS", "1000").strip() or 1000),
+            upstream_keepalive_timeout=os.getenv("UPSTREAM_KEEPALIVE_TIMEOUT", "4s").strip() or "4s",
+            upstream_cpu_weights=os.getenv("UPSTREAM_CPU_WEIGHTS", "true").strip().lower() == "true",
+            upstream_max_fails=int(os.getenv("UPSTREAM_MAX_FAILS", "3").strip() or 3),
+            upstream_fail_timeout=os.getenv("UPSTREAM_FAIL_TIMEOUT", "10s").strip() or "10s",
+            proxy_next_upstream=" ".join(os.getenv("PROXY_NEXT_UPSTREAM", "").split()) or None,
+            proxy_next_upstream_tries=int(os.getenv("PROXY_NEXT_UPSTREAM_TRIES", "").strip() or 0) or None,
+            proxy_next_upstream_timeout=os.getenv("PROXY_NEXT_UPSTREAM_TIMEOUT", "").strip() or None,
+            health_check=os.getenv("HEALTH_CHECK", "false").strip().lower() == "true",
+            health_check_interval=float(os.getenv("HEALTH_CHECK_INTERVAL", "5").strip() or 5),
+            health_check_timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT", "2").strip() or 2),
+            health_check_rise=int(os.getenv("HEALTH_CHECK_RISE", "2").strip() or 2),
+            health_check_fall=int(os.getenv("HEALTH_CHECK_FALL", "3").strip() or 3),
+            health_check_status=os.getenv("HEALTH_CHECK_STATUS", "200-399").strip() or "200-399",
+            health_check_path=os.getenv("HEALTH_CHECK_PATH", "/").strip() or "/",
+            health_check_metrics_file=os.getenv("HEALTH_CHECK_METRICS_FILE", "").strip() or None,
+            health_check_reload_interval=float(os.getenv("HEALTH_CHECK_RELOAD_INTERVAL", "30").strip() or 30),
         )
 
     def _setup_nginx_conf(self):
@@ -245,6 +340,20 @@ class NginxProxyApp:
             return self.docker_event_listener.enqueue(RescanAndReload(force=True, bypass_start_grace=True))
         return self.server.rescan_and_reload(force=True, bypass_start_grace=True)
 
+    def rollback(self):
+        if self.server is None:
+            print("Rollback requested before NginxProxyApp started", file=sys.stderr)
+            return False
+        if self.docker_event_listener is not None and self.docker_event_listener.is_dispatcher_running():
+            return self.docker_event_listener.enqueue(self.server.rollback)
+        return self.server.rollback()
+
+    def log_status(self):
+        if self.server is None:
+            print("Status requested before NginxProxyApp started", file=sys.stderr)
+            return None
+        return self.server.log_drain_status()
+
     def cleanup(self):
         if self.docker_event_listener is not None and self.docker_event_listener.is_dispatcher_running():
             self.docker_event_listener.stop_dispatcher()
@@ -112,14 +112,17 @@ class ProxyConfigData:
                         if container.type == "static_site":
                             print("      -> ", container.path)
                         else:
-                            print(
-                                "      -> ",
-                                (container.scheme)
-                                + "://"
-                                + container.address
-                                + (":" + str(container.port) if container.port else "")
-                                + container.path,
-                            )
+                            # dnsrr services have no VIP, only task addresses
+                            addresses = [container.address] if container.address else []
+                            for address in addresses or [task.address for task in container.tasks or []]:
+                                print(
+                                    "      -> ",
+                                    (container.scheme)
+                                    + "://"
+                                    + address
+                                    + (":" + str(container.port) if container.port else "")
+                                    + container.path,
+                                )
 
                     if len(location.extras):
                         self.printextra("      ", location.extras)
@@ -1,7 +1,7 @@
 import copy
 import os
-import subprocess
 import sys
+import threading
 from datetime import datetime, timezone
 from typing import Callable, List, TYPE_CHECKING
 
@@ -17,7 +17,12 @@ from nginx.DummyNginx import DummyNginx
 from nginx import Url
 from nginx_proxy.BackendTarget import BackendTarget
 from nginx_proxy import ProxyConfigData
+from nginx_proxy.health_checker import ActiveHealthChecker
+from nginx_proxy import readiness_probe
 from nginx_proxy.Host import Host
+from nginx_proxy.selfsigned_certificates import create_selfsigned_placeholders, share_key_with_group, worker_group_id
+from nginx_proxy.session_tickets import SessionTicketKeys
+from nginx_proxy.swarm_tasks import SwarmTopology
 from nginx_proxy.Throttler import Throttler
 
 if TYPE_CHECKING:
@@ -45,11 +50,20 @@ class WebServer:
         self.throttler = Throttler(self.reload_interval)
         NginxClass = DummyNginx if self.config["dummy_nginx"] else Nginx
         self.nginx: Nginx | DummyNginx = NginxClass(
-            self.config["conf_dir"] + "/conf.d/nginx-proxy.conf", self.config["challenge_dir"]
+            self.config["conf_dir"] + "/conf.d/nginx-proxy.conf",
+            self.config["challenge_dir"],
+            history_dir=self.config["conf_dir"] + "/config-history",
+            history_size=self.config.get("config_history_size", 20),
         )
         self.config_data = ProxyConfigData()
         self._reload_dispatcher: Callable | None = None
         self._is_reload_dispatcher_thread: Callable[[], bool] | None = None
+        self.docker_event_listener = None  # set by DockerEventListener
+        # guards the pending reload state, shared by the event listener, the throttler and the deferred reload timer
+        self._reload_state_lock = threading.Lock()
+        self._urgent_reload_pending = False
+        self._pending_reload_events: List[str] = []
+        self._deferred_reload_timer: threading.Timer | None = None
         self.services = set()
         self.networks = {}
         vhosts_template_path = os.path.join(self.config["vhosts_template_dir"], "default.conf.jinja2")
@@ -70,7 +84,54 @@ class WebServer:
         )
         self.basic_auth_processor = post_processors.BasicAuthProcessor(self.config["conf_dir"] + "/basic_auth")
         self.redirect_processor = post_processors.RedirectProcessor()
-        self.upstream_processor = post_processors.UpstreamProcessor()
+        # containers being stopped, rendered as down until they are removed
+        self._draining_backends: set[str] = set()
+        self.health_checker: ActiveHealthChecker | None = None
+        if self.config.get("health_check"):
+            self.health_checker = ActiveHealthChecker(
+                on_change=lambda: self.enqueue_reload(event="health check"),
+                interval=self.config.get("health_check_interval", 5),
+                timeout=self.config.get("health_check_timeout", 2),
+                rise=self.config.get("health_check_rise", 2),
+                fall=self.config.get("health_check_fall", 3),
+                expected_status=self.config.get("health_check_status", "200-399"),
+                path=self.config.get("health_check_path", "/"),
+                metrics_path=self.config.get("health_check_metrics_file"),
+                reload_interval=self.config.get("health_check_reload_interval", 30),
+            )
+        self.swarm_topology: SwarmTopology | None = None
+        self._swarm_tasks: dict = {}  # service id -> tasks it was last registered with
+        if self.config.get("docker_swarm_routing") in ("tasks", "topology") and self.config.get("docker_swarm") in (
+            "enable",
+            "prefer-local",
+            "strict",
+        ):
+            self.swarm_topology = SwarmTopology(
+                self.swarm_client, self.client, zone_label=self.config.get("swarm_zone_label", "zone")
+            )
+        self.upstream_processor = post_processors.UpstreamProcessor(
+            keepalive=self.config.get("upstream_keepalive", 0),
+            keepalive_requests=self.config.get("upstream_keepalive_requests"),
+            keepalive_timeout=self.config.get("upstream_keepalive_timeout"),
+            cpu_weights=self.config.get("upstream_cpu_weights", True),
+            max_fails=self.config.get("upstream_max_fails"),
+            fail_timeout=self.config.get("upstream_fail_timeout"),
+            is_down=self._is_backend_down,
+            topology=self.swarm_topology if self.config.get("docker_swarm_routing") == "topology" else None,
+        )
+        self.session_ticket_keys: SessionTicketKeys | None = None
+        self._ticket_rotation_timer: threading.Timer | None = None
+        if self.config.get("ssl_session_tickets") == "managed":
+            self.session_ticket_keys = SessionTicketKeys(
+                self.config.get("ssl_session_ticket_dir") or os.path.join(self.config["ssl_dir"], "session-tickets"),
+                rotation_seconds=self.config.get("ssl_session_ticket_rotate_hours", 12) * 3600,
+                retain=self.config.get("ssl_session_ticket_keep", 2),
+            )
+        # with dynamic loading the nginx worker, not root, reads the placeholder keys during the handshake
+        self._placeholder_key_group: int | None = None
+        self._shared_placeholder_keys: set[str] = set()
+        if self.config.get("ssl_certificate_loading") == "dynamic":
+            self._placeholder_key_group = worker_group_id()
 
         # Render default config for Nginx setup
         default_nginx_config = self.template.render(config=self.config)
@@ -82,6 +143,8 @@ class WebServer:
         self.setup_error_config()
         self.rescan_and_reload(force=True, bypass_start_grace=True)
         self.ssl_processor.start()
+        if self.health_checker is not None:
+            self.health_checker.start()
 
     def set_reload_dispatcher(self, dispatcher: Callable | None, is_dispatcher_thread: Callable[[], bool] | None):
         self._reload_dispatcher = dispatcher
@@ -120,6 +183,13 @@ class WebServer:
 
         return hosts + redirect_hosts
 
+    @staticmethod
+    def _location_sort_key(item):
+        # regex locations are matched in order of appearance, so they keep their relative order after the others
+        name = item[0] or "/"
+        is_regex = name.startswith("~")
+        return is_regex, "" if is_regex else name
+
     def _render_config(
         self,
         config_data: ProxyConfigData | None = None,
@@ -133,7 +203,9 @@ class WebServer:
 
         hosts: List[Host] = []
         has_default = False
-        for host_data in render_config_data.host_list():
+        # Render in a canonical order, so that equal state yields byte-identical output regardless of the order in
+        # which containers were discovered.
+        for host_data in sorted(render_config_data.host_list(), key=lambda h: (str(h.hostname), int(h.port))):
             host = copy.deepcopy(host_data)
             host.is_down = host_data.isempty()
             if "default_server" in host.extras:
@@ -141,19 +213,27 @@ class WebServer:
                     del host.extras["default_server"]
                 else:
                     has_default = True
+            host.locations = dict(sorted(host.locations.items(), key=self._location_sort_key))
             for location in host.locations.values():
+                location.backends.sort(key=lambda b: b.sort_key())
                 location.container = list(location.backends)[0]
             hosts.append(host)
 
         upstreams = self.upstream_processor.process(
             hosts, prefer_local=render_config.get("docker_swarm") == "prefer-local"
         )
+        if self.health_checker is not None and not dry_run:
+            self.health_checker.update_targets(upstreams)
         self.basic_auth_processor.process_basic_auth(hosts, dry_run=dry_run, created_files=dry_run_auth_files)
         self.ssl_processor.process_ssl_certificates(hosts, update_watch_domains=update_ssl_watch_domains)
         if dry_run:
             self._ensure_selfsigned_certificate_files(hosts)
         hosts = self._ensure_https_redirects(hosts)
         render_config["default_server"] = not has_default
+        if render_config.get("ssl_certificate_loading") == "dynamic":
+            render_config["ssl_certificate_map"] = self.ssl_processor.certificate_map(hosts)
+        if self.session_ticket_keys is not None:
+            render_config["ssl_session_ticket_keys"] = self._session_ticket_key_files(schedule_rotation=not dry_run)
         if not dry_run:
             self.config["default_server"] = render_config["default_server"]
 
@@ -163,6 +243,24 @@ class WebServer:
             config=render_config,
         )
 
+    def _session_ticket_key_files(self, schedule_rotation: bool) -> List[str]:
+        try:
+            keys = self.session_ticket_keys.ensure_keys()
+        except OSError as e:
+            print(f"[WARN] Could not prepare session ticket keys, disabling session tickets: {e}", file=sys.stderr)
+            return []
+        if schedule_rotation and self._ticket_rotation_timer is None:
+
+            def rotate():
+                self._ticket_rotation_timer = None
+                self.enqueue_reload(event="session ticket rotation")
+
+            # the rotated key only becomes active with the reload of the config referencing it
+            self._ticket_rotation_timer = threading.Timer(self.session_ticket_keys.seconds_until_rotation() + 1, rotate)
+            self._ticket_rotation_timer.daemon = True
+            self._ticket_rotation_timer.start()
+        return keys
+
     def _validate_config_data(self, config_data: ProxyConfigData, backend: BackendTarget | None = None) -> bool:
         dry_run_auth_files: List[str] = []
         output = self._render_config(
@@ -209,6 +307,7 @@ class WebServer:
         os.makedirs(certs_dir, exist_ok=True)
         os.makedirs(keys_dir, exist_ok=True)
 
+        jobs = []
         for host in hosts:
             ssl_file = getattr(host, "ssl_file", None)
             if not host.secured or not ssl_file or not str(ssl_file).endswith(".selfsigned"):
@@ -217,41 +316,129 @@ class WebServer:
             cert_path = os.path.join(certs_dir, ssl_file + ".crt")
             key_path = os.path.join(keys_dir, ssl_file + ".key")
             if os.path.exists(cert_path) and os.path.exists(key_path):
+                if self._placeholder_key_group is not None and key_path not in self._shared_placeholder_keys:
+                    # created before dynamic loading was enabled
+                    share_key_with_group(key_path, self._placeholder_key_group)
+                    self._shared_placeholder_keys.add(key_path)
                 continue
+            jobs.append((host.hostname, cert_path, key_path))
 
-            subprocess.run(
-                [
-                    "openssl",
-                    "req",
-                    "-x509",
-                    "-nodes",
-                    "-newkey",
-                    "rsa:2048",
-                    "-days",
-                    "30",
-                    "-subj",
-                    f"/CN={host.hostname}",
-                    "-keyout",
-                    key_path,
-                    "-out",
-                    cert_path,
-                ],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
+        create_selfsigned_placeholders(
+            jobs,
+            shared=bool(self.config.get("selfsigned_shared_placeholder", False)),
+            key_group=self._placeholder_key_group,
+        )
 
-    def _do_reload(self, forced=False, validate=True) -> bool:
+    def _do_reload(self, forced=False, validate=True, event: str | None = None) -> bool:
         """
         Creates a new configuration based on current state and signals nginx to reload.
         This is called whenever there's change in container or network state.
+        Non-urgent reloads are deferred while too many old workers are still draining.
         :return:
         """
         # print("web_server._do_reload(forced="+str(forced)+")")
+        with self._reload_state_lock:
+            if event:
+                self._pending_reload_events.append(event)
+            urgent = self._urgent_reload_pending
+        if not forced and not urgent and self._drain_budget_exceeded():
+            self._schedule_deferred_reload()
+            return False
+        with self._reload_state_lock:
+            # taken before rendering, a reload requested from now on renders again
+            self._urgent_reload_pending = False
+            events, self._pending_reload_events = self._pending_reload_events, []
         output = self._render_config(self.config_data, update_ssl_watch_domains=True)
-        response = self.nginx.update_config(output, force=forced, validate=validate)
+        certificates_changed = self.ssl_processor.certificates_changed()
+        if certificates_changed:
+            # nginx only loads certificate files on reload
+            forced = True
+            events.append("certificate changed")
+        response = self.nginx.update_config(
+            output, force=forced, validate=validate, event=self._describe_reload_events(events)
+        )
+        if certificates_changed and response:
+            self.ssl_processor.certificates_reloaded()
         return response
 
+    def rollback(self) -> bool:
+        """
+        Restore the config version requested by the rollback command.
+        """
+        return self.nginx.apply_rollback_request()
+
+    @staticmethod
+    def _describe_reload_events(events: List[str]) -> str:
+        events = list(dict.fromkeys(events))
+        if not events:
+            return "reload"
+        if len(events) > 5:
+            return ", ".join(events[:5]) + f" (+{len(events) - 5} more)"
+        return ", ".join(events)
+
+    def drain_status(self) -> dict:
+        """
+        Live count and memory of nginx workers still draining connections from previous reloads.
+        """
+        draining = self.nginx.draining_workers()
+        return {
+            "draining_workers": draining.count,
+            "draining_generations": draining.generations,
+            "draining_rss_bytes": draining.rss_bytes,
+            "max_draining_workers": int(self.config.get("max_draining_workers", 0) or 0),
+            "max_draining_memory": int(self.config.get("max_draining_memory", 0) or 0),
+            "reload_deferred": self._deferred_reload_timer is not None,
+        }
+
+    def _drain_budget_exceeded(self) -> bool:
+        max_workers = int(self.config.get("max_draining_workers", 0) or 0)
+        max_memory = int(self.config.get("max_draining_memory", 0) or 0)
+        if max_workers <= 0 and max_memory <= 0:
+            return False
+        status = self.drain_status()
+        exceeded = (max_workers > 0 and status["draining_workers"] > max_workers) or (
+            max_memory > 0 and status["draining_rss_bytes"] > max_memory
+        )
+        if exceeded:
+            print("[drain] Deferring nginx reload: " + self._describe_drain_status(status), file=sys.stderr)
+        return exceeded
+
+    def log_drain_status(self) -> dict:
+        """
+        Print the drain status, on SIGUSR1.
+        """
+        status = self.drain_status()
+        print(
+            "[drain] "
+            + self._describe_drain_status(status)
+            + f" max_workers={status['max_draining_workers']}"
+            + f" max_rss={status['max_draining_memory'] // (1024 * 1024)}MiB"
+            + f" reload_deferred={str(status['reload_deferred']).lower()}",
+            file=sys.stderr,
+        )
+        return status
+
+    @staticmethod
+    def _describe_drain_status(status: dict) -> str:
+        return (
+            f"draining_workers={status['draining_workers']} "
+            f"generations={status['draining_generations']} "
+            f"rss={status['draining_rss_bytes'] // (1024 * 1024)}MiB"
+        )
+
+    def _schedule_deferred_reload(self):
+        def retry():
+            with self._reload_state_lock:
+                self._deferred_reload_timer = None
+            self.enqueue_reload()
+
+        with self._reload_state_lock:
+            if self._deferred_reload_timer is not None:
+                return
+            self._deferred_reload_timer = threading.Timer(max(1, self.reload_interval), retry)
+            self._deferred_reload_timer.daemon = True
+            self._deferred_reload_timer.start()
+
     def learn_yourself(self):
         """
         Looks in it's own filesystem to find out the container in which it is running.
@@ -313,6 +500,8 @@ class WebServer:
     # removes container from the maintained list.
     # this is called when a caontainer dies or leaves a known network
     def remove_backend(self, container_id: str):
+        self._draining_backends.discard(container_id)
+        self._swarm_tasks.pop(container_id, None)
         deleted, deleted_domain = self._remove_backend_without_reload(container_id)
         if deleted:
             self._register_static_sites()
@@ -327,24 +516,55 @@ class WebServer:
                 "    " + deleted.name,
                 sep="\t",
             )
-            self.reload()
+            self.reload(urgent=True, event="remove " + str(deleted.name))
+
+    def drain_backend(self, container_id: str) -> bool:
+        """
+        Render a registered backend as down in its upstreams ahead of its removal.
+        @:returns True if the backend is registered
+        """
+        if not self.config_data.has_backend(container_id):
+            return False
+        if container_id not in self._draining_backends:
+            self._draining_backends.add(container_id)
+            self.reload(urgent=True, event="drain " + container_id[:12])
+        return True
+
+    def undrain_backend(self, container_id: str):
+        if container_id in self._draining_backends:
+            self._draining_backends.discard(container_id)
+            self.reload(event="undrain " + container_id[:12])
+
+    def _is_backend_down(self, backend: BackendTarget) -> bool:
+        if backend.id in self._draining_backends:
+            return True
+        return self.health_checker is not None and self.health_checker.is_down(backend)
 
     def _remove_backend_without_reload(self, container_id: str):
         return self.config_data.remove_backend(container_id)
 
-    def reload(self, immediate=False, force=False, validate=True) -> bool:
+    def reload(self, immediate=False, force=False, validate=True, urgent=False, event: str | None = None) -> bool:
         """
         Schedules or performs a reload of the Nginx configuration.
+        Urgent reloads (backend removals) are never deferred by the draining worker budget.
+        :param event: what triggered the reload, recorded in the config history
         Returns True if a reload was initiated or scheduled.
         """
-
+        with self._reload_state_lock:
+            if urgent:
+                self._urgent_reload_pending = True
+            if event:
+                self._pending_reload_events.append(event)
         return self.throttler.throttle(lambda: self._do_reload(force, validate=validate), immediate=immediate or force)
 
-    def enqueue_reload(self, force=False) -> bool:
+    def enqueue_reload(self, force=False, event: str | None = None) -> bool:
         if self._reload_dispatcher is None:
-            return self.reload(immediate=force, force=force)
+            return self.reload(immediate=force, force=force, event=event)
         if self._is_reload_dispatcher_thread is not None and self._is_reload_dispatcher_thread():
-            return self.reload(immediate=force, force=force)
+            return self.reload(immediate=force, force=force, event=event)
+        if event:
+            with self._reload_state_lock:
+                self._pending_reload_events.append(event)
 
         from nginx_proxy.DockerEventListener import Reload
 
@@ -417,6 +637,8 @@ class WebServer:
         :param backend: BackendTarget object
         :return: true if state change affected the nginx configuration else false
         """
+        if backend.type == "service":
+            self._swarm_tasks[backend.id] = backend.tasks
         try:
             candidate_config_data = copy.deepcopy(self.config_data)
             existing_backend = candidate_config_data.has_backend(backend.id)
@@ -433,7 +655,7 @@ class WebServer:
                     return False
                 self.config_data = candidate_config_data
                 if reload:
-                    self.reload(validate=False)
+                    self.reload(validate=False, event=f"update {backend.type} {backend.name}")
                 return True
         except requests.exceptions.HTTPError as e:
             pass
@@ -477,8 +699,11 @@ class WebServer:
 
                 if node_state == "active" and is_manager:
                     services = self.swarm_client.services.list()
+                    if self.swarm_topology is not None:
+                        self.swarm_topology.refresh_nodes()
                     for service in services:
                         backend = BackendTarget.from_service(service)
+                        self.attach_swarm_tasks(backend, service)
                         backends.append(backend)
                 elif node_state == "active":
                     # If node is active but not manager, we can't list services on this client.
@@ -495,6 +720,43 @@ class WebServer:
             self.update_backend(backend, replace_existing=True, reload=False)
         self._register_static_sites()
 
+    def attach_swarm_tasks(self, backend: BackendTarget, service) -> bool:
+        """
+        Route to the running tasks of the service directly when DOCKER_SWARM_ROUTING is tasks or topology.
+        @:returns True if the tasks differ from the ones the service was last seen with
+        """
+        if self.swarm_topology is None:
+            return False
+        try:
+            backend.tasks = self.swarm_topology.service_tasks(service)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            print(f"[WARN] Could not list tasks of service {backend.name}: {e}", file=sys.stderr)
+            return False
+        return self._swarm_tasks.get(backend.id) != backend.tasks
+
+    def refresh_swarm_tasks(self):
+        """
+        Update the services whose running tasks changed, tasks are replaced without any service event on failures
+        and node outages.
+        """
+        if self.swarm_topology is None:
+            return
+        try:
+            services = self.swarm_client.services.list()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            print(f"[WARN] Could not list Swarm services: {e}", file=sys.stderr)
+            return
+        for service in services:
+            backend = BackendTarget.from_service(service)
+            if not any(key.startswith(("VIRTUAL_HOST", "STATIC_VIRTUAL_HOST")) for key in backend.env):
+                continue
+            if self.attach_swarm_tasks(backend, service):
+                self.update_backend(backend)
+
     def _register_static_sites(self):
         candidate_config_data = copy.deepcopy(self.config_data)
         self._add_static_sites_to_config(candidate_config_data)
@@ -571,11 +833,21 @@ class WebServer:
 
     def rescan_and_reload(self, force=False, bypass_start_grace=True):
         self.rescan_all_container(bypass_start_grace=bypass_start_grace)
-        return self.reload(immediate=force, force=force)
+        return self.reload(immediate=force, force=force, event="rescan")
 
     def cleanup(self):
         self.throttler.shutdown()
+        with self._reload_state_lock:
+            timer, self._deferred_reload_timer = self._deferred_reload_timer, None
+        if timer is not None:
+            timer.cancel()
+        if self._ticket_rotation_timer is not None:
+            self._ticket_rotation_timer.cancel()
+            self._ticket_rotation_timer = None
+        if self.health_checker is not None:
+            self.health_checker.stop()
         self.ssl_processor.shutdown()
+        self.basic_auth_processor.shutdown()
         self.nginx.stop()
 
     def _should_register_container_now(self, container, bypass_start_grace=False) -> bool:
@@ -585,6 +857,15 @@ class WebServer:
             return self._container_health_status(container) == "healthy"
         if bypass_start_grace:
             return True
+        if self.config.get("backend_start_probe") and self.docker_event_listener is not None:
+            if self.config_data.has_backend(container.id):
+                # it was ready when it got registered
+                return True
+            targets = readiness_probe.probe_targets(BackendTarget.from_container(container), self.networks.keys())
+            if targets:
+                # probing here would block the rescan, the listener registers the container once it's ready
+                self.docker_event_listener.probe_backend_start(container.id, targets)
+                return False
         grace_seconds = float(self.config.get("backend_start_grace_seconds", 0) or 0)
         if grace_seconds <= 0:
             return True
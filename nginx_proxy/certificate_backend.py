@@ -19,6 +19,9 @@ class CertificateBackend:
     cert_manager: AcmeCertManager | None = None
     certapi_client: CertManagerClient | None = None
     challenge_store: NginxChallengeSolver | None = None
+    # second backend storing RSA certificates below certs/rsa and private/rsa, when dual certificates are enabled
+    rsa_backend: Any = None
+    rsa_key_store: FileSystemKeyStore | None = None
 
 
 def build_certificate_backend(
@@ -40,6 +43,11 @@ def build_certificate_backend(
         certapi_url = os.environ.get("CERTAPI_URL").strip()
 
     key_store = FileSystemKeyStore(ssl_path, keys_dir_name="private")
+    rsa_key_store = None
+    if config.get("ssl_dual_certificates"):
+        rsa_key_store = FileSystemKeyStore(
+            ssl_path, keys_dir_name=os.path.join("private", "rsa"), certs_dir_name=os.path.join("certs", "rsa")
+        )
 
     if use_certapi_server:
         client = CertManagerClient(certapi_url, key_store)
@@ -50,6 +58,8 @@ def build_certificate_backend(
             use_certapi_server=True,
             batch_domains=batch_domains,
             certapi_client=client,
+            rsa_backend=CertManagerClient(certapi_url, rsa_key_store) if rsa_key_store is not None else None,
+            rsa_key_store=rsa_key_store,
         )
 
     acme_url = os.environ.get("LETSENCRYPT_API")
@@ -75,6 +85,15 @@ def build_certificate_backend(
         renew_threshold_days=renew_threshold_days,
     )
     cert_manager.setup()
+    rsa_cert_manager = None
+    if rsa_key_store is not None:
+        # same ACME account and solvers, only the certificate keys and storage differ
+        rsa_cert_manager = AcmeCertManager(
+            rsa_key_store,
+            cert_issuer,
+            challenge_solvers,
+            renew_threshold_days=renew_threshold_days,
+        )
 
     return CertificateBackend(
         backend=cert_manager,
@@ -84,4 +103,6 @@ def build_certificate_backend(
         batch_domains=batch_domains,
         cert_manager=cert_manager,
         challenge_store=challenge_store,
+        rsa_backend=rsa_cert_manager,
+        rsa_key_store=rsa_key_store,
     )
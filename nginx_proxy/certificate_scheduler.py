@@ -0,0 +1,161 @@
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+from certapi.domain_batching import create_safe_domain_batches
+from certapi.domain_matching import domain_matches_cert_domain, is_wildcard_domain, normalize_domain
+from certapi.http.types import CertificateResponse, FailedDomains
+
+CHALLENGE_DNS = "dns-01"
+CHALLENGE_HTTP = "http-01"
+
+
+def challenge_type(domain: str) -> str:
+    """
+    Wildcards can only be validated with DNS-01. Other domains are planned as HTTP-01; the certificate manager
+    still falls back to a DNS solver for a batch when HTTP validation isn't possible.
+    """
+    return CHALLENGE_DNS if is_wildcard_domain(domain) else CHALLENGE_HTTP
+
+
+class OrderBudget:
+    """
+    Number of ACME orders started within the last hour, shared by the schedulers ordering from the same ACME account.
+    """
+
+    def __init__(self, max_orders_per_hour: int = 100, clock: Callable[[], float] = time.monotonic):
+        self.max_orders_per_hour = max(0, int(max_orders_per_hour))
+        self.clock = clock
+        self._order_times: deque = deque()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> bool:
+        """
+        :return: whether another order may be started, it's then counted
+        """
+        if self.max_orders_per_hour == 0:
+            return True
+        with self._lock:
+            now = self.clock()
+            while self._order_times and self._order_times[0] <= now - 3600:
+                self._order_times.popleft()
+            if len(self._order_times) >= self.max_orders_per_hour:
+                return False
+            self._order_times.append(now)
+            return True
+
+
+class CertificateIssuanceScheduler:
+    """
+    Drop-in replacement for ``AcmeCertManager.obtain`` used by the RenewalManager.
+    The requested domains are split into SAN batches per challenge type, and the batches are obtained as separate
+    ACME orders on a bounded thread pool. Wildcard batches run first, so that concrete domains they cover are not
+    issued again. Orders beyond ``max_orders_per_hour`` are not started and are reported as failed, so the renewal
+    manager retries them later instead of blocking the caller. Schedulers of one ACME account pass the same
+    ``order_budget`` to share that limit.
+    """
+
+    def __init__(
+        self,
+        cert_manager,
+        max_parallel: int = 4,
+        max_orders_per_hour: int = 100,
+        max_batch_size: int = 50,
+        on_batch_issued: Callable[[List[str]], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        order_budget: OrderBudget | None = None,
+    ):
+        self.cert_manager = cert_manager
+        self.max_parallel = max(1, int(max_parallel))
+        self.order_budget = order_budget if order_budget is not None else OrderBudget(max_orders_per_hour, clock)
+        self.max_orders_per_hour = self.order_budget.max_orders_per_hour
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.on_batch_issued = on_batch_issued
+
+    @property
+    def key_store(self):
+        return self.cert_manager.key_store
+
+    def plan_batches(self, domains: List[str], batch_domains: bool = True) -> List[Tuple[str, List[str]]]:
+        """
+        :return: list of (challenge type, domains) in issuance order, wildcard batches first
+        """
+        by_challenge = {}
+        seen = set()
+        for domain in domains:
+            domain = normalize_domain(domain)
+            if not domain or domain in seen:
+                continue
+            seen.add(domain)
+            by_challenge.setdefault(challenge_type(domain), []).append(domain)
+
+        batches = []
+        for challenge in (CHALLENGE_DNS, CHALLENGE_HTTP):
+            challenge_domains = by_challenge.get(challenge, [])
+            if batch_domains:
+                planned = create_safe_domain_batches(challenge_domains)
+            else:
+                planned = [[domain] for domain in challenge_domains]
+            for batch in planned:
+                for start in range(0, len(batch), self.max_batch_size):
+                    batches.append((challenge, batch[start : start + self.max_batch_size]))
+        return batches
+
+    def _obtain_batch(self, batch: List[str], kwargs: dict) -> CertificateResponse:
+        if not self.order_budget.reserve():
+            return CertificateResponse(
+                failed=[
+                    FailedDomains(
+                        domains=batch,
+                        name="RateBudgetExceeded",
+                        message=f"more than {self.max_orders_per_hour} certificate orders in the last hour",
+                        step="Schedule Issuance",
+                    )
+                ]
+            )
+        try:
+            response = self.cert_manager.obtain(batch, **kwargs)
+        except Exception as e:
+            return CertificateResponse(failed=[FailedDomains.from_exception(batch, e)])
+        if response.issued and self.on_batch_issued is not None:
+            try:
+                self.on_batch_issued(batch)
+            except Exception as e:
+                print(f"[SSL] Batch completion callback failed: {e}", file=sys.stderr)
+        return response
+
+    def obtain(self, hosts, **kwargs) -> CertificateResponse:
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        batches = self.plan_batches(hosts, batch_domains=kwargs.get("batch_domains", True))
+        # the scheduler already batched the domains, each order is obtained as planned
+        kwargs = dict(kwargs, batch_domains=False)
+        result = CertificateResponse()
+
+        def run_phase(phase_batches):
+            if not phase_batches:
+                return
+            if len(phase_batches) > 1:
+                print(f"[SSL] Obtaining {len(phase_batches)} certificate batches, {self.max_parallel} at a time")
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(phase_batches))) as executor:
+                responses = list(executor.map(lambda batch: self._obtain_batch(batch, kwargs), phase_batches))
+            for response in responses:
+                result.existing.extend(response.existing)
+                result.issued.extend(response.issued)
+                result.failed.extend(response.failed)
+
+        run_phase([batch for challenge, batch in batches if challenge == CHALLENGE_DNS])
+
+        covered = [domain for cert in result.issued + result.existing for domain in cert.domains]
+        concrete_batches = []
+        for challenge, batch in batches:
+            if challenge != CHALLENGE_HTTP:
+                continue
+            remaining = [d for d in batch if not any(domain_matches_cert_domain(c, d) for c in covered)]
+            if remaining:
+                concrete_batches.append(remaining)
+        run_phase(concrete_batches)
+        return result
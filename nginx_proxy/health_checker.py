@@ -0,0 +1,269 @@
+import asyncio
+import os
+import ssl
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+from nginx_proxy.BackendTarget import BackendTarget
+
+PATH_SETTING = "NGINX_HEALTH_CHECK_PATH"
+ENABLED_SETTING = "NGINX_HEALTH_CHECK"
+
+
+class HealthTarget(NamedTuple):
+    scheme: str
+    address: str
+    port: str
+    path: str
+    host: str  # Host header, backends behind nginx answer for the virtual host, not for their IP
+
+    @property
+    def server(self) -> str:
+        return f"{self.address}:{self.port}"
+
+
+class _TargetState:
+    def __init__(self):
+        self.down = False
+        self.successes = 0
+        self.failures = 0
+
+
+def host_header(hostname: str) -> str:
+    """
+    Host header for probing a backend of the virtual host, a wildcard host is probed by its parent domain.
+    """
+    return hostname[2:] if hostname.startswith("*.") else hostname
+
+
+def parse_status_ranges(spec: str) -> List[Tuple[int, int]]:
+    """
+    Parse expected status codes like "200-399" or "200,204".
+    :raises ValueError: for anything else
+    """
+    ranges = []
+    for part in spec.split(","):
+        low, _, high = part.strip().partition("-")
+        low, high = int(low), int(high or low)
+        if not 100 <= low <= high <= 599:
+            raise ValueError(f"invalid status range {part.strip()}")
+        ranges.append((low, high))
+    return ranges
+
+
+class ActiveHealthChecker:
+    """
+    Probes the servers of the rendered upstreams with HTTP requests, all of them concurrently on an asyncio loop in
+    a worker thread. A server is marked down after ``fall`` consecutive failed probes and up again after ``rise``
+    successful ones. Open source nginx has no API to change the state of a server, the ``down`` flag only takes
+    effect on reload. So ``on_change`` is called for the rounds in which any server changed state, at most once per
+    ``reload_interval``: a flapping server can't reload nginx every round, and its changes are applied together by
+    the first round after the interval. The reloads it triggers are not urgent, they are deferred while too many
+    old workers are still draining.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[], None] | None = None,
+        interval: float = 5,
+        timeout: float = 2,
+        rise: int = 2,
+        fall: int = 3,
+        expected_status: str = "200-399",
+        path: str = "/",
+        max_concurrency: int = 64,
+        metrics_path: str | None = None,
+        reload_interval: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.on_change = on_change
+        self.interval = interval
+        self.timeout = timeout
+        self.rise = max(1, int(rise))
+        self.fall = max(1, int(fall))
+        self.expected_status = parse_status_ranges(expected_status)
+        self.path = path
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.metrics_path = metrics_path
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._change_pending = False
+        self._last_change_notified: float | None = None
+        self._targets: List[HealthTarget] = []
+        self._states: Dict[str, _TargetState] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._ssl_context = ssl.create_default_context()
+        # backends are addressed by IP, their certificates can't be verified against it
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+        self.probes_total = {"success": 0, "failure": 0}
+        self.state_changes_total = 0
+        self.last_round_duration = 0.0
+
+    def update_targets(self, upstreams: Iterable[dict]):
+        """
+        Probe the servers of the given upstreams from the next round on.
+        """
+        targets = {}
+        for upstream in upstreams:
+            for backend in upstream["containers"]:
+                if BackendTarget.get_setting(backend, ENABLED_SETTING) == "false" or not backend.address:
+                    continue
+                path = BackendTarget.get_setting(backend, PATH_SETTING) or self.path
+                if not path.startswith("/"):
+                    path = "/" + path
+                scheme = "https" if backend.scheme in ("https", "wss") else "http"
+                host = host_header(str(upstream.get("hostname") or backend.address))
+                target = HealthTarget(scheme, str(backend.address), str(backend.port or 80), path, host)
+                targets.setdefault(target.server, target)
+        with self._lock:
+            self._targets = sorted(targets.values())
+            self._states = {server: self._states.get(server) or _TargetState() for server in targets}
+
+    def is_down(self, backend: BackendTarget) -> bool:
+        with self._lock:
+            state = self._states.get(f"{backend.address}:{backend.port or 80}")
+            return state is not None and state.down
+
+    def run_round(self) -> bool:
+        """
+        Probe every target once.
+        :return: whether any server changed state
+        """
+        with self._lock:
+            targets = list(self._targets)
+        started = time.monotonic()
+        results = asyncio.run(self._probe_all(targets)) if targets else []
+        changed = []
+        with self._lock:
+            for target, healthy in zip(targets, results):
+                self.probes_total["success" if healthy else "failure"] += 1
+                state = self._states.get(target.server)
+                if state is not None and self._record(state, healthy):
+                    changed.append((target.server, state.down))
+            self.state_changes_total += len(changed)
+            self.last_round_duration = time.monotonic() - started
+        for server, down in changed:
+            print(f"[HEALTH] {server} is {'down' if down else 'up'}", file=sys.stderr)
+        self._write_metrics()
+        return bool(changed)
+
+    def _record(self, state: _TargetState, healthy: bool) -> bool:
+        if healthy:
+            state.successes += 1
+            state.failures = 0
+            if state.down and state.successes >= self.rise:
+                state.down = False
+                return True
+        else:
+            state.failures += 1
+            state.successes = 0
+            if not state.down and state.failures >= self.fall:
+                state.down = True
+                return True
+        return False
+
+    async def _probe_all(self, targets: List[HealthTarget]) -> List[bool]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def probe(target):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._probe(target), self.timeout)
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    return False
+
+        return await asyncio.gather(*(probe(target) for target in targets))
+
+    async def _probe(self, target: HealthTarget) -> bool:
+        reader, writer = await asyncio.open_connection(
+            target.address, int(target.port), ssl=self._ssl_context if target.scheme == "https" else None
+        )
+        try:
+            writer.write(
+                f"GET {target.path} HTTP/1.1\r\nHost: {target.host}\r\n"
+                "User-Agent: nginx-proxy-health-check\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status_line = (await reader.readline()).decode("latin-1").split()
+        finally:
+            writer.close()
+        if len(status_line) < 2 or not status_line[0].startswith("HTTP/") or not status_line[1].isdigit():
+            return False
+        status = int(status_line[1])
+        return any(low <= status <= high for low, high in self.expected_status)
+
+    def render_metrics(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP nginx_proxy_health_check_probes_total Health check probes by result.",
+                "# TYPE nginx_proxy_health_check_probes_total counter",
+                *(
+                    f'nginx_proxy_health_check_probes_total{{result="{result}"}} {count}'
+                    for result, count in self.probes_total.items()
+                ),
+                "# HELP nginx_proxy_health_check_state_changes_total Servers marked down or up again.",
+                "# TYPE nginx_proxy_health_check_state_changes_total counter",
+                f"nginx_proxy_health_check_state_changes_total {self.state_changes_total}",
+                "# HELP nginx_proxy_health_check_round_duration_seconds Duration of the last probe round.",
+                "# TYPE nginx_proxy_health_check_round_duration_seconds gauge",
+                f"nginx_proxy_health_check_round_duration_seconds {self.last_round_duration:.6f}",
+                "# HELP nginx_proxy_health_check_up Whether the server passes its health check.",
+                "# TYPE nginx_proxy_health_check_up gauge",
+                *(
+                    f'nginx_proxy_health_check_up{{server="{server}"}} {0 if state.down else 1}'
+                    for server, state in sorted(self._states.items())
+                ),
+            ]
+        return "\n".join(lines) + "\n"
+
+    def _write_metrics(self):
+        if not self.metrics_path:
+            return
+        tmp_path = self.metrics_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.render_metrics())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            print(f"[WARN] Could not write health check metrics to {self.metrics_path}: {e}", file=sys.stderr)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="nginx-proxy-health-check", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread() and thread.is_alive():
+            thread.join(timeout=self.timeout + 1)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                changed = self.run_round()
+            except Exception as e:
+                print(f"[HEALTH] Probe round failed: {e}", file=sys.stderr)
+                continue
+            self._notify_change(changed)
+
+    def _notify_change(self, changed: bool):
+        """
+        Call on_change for the state changes seen since the last call, unless that was less than reload_interval ago.
+        """
+        self._change_pending = self._change_pending or changed
+        if not self._change_pending or self.on_change is None:
+            return
+        now = self.clock()
+        if self._last_change_notified is not None and now - self._last_change_notified < self.reload_interval:
+            return
+        self._change_pending = False
+        self._last_change_notified = now
+        self.on_change()
@@ -0,0 +1,264 @@
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import AuthorityInformationAccessOID, ExtensionOID
+
+# validity assumed for responses without nextUpdate
+DEFAULT_RESPONSE_LIFETIME = 24 * 3600
+
+
+class OcspError(Exception):
+    pass
+
+
+class _Certificate(NamedTuple):
+    stat: Tuple[int, int]
+    leaf: x509.Certificate
+    issuer: x509.Certificate | None
+
+
+class _Response(NamedTuple):
+    serial_number: int
+    this_update: float
+    next_update: float
+
+
+def ocsp_response_path(cert_path: str) -> str:
+    return (cert_path[: -len(".crt")] if cert_path.endswith(".crt") else cert_path) + ".ocsp"
+
+
+def ocsp_responder_url(cert: x509.Certificate) -> str | None:
+    try:
+        access = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_INFORMATION_ACCESS).value
+    except x509.ExtensionNotFound:
+        return None
+    for description in access:
+        if description.access_method == AuthorityInformationAccessOID.OCSP:
+            return description.access_location.value
+    return None
+
+
+def _response_times(response: ocsp.OCSPResponse) -> _Response:
+    this_update = response.this_update_utc.timestamp()
+    next_update = response.next_update_utc
+    return _Response(
+        response.serial_number,
+        this_update,
+        next_update.timestamp() if next_update is not None else this_update + DEFAULT_RESPONSE_LIFETIME,
+    )
+
+
+class OcspStapler:
+    """
+    Fetches OCSP responses for the certificates in use ahead of time and stores them next to the certificate as
+    ``<name>.ocsp``, for ``ssl_stapling_file``. nginx then staples from the first handshake after a reload, instead of
+    each worker querying the responder lazily. A response is refreshed halfway through its validity; nginx reads the
+    file only on reload, so ``on_updated`` is called to request one after new responses were stored.
+    The caches are shared by the render thread and the prefetch thread and are only touched under ``_condition``.
+    """
+
+    def __init__(
+        self,
+        on_updated: Callable[[], None] | None = None,
+        retry_seconds: float = 3600,
+        timeout: float = 10,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.on_updated = on_updated
+        self.retry_seconds = retry_seconds
+        self.timeout = timeout
+        self.clock = clock
+        self._tracked: List[str] = []
+        self._certificates: Dict[str, _Certificate] = {}
+        self._responses: Dict[str, _Response] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+    def track(self, cert_paths: Iterable[str]):
+        """
+        Set the certificate files whose responses are kept fresh.
+        """
+        cert_paths = sorted(set(cert_paths))
+        with self._condition:
+            if cert_paths == self._tracked:
+                return
+            self._tracked = cert_paths
+            self._condition.notify_all()
+
+    def stapling_file(self, cert_path: str) -> str | None:
+        """
+        Path of the stored response for cert_path, if it belongs to the current certificate and is still valid.
+        """
+        with self._condition:
+            certificate = self._load_certificate(cert_path)
+            if certificate is None:
+                return None
+            response = self._responses.get(cert_path)
+            if response is None:
+                response = self._load_stored_response(cert_path, certificate)
+            if response is None or response.serial_number != certificate.leaf.serial_number:
+                return None
+            if response.next_update <= self.clock():
+                return None
+            return ocsp_response_path(cert_path)
+
+    def refresh_due(self) -> bool:
+        """
+        Fetch the responses that are missing or past half their validity.
+        :return: whether any new response was stored
+        """
+        with self._condition:
+            tracked = list(self._tracked)
+        now = self.clock()
+        updated = False
+        for cert_path in tracked:
+            if self._refresh_time(cert_path) > now:
+                continue
+            try:
+                self.refresh(cert_path)
+                updated = True
+                with self._condition:
+                    self._retry_at.pop(cert_path, None)
+            except (OcspError, OSError, ValueError, requests.RequestException) as e:
+                print(f"[SSL] OCSP fetch failed for {os.path.basename(cert_path)}: {e}", file=sys.stderr)
+                with self._condition:
+                    self._retry_at[cert_path] = now + self.retry_seconds
+        return updated
+
+    def refresh(self, cert_path: str):
+        with self._condition:
+            certificate = self._load_certificate(cert_path)
+        if certificate is None or certificate.issuer is None:
+            raise OcspError("certificate chain without issuer")
+        url = ocsp_responder_url(certificate.leaf)
+        if url is None:
+            raise OcspError("certificate has no OCSP responder")
+        request = ocsp.OCSPRequestBuilder().add_certificate(certificate.leaf, certificate.issuer, hashes.SHA1()).build()
+        http_response = requests.post(
+            url,
+            data=request.public_bytes(serialization.Encoding.DER),
+            headers={"Content-Type": "application/ocsp-request"},
+            timeout=self.timeout,
+        )
+        http_response.raise_for_status()
+        response = ocsp.load_der_ocsp_response(http_response.content)
+        if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+            raise OcspError(f"responder answered {response.response_status.name}")
+        if response.serial_number != certificate.leaf.serial_number:
+            raise OcspError("response is for a different certificate")
+        if response.certificate_status != ocsp.OCSPCertStatus.GOOD:
+            raise OcspError(f"certificate status is {response.certificate_status.name}")
+
+        path = ocsp_response_path(cert_path)
+        tmp_path = path + ".tmp"
+        with self._condition:
+            with open(tmp_path, "wb") as f:
+                f.write(http_response.content)
+            os.replace(tmp_path, path)
+            self._responses[cert_path] = _response_times(response)
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="nginx-proxy-ocsp", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread is not threading.current_thread() and thread.is_alive():
+            thread.join(timeout=2)
+
+    def _refresh_time(self, cert_path: str) -> float:
+        with self._condition:
+            certificate = self._load_certificate(cert_path)
+            if certificate is None or certificate.issuer is None or ocsp_responder_url(certificate.leaf) is None:
+                # self-signed placeholders and certificates without responder are not stapled
+                return float("inf")
+            retry_at = self._retry_at.get(cert_path)
+            response = self._responses.get(cert_path) if self.stapling_file(cert_path) is not None else None
+            if response is None:
+                return retry_at or 0
+            return max(response.this_update + (response.next_update - response.this_update) / 2, retry_at or 0)
+
+    def _load_certificate(self, cert_path: str) -> _Certificate | None:
+        # called with _condition held
+        try:
+            stat = os.stat(cert_path)
+        except OSError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._certificates.get(cert_path)
+        if cached is not None and cached.stat == stat_key:
+            return cached
+        try:
+            with open(cert_path, "rb") as f:
+                chain = x509.load_pem_x509_certificates(f.read())
+        except (OSError, ValueError):
+            return None
+        certificate = _Certificate(stat_key, chain[0], chain[1] if len(chain) > 1 else None)
+        self._certificates[cert_path] = certificate
+        self._responses.pop(cert_path, None)
+        self._retry_at.pop(cert_path, None)
+        return certificate
+
+    def _load_stored_response(self, cert_path: str, certificate: _Certificate) -> _Response | None:
+        # responses stored before a restart, they are used if they still match the certificate
+        try:
+            with open(ocsp_response_path(cert_path), "rb") as f:
+                response = ocsp.load_der_ocsp_response(f.read())
+            if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+                return None
+            times = _response_times(response)
+        except (OSError, ValueError):
+            return None
+        if times.serial_number != certificate.leaf.serial_number:
+            return None
+        self._responses[cert_path] = times
+        return times
+
+    def _next_wait(self) -> float | None:
+        # called with _condition held
+        next_refresh = min((self._refresh_time(cert_path) for cert_path in self._tracked), default=float("inf"))
+        if next_refresh == float("inf"):
+            return None
+        return max(1.0, next_refresh - self.clock())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+            try:
+                updated = self.refresh_due()
+            except Exception as e:
+                print(f"[SSL] OCSP refresh failed: {e}", file=sys.stderr)
+                updated = False
+            if updated and self.on_updated is not None:
+                try:
+                    self.on_updated()
+                except Exception as e:
+                    print(f"[SSL] OCSP update callback failed: {e}", file=sys.stderr)
+            with self._condition:
+                if not self._running:
+                    return
+                try:
+                    wait = self._next_wait()
+                except Exception as e:
+                    print(f"[SSL] OCSP refresh scheduling failed: {e}", file=sys.stderr)
+                    wait = self.retry_seconds
+                self._condition.wait(wait)
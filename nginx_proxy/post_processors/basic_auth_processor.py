@@ -1,75 +1,179 @@
+import hashlib
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import bcrypt
 
+from nginx.Nginx import write_file
 from nginx_proxy.Host import Host
 
+# (folder, file, user, sha256 of password)
+CredentialKey = Tuple[str, str, str, str]
+
+
+def _hash_password(password: str) -> str:
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    # NGINX/Apache require $2y$ prefix (not $2b$), so we replace it
+    return hashed.decode("utf-8").replace("$2b$", "$2y$")
+
+
+def _verify_password(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.replace("$2y$", "$2b$", 1).encode("utf-8"))
+    except ValueError:
+        return False
+
+
+def _password_digest(password: str) -> str:
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
 
 class BasicAuthProcessor:
-    def __init__(self, basic_auth_dir: str = "/etc/nginx/basic_auth"):
-        self.cache: Dict[str, str] = {}
+    """
+    Writes htpasswd files for protected hosts and locations.
+    bcrypt is slow on purpose, so hashes are cached by (folder, file, user, password digest) and reused as long as
+    the password doesn't change. After a restart, the hashes already on disk are verified once and kept.
+    Files are only rewritten when their content changes.
+    """
+
+    def __init__(self, basic_auth_dir: str = "/etc/nginx/basic_auth", max_workers: int = None):
+        self.cache: Dict[CredentialKey, str] = {}
         self.basic_auth_dir = basic_auth_dir
+        self.max_workers = max_workers if max_workers else min(4, os.cpu_count() or 1)
+        self._executor: ProcessPoolExecutor | None = None
         if not os.path.exists(basic_auth_dir):
             Path(basic_auth_dir).mkdir(parents=True)
 
     @staticmethod
     def hash_password_bcrypt(password: str) -> str:
         """Return bcrypt-hashed password in htpasswd-compatible format."""
-        hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-        # NGINX/Apache require $2y$ prefix (not $2b$), so we replace it
-        return hashed.decode("utf-8").replace("$2b$", "$2y$")
+        return _hash_password(password)
 
-    def generate_htpasswd_file(self, folder: str, file: str, securities: Dict[str, str]) -> str:
+    @staticmethod
+    def _read_htpasswd(file_path: str) -> Dict[str, str]:
+        entries = {}
+        try:
+            with open(file_path) as f:
+                for line in f:
+                    user, separator, hashed = line.rstrip("\n").partition(":")
+                    if separator:
+                        entries[user] = hashed
+        except OSError:
+            pass
+        return entries
+
+    def _run_parallel(self, function, arguments: List[tuple]) -> List:
+        if len(arguments) < 2 or self.max_workers < 2:
+            return [function(*args) for args in arguments]
+        if self._executor is None:
+            # spawn instead of fork: the proxy process runs several threads by the time passwords get hashed
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return list(self._executor.map(function, *zip(*arguments)))
+
+    def _resolve_hashes(self, files: List[Tuple[str, str, Dict[str, str]]]) -> Dict[CredentialKey, str]:
+        """
+        Find a hash for every credential of the given files, hashing only what neither the cache nor the file on
+        disk can provide. Verification and hashing of all files are batched into the worker pool.
+        """
+        resolved: Dict[CredentialKey, str] = {}
+        to_verify: List[Tuple[CredentialKey, str, str]] = []
+        to_hash: Dict[CredentialKey, str] = {}
+        for folder, file, securities in files:
+            on_disk = None
+            for user, password in securities.items():
+                key = (folder, file, user, _password_digest(password))
+                if key in resolved or key in to_hash:
+                    continue
+                if key in self.cache:
+                    resolved[key] = self.cache[key]
+                    continue
+                if on_disk is None:
+                    on_disk = self._read_htpasswd(self.htpasswd_file_path(folder, file))
+                if user in on_disk:
+                    to_verify.append((key, password, on_disk[user]))
+                else:
+                    to_hash[key] = password
+
+        verified = self._run_parallel(_verify_password, [(password, hashed) for _, password, hashed in to_verify])
+        for (key, password, hashed), ok in zip(to_verify, verified):
+            if ok:
+                resolved[key] = hashed
+            else:
+                to_hash[key] = password
+
+        hashes = self._run_parallel(_hash_password, [(password,) for password in to_hash.values()])
+        resolved.update(zip(to_hash.keys(), hashes))
+        self.cache.update(resolved)
+        return resolved
+
+    def _write_htpasswd_file(
+        self, folder: str, file: str, securities: Dict[str, str], hashes: Dict[CredentialKey, str]
+    ) -> str:
         folder_path = os.path.join(self.basic_auth_dir, folder)
         os.makedirs(folder_path, exist_ok=True)
 
         file_path = os.path.join(folder_path, file)
-        with open(file_path, "w") as f:
-            for user, password in securities.items():
-                hashed = self.hash_password_bcrypt(password)
-                f.write(f"{user}:{hashed}\n")
-            f.flush()
-            os.fsync(f.fileno())  # Ensure data is written to disk
+        content = "".join(
+            f"{user}:{hashes[(folder, file, user, _password_digest(password))]}\n"
+            for user, password in securities.items()
+        )
+        try:
+            with open(file_path) as f:
+                if f.read() == content:
+                    return file_path
+        except OSError:
+            pass
+        write_file(file_path, content)
         return file_path
 
+    def generate_htpasswd_file(self, folder: str, file: str, securities: Dict[str, str]) -> str:
+        hashes = self._resolve_hashes([(folder, file, securities)])
+        return self._write_htpasswd_file(folder, file, securities, hashes)
+
     def htpasswd_file_path(self, folder: str, file: str) -> str:
         return os.path.join(self.basic_auth_dir, folder, file)
 
-    def _ensure_htpasswd_file(
-        self, folder: str, file: str, securities: Dict[str, str], created_files: List[str]
-    ) -> str:
-        file_path = self.htpasswd_file_path(folder, file)
-        if os.path.exists(file_path):
-            return file_path
-
-        generated_file_path = self.generate_htpasswd_file(folder, file, securities)
-        created_files.append(generated_file_path)
-        return generated_file_path
-
     def process_basic_auth(self, hosts: List[Host], dry_run: bool = False, created_files: List[str] | None = None):
         if created_files is None:
             created_files = []
 
+        # (folder, file, securities, extras to receive the file path)
+        targets = []
         for host in hosts:
             if "security" in host.extras:
-                if dry_run:
-                    host.extras["security_file"] = self._ensure_htpasswd_file(
-                        host.hostname, "_", host.extras["security"], created_files
-                    )
-                else:
-                    host.extras["security_file"] = self.generate_htpasswd_file(
-                        host.hostname, "_", host.extras["security"]
-                    )
-
+                targets.append((host.hostname, "_", host.extras["security"], host.extras))
             for location in host.locations.values():
                 if "security" in location.extras:
                     file = location.name.replace("/", "_")
-                    if dry_run:
-                        location.extras["security_file"] = self._ensure_htpasswd_file(
-                            host.hostname, file, location.extras["security"], created_files
-                        )
-                    else:
-                        location.extras["security_file"] = self.generate_htpasswd_file(
-                            host.hostname, file, location.extras["security"]
-                        )
+                    targets.append((host.hostname, file, location.extras["security"], location.extras))
+
+        if dry_run:
+            # validation must not touch the files of the running config, only create the missing ones
+            pending = []
+            for folder, file, securities, extras in targets:
+                extras["security_file"] = self.htpasswd_file_path(folder, file)
+                if not os.path.exists(extras["security_file"]):
+                    pending.append((folder, file, securities))
+        else:
+            pending = [(folder, file, securities) for folder, file, securities, extras in targets]
+
+        hashes = self._resolve_hashes(pending)
+        for folder, file, securities in pending:
+            file_path = self._write_htpasswd_file(folder, file, securities, hashes)
+            if dry_run:
+                created_files.append(file_path)
+
+        if not dry_run:
+            for folder, file, securities, extras in targets:
+                extras["security_file"] = self.htpasswd_file_path(folder, file)
+            # forget credentials that are no longer rendered
+            self.cache = {key: value for key, value in self.cache.items() if key in hashes}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
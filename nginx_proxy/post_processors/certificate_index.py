@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple, Union
+
+# (matched certificate name, expiry) or None when no certificate covers the domain
+IndexEntry = Union[Tuple[str, datetime], None]
+
+
+class CertificateIndex:
+    """
+    In-memory index of domain -> (certificate name, expiry) on top of a FileSystemKeyStore.
+    Lookups are plain dictionary reads. ``refresh()`` stats the certificate and key directories once, and drops
+    only the entries whose files were added, replaced or removed since the previous refresh, so renewed
+    certificates (which are overwritten in place) are picked up without re-reading the unchanged ones.
+    """
+
+    def __init__(self, directories: List[str]):
+        self.directories = directories
+        self._entries: Dict[str, IndexEntry] = {}
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._fingerprints: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        snapshot[os.path.join(directory, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    @staticmethod
+    def _certificate_name(file_path: str) -> str:
+        name = os.path.basename(file_path)
+        for suffix in (".crt", ".key"):
+            if name.endswith(suffix):
+                return name[: -len(suffix)]
+        return name
+
+    def refresh(self):
+        if not self.directories:
+            # nothing to watch for changes, so entries are only valid for a single render
+            self.invalidate()
+            return
+        snapshot = self._scan()
+        with self._lock:
+            if snapshot == self._snapshot:
+                return
+            all_paths = snapshot.keys() | self._snapshot.keys()
+            changed_paths = {path for path in all_paths if snapshot.get(path) != self._snapshot.get(path)}
+            changed_names = {self._certificate_name(path) for path in changed_paths}
+            self._entries = {
+                domain: entry
+                for domain, entry in self._entries.items()
+                # a new or removed file may start or stop covering any domain that had no certificate
+                if entry is not None and entry[0] not in changed_names and domain not in changed_names
+            }
+            self._snapshot = snapshot
+            self._generation += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = {}
+            self._snapshot = {}
+            self._generation += 1
+
+    def get(self, domain: str, loader) -> IndexEntry:
+        """
+        Return the indexed entry for domain, calling ``loader(domain)`` to fill it on a miss.
+        """
+        with self._lock:
+            if domain in self._entries:
+                return self._entries[domain]
+            generation = self._generation
+        entry = loader(domain)
+        with self._lock:
+            # don't keep what was loaded while the files changed underneath
+            if generation == self._generation:
+                self._entries[domain] = entry
+        return entry
+
+    def fingerprint(self, file_path: str) -> Union[str, None]:
+        """
+        sha256 of the file content. The file is only read again when its mtime or size changed.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._fingerprints.get(file_path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        try:
+            with open(file_path, "rb") as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return None
+        self._fingerprints[file_path] = (stat_key, digest)
+        return digest
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,5 +1,7 @@
+import os
+import threading
 from datetime import datetime, timezone
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from certapi.client import RenewalManager
 from certapi.crypto import Key, Certificate
@@ -7,6 +9,10 @@ from nginx.Nginx import Nginx
 from nginx_proxy import WebServer
 from nginx_proxy.Host import Host
 from nginx_proxy.certificate_backend import build_certificate_backend
+from nginx_proxy.certificate_scheduler import CertificateIssuanceScheduler
+from nginx_proxy.ocsp_stapling import OcspStapler
+from nginx_proxy.post_processors.certificate_index import CertificateIndex, IndexEntry
+from nginx_proxy.renewal_scheduler import ExpiryRenewalScheduler
 
 
 class SslCertificateProcessor:
@@ -31,48 +37,201 @@ class SslCertificateProcessor:
         self.cert_manager = backend_info.cert_manager
         self.certapi_client = backend_info.certapi_client
         self.challenge_store = backend_info.challenge_store
+        key_store_dirs = [getattr(self.key_store, "certs_dir", None), getattr(self.key_store, "keys_dir", None)]
+        self.cert_index = CertificateIndex([directory for directory in key_store_dirs if isinstance(directory, str)])
+        self.issuance_scheduler = None
+        config = server.config if server is not None else {}
+        self.reload_batch_seconds = float(config.get("cert_reload_batch_seconds", 30) or 0)
+        self._reload_pending = False
+        self._reload_timer: threading.Timer | None = None
+        self._reload_lock = threading.Lock()
+        self._used_fingerprints: dict = {}
+        self._certificates_changed = False
+        if not self.use_certapi_server and self.cert_manager is not None:
+            self.issuance_scheduler = CertificateIssuanceScheduler(
+                self.cert_manager,
+                max_parallel=config.get("cert_issuance_concurrency", 4),
+                max_orders_per_hour=config.get("cert_max_orders_per_hour", 100),
+                max_batch_size=config.get("cert_max_san_per_order", 50),
+                on_batch_issued=self._on_certificates_issued,
+            )
+        # the renewal manager only renews what the scheduler hands it, its own background worker isn't started
         self.renewal_manager = RenewalManager(
-            self.backend,
-            renewal_callback=self.ssl_renewal_callback,
+            self.issuance_scheduler or self.backend,
             renew_threshold_days=max(1, int(self.update_threshold_secs // (24 * 3600))),
             batch_domains=self.certapi_batch_domains,
         )
+        self.renewal_scheduler = ExpiryRenewalScheduler(
+            self.renewal_manager,
+            self._load_index_entry,
+            self.cert_min_renew_threshold_secs,
+            on_renewed=self.ssl_renewal_callback,
+        )
+        self._watched_domains: set = set()
+        self.rsa_key_store = getattr(backend_info, "rsa_key_store", None)
+        self.rsa_renewal_scheduler: ExpiryRenewalScheduler | None = None
+        rsa_backend = getattr(backend_info, "rsa_backend", None)
+        if rsa_backend is not None:
+            if not self.use_certapi_server:
+                # both key types are ordered from the same ACME account and share its order budget
+                rsa_backend = CertificateIssuanceScheduler(
+                    rsa_backend,
+                    max_parallel=config.get("cert_issuance_concurrency", 4),
+                    max_orders_per_hour=config.get("cert_max_orders_per_hour", 100),
+                    max_batch_size=config.get("cert_max_san_per_order", 50),
+                    on_batch_issued=self._on_certificates_issued,
+                    order_budget=self.issuance_scheduler.order_budget if self.issuance_scheduler else None,
+                )
+            self.rsa_renewal_manager = RenewalManager(
+                rsa_backend,
+                renew_threshold_days=max(1, int(self.update_threshold_secs // (24 * 3600))),
+                batch_domains=self.certapi_batch_domains,
+                key_type="rsa",
+            )
+            self.rsa_cert_index = CertificateIndex([self.rsa_key_store.certs_dir, self.rsa_key_store.keys_dir])
+            self.rsa_renewal_scheduler = ExpiryRenewalScheduler(
+                self.rsa_renewal_manager,
+                self._load_rsa_index_entry,
+                self.cert_min_renew_threshold_secs,
+                on_renewed=self.ssl_renewal_callback,
+            )
+        # certificates selected through $ssl_server_name are read during the handshake instead of on reload
+        self.dynamic_certificates = config.get("ssl_certificate_loading", "static") == "dynamic"
+        self.ocsp_stapler: OcspStapler | None = None
+        if (
+            config.get("ssl_ocsp_prefetch", True)
+            and not self.dynamic_certificates
+            and isinstance(getattr(self.key_store, "certs_dir", None), str)
+        ):
+            self.ocsp_stapler = OcspStapler(on_updated=self._on_ocsp_responses_updated)
 
         if start_ssl_thread:
             self.start()
 
     def start(self):
-        self.renewal_manager.start()
+        self.renewal_scheduler.start()
+        if self.rsa_renewal_scheduler is not None:
+            self.rsa_renewal_scheduler.start()
+        if self.ocsp_stapler is not None:
+            self.ocsp_stapler.start()
 
     def ssl_renewal_callback(self):
         print("[SSL] Renewal callback triggered")
-        if self.server is None:
+        self.cert_index.invalidate()
+        if self.rsa_renewal_scheduler is not None:
+            self.rsa_cert_index.invalidate()
+        self._request_certificate_reload("certificate renewal")
+
+    def _on_certificates_issued(self, domains: List[str]):
+        """
+        Called from the issuance workers whenever a batch got its certificate.
+        """
+        print(f"[SSL] Certificate issued for {', '.join(domains)}")
+        self._request_certificate_reload("certificate issued")
+
+    def _on_ocsp_responses_updated(self):
+        # the stapling files keep their names, certificates_changed() forces the reload for the new content
+        self._request_certificate_reload("ocsp response update")
+
+    def _request_certificate_reload(self, event: str):
+        """
+        Renewal callbacks and issued batches arriving within the batching window share one non-forced reload.
+        That reload is only forced when a certificate used by the config changed on disk, see certificates_changed().
+        """
+        with self._reload_lock:
+            if self._reload_pending:
+                return
+            self._reload_pending = True
+            if self.reload_batch_seconds > 0:
+                self._reload_timer = threading.Timer(
+                    self.reload_batch_seconds, self._flush_certificate_reload, args=(event,)
+                )
+                self._reload_timer.daemon = True
+                self._reload_timer.start()
+                return
+        self._flush_certificate_reload(event)
+
+    def _flush_certificate_reload(self, event: str):
+        with self._reload_lock:
+            self._reload_timer = None
+        if self.server is not None:
+            self.server.enqueue_reload(event=event)
+
+    def certificates_changed(self) -> bool:
+        """
+        Whether the content of a certificate used by the rendered config changed since nginx last reloaded.
+        nginx only reads certificates on reload, so such a change needs a reload even if the config is unchanged.
+        The flag stays set until certificates_reloaded() is called after a successful reload.
+        """
+        return self._certificates_changed
+
+    def certificates_reloaded(self):
+        self._certificates_changed = False
+
+    def _track_certificate_fingerprints(self, hosts: List[Host]):
+        certs_dir = getattr(self.key_store, "certs_dir", None)
+        if not isinstance(certs_dir, str):
             return
-        self.server.enqueue_reload(force=True)
+        fingerprints = {}
+        for host in hosts:
+            if host.extras.get("ssl_dynamic_certificate"):
+                # read on each handshake, a changed file doesn't need a reload
+                continue
+            if host.ssl_file not in fingerprints:
+                fingerprints[host.ssl_file] = self.cert_index.fingerprint(
+                    os.path.join(certs_dir, host.ssl_file + ".crt")
+                )
+            for extra in ("ssl_stapling_file", "ssl_rsa_certificate"):
+                file_path = host.extras.get(extra)
+                if file_path is not None and file_path not in fingerprints:
+                    fingerprints[file_path] = self.cert_index.fingerprint(file_path)
+        if any(
+            name in self._used_fingerprints and self._used_fingerprints[name] != fingerprint
+            for name, fingerprint in fingerprints.items()
+        ):
+            self._certificates_changed = True
+        self._used_fingerprints = fingerprints
 
-    def _find_certificate_for_domain(self, domain: str) -> None | Tuple[str, Key, List[Certificate]]:
-        if hasattr(self.key_store, "find_key_and_cert_covering_domain"):
-            result = self.key_store.find_key_and_cert_covering_domain(domain)
+    def _find_certificate_for_domain(
+        self, domain: str, key_store=None
+    ) -> None | Tuple[str, Key, List[Certificate]]:
+        key_store = self.key_store if key_store is None else key_store
+        if hasattr(key_store, "find_key_and_cert_covering_domain"):
+            result = key_store.find_key_and_cert_covering_domain(domain)
             if isinstance(result, tuple) and len(result) == 4:
                 matched_domain, _cert_id, key, certs = result
                 return (matched_domain, key, certs)
-        result = self.key_store.find_key_and_cert_by_domain(domain)
+        result = key_store.find_key_and_cert_by_domain(domain)
         if result is None:
             return None
         return (domain, result[1], result[2])
 
-    def is_certificate_fresh(self, domain: str, threshold_seconds: float | None = None) -> bool:
+    def _load_index_entry(self, domain: str) -> IndexEntry:
         result = self._find_certificate_for_domain(domain)
         if result is None:
+            return None
+        return result[0], result[2][0].not_valid_after_utc
+
+    def _load_rsa_index_entry(self, domain: str) -> IndexEntry:
+        result = self._find_certificate_for_domain(domain, self.rsa_key_store)
+        if result is None:
+            return None
+        return result[0], result[2][0].not_valid_after_utc
+
+    def _indexed_certificate(self, domain: str) -> IndexEntry:
+        return self.cert_index.get(domain, self._load_index_entry)
+
+    def is_certificate_fresh(self, domain: str, threshold_seconds: float | None = None) -> bool:
+        entry = self._indexed_certificate(domain)
+        if entry is None:
             return False
 
-        cert = result[2][0]
-        expiry = cert.not_valid_after_utc
+        expiry = entry[1]
         threshold = self.update_threshold_secs if threshold_seconds is None else threshold_seconds
         return (expiry - datetime.now(timezone.utc)).total_seconds() > threshold
 
     def has_certificate(self, domain: str) -> bool:
-        return self._find_certificate_for_domain(domain) is not None
+        return self._indexed_certificate(domain) is not None
 
     def _prepare_host_for_ssl(self, host: Host):
         """Sets SSL redirect and port if applicable."""
@@ -95,9 +254,9 @@ class SslCertificateProcessor:
             if wildcard is not None and self.is_certificate_fresh(wildcard):
                 return wildcard
 
-        result = self._find_certificate_for_domain(host.hostname)
-        if result is not None:
-            return result[0]
+        entry = self._indexed_certificate(host.hostname)
+        if entry is not None:
+            return entry[0]
 
         wildcard = self.wildcard_domain_name(host.hostname)
         if wildcard is not None and self.has_certificate(wildcard):
@@ -116,12 +275,82 @@ class SslCertificateProcessor:
         for host in secured_hosts:
             self._prepare_host_for_ssl(host)
 
-        secured_domains = sorted({host.hostname for host in secured_hosts})
+        secured_domains = {host.hostname for host in secured_hosts}
         if update_watch_domains:
-            self.renewal_manager.update_watch_domains(secured_domains)
+            # this render picks up everything renewed or issued so far, later ones request a new reload
+            with self._reload_lock:
+                if self._reload_timer is None:
+                    self._reload_pending = False
+            added = secured_domains - self._watched_domains
+            removed = self._watched_domains - secured_domains
+            self._watched_domains = secured_domains
+            if added or removed:
+                self.renewal_scheduler.update(sorted(added), removed)
+                if self.rsa_renewal_scheduler is not None:
+                    # RSA certificates are obtained in the background, hosts are served with ECDSA only until then
+                    self.rsa_renewal_scheduler.update(sorted(added), removed, wait=False)
 
+        # picks up certificates written since the last render, including those issued for newly watched domains
+        self.cert_index.refresh()
         for host in secured_hosts:
             host.ssl_file = self._select_ssl_file(host)
+        if self.rsa_renewal_scheduler is not None:
+            self.rsa_cert_index.refresh()
+            self._apply_rsa_certificates(secured_hosts)
+        if self.dynamic_certificates:
+            for host in secured_hosts:
+                # hosts with an RSA certificate too keep both certificates in their server block
+                if "ssl_rsa_certificate" not in host.extras:
+                    host.extras["ssl_dynamic_certificate"] = True
+        if self.ocsp_stapler is not None:
+            self._apply_stapling_files(secured_hosts, track=update_watch_domains)
+        if update_watch_domains:
+            self._track_certificate_fingerprints(secured_hosts)
+
+    @staticmethod
+    def certificate_map(hosts: List[Host]) -> Tuple[str, Dict[str, str]] | None:
+        """
+        Server name to certificate file mapping for the hosts using dynamic certificate loading, rendered as the
+        ``map $ssl_server_name`` selecting ``ssl_certificate``. Wildcard server names stay wildcard keys of the map.
+        :return: (certificate for clients without a matching SNI name, mapping), or None without such hosts
+        """
+        dynamic_hosts = [host for host in hosts if host.extras.get("ssl_dynamic_certificate")]
+        if not dynamic_hosts:
+            return None
+        # nginx answers handshakes without a known name on the default server, or the first one of the port
+        default_host = next((host for host in dynamic_hosts if host.extras.get("default_server")), dynamic_hosts[0])
+        mapping = {}
+        for host in dynamic_hosts:
+            mapping.setdefault(host.hostname, host.ssl_file)
+        return default_host.ssl_file, mapping
+
+    def _apply_rsa_certificates(self, hosts: List[Host]):
+        """
+        Add the RSA certificate next to the ECDSA one, nginx then picks the certificate matching the client's ciphers.
+        """
+        now = datetime.now(timezone.utc)
+        for host in hosts:
+            if host.ssl_file.endswith(".selfsigned"):
+                continue
+            entry = self.rsa_cert_index.get(host.hostname, self._load_rsa_index_entry)
+            if entry is None or entry[1] <= now:
+                continue
+            host.extras["ssl_rsa_certificate"] = os.path.join(self.rsa_key_store.certs_dir, entry[0] + ".crt")
+            host.extras["ssl_rsa_certificate_key"] = os.path.join(self.rsa_key_store.keys_dir, entry[0] + ".key")
+
+    def _apply_stapling_files(self, hosts: List[Host], track: bool):
+        stapling_files = {}
+        for host in hosts:
+            # nginx would staple the same file for the RSA certificate too, those hosts keep fetching lazily
+            if host.ssl_file.endswith(".selfsigned") or "ssl_rsa_certificate" in host.extras:
+                continue
+            cert_path = os.path.join(self.key_store.certs_dir, host.ssl_file + ".crt")
+            if cert_path not in stapling_files:
+                stapling_files[cert_path] = self.ocsp_stapler.stapling_file(cert_path)
+            if stapling_files[cert_path] is not None:
+                host.extras["ssl_stapling_file"] = stapling_files[cert_path]
+        if track:
+            self.ocsp_stapler.track(stapling_files.keys())
 
     def wildcard_domain_name(self, domain, wild_char="*"):
         slices = domain.split(".")
@@ -130,4 +359,14 @@ class SslCertificateProcessor:
         return None
 
     def shutdown(self):
+        with self._reload_lock:
+            if self._reload_timer is not None:
+                self._reload_timer.cancel()
+                self._reload_timer = None
+        self.renewal_scheduler.stop()
+        if self.rsa_renewal_scheduler is not None:
+            self.rsa_renewal_scheduler.stop()
+            self.rsa_renewal_manager.stop()
+        if self.ocsp_stapler is not None:
+            self.ocsp_stapler.stop()
         self.renewal_manager.stop()
@@ -1,49 +1,265 @@
+import copy
 import hashlib
-from typing import List, Dict, Any
+import math
+import re
+import sys
+from typing import Any, Callable, Dict, List
 
+from nginx_proxy.BackendTarget import BackendTarget
 from nginx_proxy.Host import Host
+from nginx_proxy.upstream_settings import (
+    BALANCE_SETTING,
+    KEEPALIVE_SETTINGS,
+    MAX_CONNS_SETTING,
+    WEIGHT_SETTING,
+    backend_setting,
+    is_valid_setting,
+)
 
 
 class UpstreamProcessor:
+    def __init__(
+        self,
+        keepalive: int = 0,
+        keepalive_requests: int = None,
+        keepalive_timeout: str = None,
+        cpu_weights: bool = True,
+        max_fails: int = None,
+        fail_timeout: str = None,
+        is_down: Callable[[BackendTarget], bool] | None = None,
+        topology=None,
+    ):
+        """
+        :param keepalive: idle connections each worker keeps open per upstream, 0 proxies single backends directly
+        :param keepalive_requests: requests served through one upstream connection before it is closed
+        :param keepalive_timeout: how long an idle upstream connection is kept open
+        :param cpu_weights: weight the servers of an upstream by the CPU limits of their backends
+        :param max_fails: failed attempts within fail_timeout after which a server is skipped for fail_timeout,
+            for backends that don't set NGINX_UPSTREAM_MAX_FAILS
+        :param fail_timeout: default for backends that don't set NGINX_UPSTREAM_FAIL_TIMEOUT
+        :param is_down: whether a backend fails its active health check, it's then rendered as down
+        :param topology: SwarmTopology ranking the tasks of services by proximity to this proxy
+        """
+        self.is_down = is_down
+        self.topology = topology
+        self.cpu_weights = cpu_weights
+        self.max_fails = None if max_fails is None else str(max_fails)
+        self.fail_timeout = str(fail_timeout) if fail_timeout else None
+        self.defaults = {
+            "keepalive": str(keepalive or 0),
+            "keepalive_requests": str(keepalive_requests) if keepalive_requests else None,
+            "keepalive_timeout": str(keepalive_timeout) if keepalive_timeout else None,
+        }
+
     def process(self, hosts: List[Host], prefer_local: bool = False) -> List[Dict[str, Any]]:
         global_upstreams = {}
+        upstream_keys = {}  # upstream id -> backend key, to keep ids unique
+        hosts = sorted(hosts, key=lambda h: (str(h.hostname), int(h.port)))
 
         for host in hosts:
-            for i, location in enumerate(host.locations.values()):
-                if len(location.backends) > 1:
+            for path, location in host.locations.items():
+                backends = sorted(filter(self._is_proxied, location.backends), key=lambda b: b.sort_key())
+                keepalive = self._keepalive_settings(backends)
+                has_tasks = any(b.tasks for b in backends)
+                if len(backends) > 1 or has_tasks or (backends and keepalive["keepalive"] != "0"):
                     local_service_ids = self._local_service_ids(location.backends)
-                    for backend in location.backends:
+                    for backend in backends:
                         backend.backup = prefer_local and backend.type == "service" and backend.id in local_service_ids
+                        backend.weight = backend_setting(backend, WEIGHT_SETTING)
+                        backend.max_conns = backend_setting(backend, MAX_CONNS_SETTING)
+                    if has_tasks:
+                        backends = sorted(
+                            self._expand_tasks(backends, without_backup=self._requires_no_backup(backends)),
+                            key=lambda b: b.sort_key(),
+                        )
+                    if self.cpu_weights:
+                        self._apply_cpu_weights(backends)
+                    self._apply_down(backends)
                     if prefer_local and local_service_ids:
                         self._align_service_backup_ports(location.backends)
 
-                    backend_key = tuple(
-                        sorted([(str(b.address), str(b.port), bool(b.backup)) for b in location.backends])
-                    )
+                    backend_key = tuple(sorted([(str(b.address), str(b.port), bool(b.backup)) for b in backends]))
                     if backend_key in global_upstreams:
                         location.upstream = global_upstreams[backend_key]["id"]
                     else:
-                        upstream_id = (
-                            host.hostname.strip()
-                            + "_"
-                            + hashlib.sha1(str(backend_key).encode("utf-8")).hexdigest()[:12]
-                        )
+                        upstream_id = self._unique_upstream_id(host, path, backends, backend_key, upstream_keys)
                         sticky_value = None
-                        if not any(b.backup for b in location.backends):
-                            sticky_value = self._sticky_value(location.backends)
+                        balance = None
+                        if len(backends) > 1:
+                            has_backup = any(b.backup for b in backends)
+                            if not has_backup:
+                                sticky_value = self._sticky_value(backends)
+                            balance = self._balance_method(upstream_id, backends)
+                            # session affinity wins, and nginx allows backup servers only with least_conn
+                            if sticky_value or (has_backup and balance != "least_conn"):
+                                balance = None
 
                         global_upstreams[backend_key] = {
                             "id": upstream_id,
-                            "containers": location.backends,
+                            "hostname": host.hostname,
+                            "containers": backends,
                             "sticky": sticky_value,
+                            "balance": balance,
+                            "max_fails": self.max_fails,
+                            "fail_timeout": self.fail_timeout,
+                            **(keepalive if keepalive["keepalive"] != "0" else {}),
                         }
                         location.upstream = upstream_id
                 else:
                     for backend in location.backends:
                         backend.backup = False
+                        backend.weight = None
+                        backend.max_conns = None
+                        backend.down = False
                     location.upstream = False
 
-        return list(global_upstreams.values())
+        return sorted(global_upstreams.values(), key=lambda upstream: upstream["id"])
+
+    @staticmethod
+    def upstream_id(hostname: str, identity: str) -> str:
+        """
+        Upstreams are named after the first host (in sorted order) referencing them and the service or location
+        they serve, not after their servers. Scaling a backend then only changes the server lines of its upstream.
+        """
+        prefix = re.sub(r"[^A-Za-z0-9.-]", "_", str(hostname))
+        return prefix + "_" + hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12]
+
+    def _unique_upstream_id(self, host: Host, path: str, backends, backend_key, upstream_keys) -> str:
+        """
+        Id of the service the backends belong to, or of the location when another backend set of the same host
+        already uses that, e.g. a service proxied on two ports.
+        """
+        service_identity = self._service_identity(backends)
+        if service_identity is not None:
+            upstream_id = self.upstream_id(host.hostname, service_identity)
+            if upstream_keys.setdefault(upstream_id, backend_key) == backend_key:
+                return upstream_id
+        upstream_id = self.upstream_id(host.hostname, f"location:{host.port}{path}")
+        upstream_keys[upstream_id] = backend_key
+        return upstream_id
+
+    @staticmethod
+    def _service_identity(backends) -> str | None:
+        """
+        The Swarm or Compose service all backends belong to, None if they don't share one.
+        """
+        identities = set()
+        for backend in backends:
+            labels = backend.labels or {}
+            if backend.type == "service":
+                identities.add("swarm:" + str(backend.id))
+            elif labels.get("com.docker.swarm.service.id"):
+                identities.add("swarm:" + labels["com.docker.swarm.service.id"])
+            elif labels.get("com.docker.compose.service"):
+                project = labels.get("com.docker.compose.project", "")
+                identities.add(f"compose:{project}/{labels['com.docker.compose.service']}")
+            else:
+                return None
+        return "service:" + identities.pop() if len(identities) == 1 else None
+
+    def _expand_tasks(self, backends, without_backup: bool = False) -> List[BackendTarget]:
+        """
+        Replace the VIP of services by their task IPs. Only the closest tasks (same node, then same zone) take
+        regular traffic, the other tasks and the VIP, unless it's a dnsrr service without one, become backup
+        servers. Tasks already registered as local containers are left to them.
+        :param without_backup: route to all tasks and leave the VIP out, for balancing methods nginx doesn't
+            allow backup servers with
+        """
+        addresses = {str(b.address) for b in backends if not b.tasks}
+        expanded = []
+        for backend in backends:
+            tasks = [task for task in backend.tasks or [] if task.address not in addresses]
+            if not tasks:
+                if backend.address:
+                    expanded.append(backend)
+                continue
+            ranks = [self.topology.proximity(task) if self.topology is not None else 0 for task in tasks]
+            for task, rank in zip(tasks, ranks):
+                task_backend = copy.copy(backend)
+                task_backend.id = task.id
+                task_backend.address = task.address
+                task_backend.type = "task"
+                task_backend.labels = {**backend.labels, "com.docker.swarm.service.id": backend.id}
+                task_backend.tasks = None
+                task_backend.backup = backend.backup or (rank > min(ranks) and not without_backup)
+                expanded.append(task_backend)
+            if backend.address and not without_backup:
+                backend.backup = True
+                expanded.append(backend)
+        return expanded
+
+    @staticmethod
+    def _is_proxied(backend: BackendTarget) -> bool:
+        """
+        Static sites are served by nginx itself, they have no server to put in an upstream.
+        """
+        return backend.type != "static_site" and (backend.address is not None or bool(backend.tasks))
+
+    def _keepalive_settings(self, backends) -> Dict[str, str | None]:
+        """
+        Keepalive settings of an upstream, the first backend setting a value in its env or labels wins.
+        """
+        settings = dict(self.defaults)
+        for name, key in KEEPALIVE_SETTINGS.items():
+            value = next((v for v in (backend_setting(b, key) for b in backends) if v is not None), None)
+            if value is not None:
+                settings[name] = value
+        return settings
+
+    def _apply_down(self, backends):
+        """
+        Mark the backends failing their health check as down, unless that would leave no server of the upstream up.
+        nginx then still tries them, failing open instead of answering every request with an error.
+        """
+        down = [self.is_down is not None and self.is_down(backend) for backend in backends]
+        all_down = all(down)
+        for backend, is_down in zip(backends, down):
+            backend.down = is_down and not all_down
+
+    @staticmethod
+    def _apply_cpu_weights(backends):
+        """
+        Spread requests in proportion to the CPU limits of the backends, in steps of 0.1 CPU. Only applied when every
+        non-backup backend has a limit and they differ. A backend setting NGINX_UPSTREAM_WEIGHT keeps its own weight.
+        """
+        primary = [b for b in backends if not b.backup]
+        limits = [b.cpu_limit for b in primary]
+        if len(primary) < 2 or None in limits or len(set(limits)) == 1:
+            return
+        tenths = [max(1, round(limit * 10)) for limit in limits]
+        divisor = math.gcd(*tenths)
+        for backend, weight in zip(primary, tenths):
+            if backend.weight is None:
+                backend.weight = str(weight // divisor)
+
+    @staticmethod
+    def _balance_method(upstream_id: str, backends) -> str | None:
+        """
+        Balancing method set on the backends, the first one wins when they disagree.
+        """
+        methods = list(dict.fromkeys(v for v in (backend_setting(b, BALANCE_SETTING) for b in backends) if v))
+        if not methods:
+            return None
+        if len(methods) > 1:
+            print(
+                f"[WARN] Conflicting {BALANCE_SETTING} in {upstream_id}: {', '.join(methods)}, using {methods[0]}",
+                file=sys.stderr,
+            )
+        return None if methods[0] == "round_robin" else methods[0]
+
+    @staticmethod
+    def _requires_no_backup(backends) -> bool:
+        """
+        Whether the backends ask for session affinity or a hash or random balancing method. nginx only allows backup
+        servers with round robin and least_conn, these settings would otherwise be dropped.
+        """
+        if UpstreamProcessor._sticky_value(backends) is not None:
+            return True
+        for backend in backends:
+            method = BackendTarget.get_setting(backend, BALANCE_SETTING)
+            if method and method not in ("round_robin", "least_conn") and is_valid_setting(BALANCE_SETTING, method):
+                return True
+        return False
 
     @staticmethod
     def _sticky_value(backends):
@@ -3,6 +3,14 @@ import re
 from nginx import Url
 from nginx_proxy import Host, ProxyConfigData
 from nginx_proxy.BackendTarget import BackendTarget, InvalidHostConfiguration, NoHostConfiguration, UnreachableNetwork
+from nginx_proxy.upstream_settings import (
+    FAIL_TIMEOUT_SETTING,
+    MAX_FAILS_SETTING,
+    NEXT_UPSTREAM_SETTING,
+    NEXT_UPSTREAM_TIMEOUT_SETTING,
+    NEXT_UPSTREAM_TRIES_SETTING,
+    backend_setting,
+)
 from nginx_proxy.utils import split_url
 
 
@@ -36,6 +44,34 @@ def _validate_external_host(host: Host):
         raise InvalidHostConfiguration(host.hostname, "certificate hostnames must be 64 characters or fewer")
 
 
+# backend env or label -> upstream server parameter
+_SERVER_HEALTH_SETTINGS = {
+    MAX_FAILS_SETTING: "max_fails",
+    FAIL_TIMEOUT_SETTING: "fail_timeout",
+}
+# backend env or label -> location directive
+_RETRY_SETTINGS = {
+    NEXT_UPSTREAM_SETTING: "proxy_next_upstream",
+    NEXT_UPSTREAM_TRIES_SETTING: "proxy_next_upstream_tries",
+    NEXT_UPSTREAM_TIMEOUT_SETTING: "proxy_next_upstream_timeout",
+}
+
+
+def _health_settings(backend: BackendTarget):
+    """
+    Passive health parameters of the backend's upstream server and retry policy of its locations.
+    Invalid values are logged and ignored, like the other upstream settings.
+    :return: (server parameters, location directives)
+    """
+    settings = ({}, {})
+    for target, names in zip(settings, (_SERVER_HEALTH_SETTINGS, _RETRY_SETTINGS)):
+        for key, name in names.items():
+            value = backend_setting(backend, key)
+            if value is not None:
+                target[name] = value
+    return settings
+
+
 def _backend_log_identity(backend: BackendTarget) -> str:
     if backend.type == "service":
         return "Service Id: " + backend.id[:12]
@@ -133,6 +169,15 @@ def process_virtual_hosts(backend: BackendTarget, known_networks: set) -> ProxyC
     return hosts
 
 
+def _apply_health_settings(container_data: BackendTarget, extras: dict, settings):
+    server_settings, location_directives = settings
+    container_data.max_fails = server_settings.get("max_fails")
+    container_data.fail_timeout = server_settings.get("fail_timeout")
+    for directive, value in location_directives.items():
+        # directives given in VIRTUAL_HOST itself take precedence
+        extras.setdefault(directive, value)
+
+
 def _parse_host_entry(entry_string: str):
     """
 
@@ -191,9 +236,11 @@ def host_generator(backend: BackendTarget, known_networks: set = {}):
         labels=backend.labels,
         backend_type=backend.type,
         backup=backend.backup,
+        cpu_limit=backend.cpu_limit,
     )
 
     found_ip = None
+    found_network = None
 
     if hasattr(backend, "network_settings") and backend.network_settings:
         for name, detail in backend.network_settings.items():
@@ -202,9 +249,21 @@ def host_generator(backend: BackendTarget, known_networks: set = {}):
                 found_ip = _normalize_address(detail.get("IPAddress"))
                 # if detail["Aliases"] is not None: ...
                 if found_ip:
+                    found_network = detail.get("NetworkID")
                     break
 
-    if not found_ip:
+    if not found_ip and backend.tasks:
+        # without a VIP (dnsrr endpoint mode) the tasks are proxied to directly
+        found_network = next(
+            (
+                network
+                for network in target_base.networks
+                if network in known_networks and any(task.addresses.get(network) for task in backend.tasks)
+            ),
+            None,
+        )
+
+    if not found_ip and found_network is None:
         # If checking against known networks failed or no common network
         has_known_network = any(network in known_networks for network in target_base.networks)
         raise UnreachableNetwork(
@@ -231,6 +290,8 @@ def host_generator(backend: BackendTarget, known_networks: set = {}):
         container_data.labels = backend.labels
         container_data.type = backend.type
         container_data.backup = backend.backup
+        container_data.cpu_limit = backend.cpu_limit
+        _apply_health_settings(container_data, extras, _health_settings(backend))
         host.secured = "https" in host.scheme or "wss" in host.scheme or host.port == 443
         if host.port is None:
             host.port = 443 if host.secured else 80
@@ -253,12 +314,20 @@ def host_generator(backend: BackendTarget, known_networks: set = {}):
         if location and not location.endswith("/") and container_data.path and container_data.path.endswith("/"):
             location = location + "/"
         container_data.address = found_ip
+        if backend.tasks:
+            container_data.tasks = [
+                task._replace(address=task.addresses[found_network])
+                for task in backend.tasks
+                if task.addresses.get(found_network)
+            ]
         container_data.id = backend.id
         container_data.name = backend.name
         container_data.env = backend.env
         container_data.labels = backend.labels
         container_data.type = backend.type
         container_data.backup = backend.backup
+        container_data.cpu_limit = backend.cpu_limit
+        _apply_health_settings(container_data, extras, _health_settings(backend))
 
         if container_data.port is None:
             if override_port:
@@ -0,0 +1,73 @@
+import socket
+import ssl
+from typing import Iterable, List, NamedTuple
+
+from nginx_proxy.BackendTarget import BackendTarget, InvalidHostConfiguration, NoHostConfiguration, UnreachableNetwork
+from nginx_proxy.health_checker import host_header
+from nginx_proxy.pre_processors.virtual_host_processor import host_generator
+
+PATH_SETTING = "NGINX_START_PROBE_PATH"
+
+
+class ProbeTarget(NamedTuple):
+    address: str
+    port: int
+    secure: bool
+    path: str | None
+    host: str | None = None  # Host header of the probe, the virtual host the backend serves
+
+    def __str__(self):
+        return f"{self.address}:{self.port}{self.path or ''}"
+
+
+def probe_targets(backend: BackendTarget, known_networks: Iterable[str]) -> List[ProbeTarget]:
+    """
+    The address:port pairs nginx would proxy to for this backend, as resolved by host_generator.
+    Destinations of STATIC_VIRTUAL_HOST entries are not the backend itself and are left out.
+    :return: empty list when the backend can't be registered, so there is nothing to wait for
+    """
+    network_settings = getattr(backend, "network_settings", None) or {}
+    own_addresses = {(detail.get("IPAddress") or "").strip() for detail in network_settings.values()}
+    path = BackendTarget.get_setting(backend, PATH_SETTING)
+    if path and not path.startswith("/"):
+        path = "/" + path
+    targets = {}
+    try:
+        for host, _location, target, _extras in host_generator(backend, known_networks=set(known_networks)):
+            if target.address not in own_addresses:
+                continue
+            secure = bool(target.scheme) and ("https" in target.scheme or "wss" in target.scheme)
+            probe_target = ProbeTarget(target.address, int(target.port), secure, path, host_header(host.hostname))
+            targets.setdefault((probe_target.address, probe_target.port), probe_target)
+    except (NoHostConfiguration, UnreachableNetwork, InvalidHostConfiguration):
+        return []
+    return list(targets.values())
+
+
+def is_ready(target: ProbeTarget, timeout: float = 1) -> bool:
+    """
+    Whether the target accepts connections, or answers its path with a status below 500 when one is set.
+    """
+    try:
+        sock = socket.create_connection((target.address, target.port), timeout=timeout)
+        try:
+            if not target.path:
+                return True
+            if target.secure:
+                context = ssl.create_default_context()
+                # backends are addressed by IP, their certificates can't be verified against it
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                sock = context.wrap_socket(sock)
+            sock.sendall(
+                f"GET {target.path} HTTP/1.1\r\nHost: {target.host or target.address}\r\n"
+                "User-Agent: nginx-proxy-start-probe\r\nConnection: close\r\n\r\n".encode()
+            )
+            status_line = sock.makefile("rb").readline().decode("latin-1").split()
+        finally:
+            sock.close()
+    except (OSError, ValueError):
+        return False
+    if len(status_line) < 2 or not status_line[0].startswith("HTTP/") or not status_line[1].isdigit():
+        return False
+    return int(status_line[1]) < 500
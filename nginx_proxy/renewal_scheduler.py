@@ -0,0 +1,169 @@
+import heapq
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+# (matched certificate name, expiry) or None when no certificate covers the domain
+CertificateLookup = Callable[[str], Union[Tuple[str, datetime], None]]
+
+
+class ExpiryRenewalScheduler:
+    """
+    Keeps the watched domains in a min-heap ordered by renewal time (certificate expiry minus the renewal threshold)
+    and sleeps until the first one is due. The render path only reports added and removed domains, so keeping a large
+    watch list in sync doesn't look at every certificate on each reload.
+
+    The renewal itself, including the self-signed fallback for new domains, is left to certapi's ``RenewalManager``,
+    which is only ever given the domains that are due.
+    """
+
+    def __init__(
+        self,
+        renewal_manager,
+        lookup: CertificateLookup,
+        threshold_seconds: float,
+        on_renewed: Callable[[], None] | None = None,
+        missing_retry_seconds: float = 180,
+        renew_retry_seconds: float = 24 * 3600,
+        max_sleep_seconds: float = 24 * 3600,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.renewal_manager = renewal_manager
+        self.lookup = lookup
+        self.threshold_seconds = threshold_seconds
+        self.on_renewed = on_renewed
+        self.missing_retry_seconds = missing_retry_seconds
+        self.renew_retry_seconds = renew_retry_seconds
+        self.max_sleep_seconds = max_sleep_seconds
+        self.clock = clock
+        self._watched: Set[str] = set()
+        # domain -> renewal time of its live heap entry, entries not matching it are stale and skipped when popped
+        self._due: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+        self._renew_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+    def __len__(self):
+        return len(self._watched)
+
+    def next_renewal_time(self) -> float | None:
+        with self._condition:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def update(self, added: Iterable[str], removed: Iterable[str], wait: bool = True) -> List[str]:
+        """
+        Apply watch list changes. With ``wait``, added domains that are already due are renewed before returning, so
+        that the render that added them can use their certificates. Otherwise they are left to the worker.
+        :return: the added domains that were renewed
+        """
+        with self._condition:
+            for domain in removed:
+                self._watched.discard(domain)
+                self._due.pop(domain, None)
+            added = [domain for domain in added if domain and domain not in self._watched]
+            self._watched.update(added)
+
+        now = self.clock()
+        due_now = []
+        for domain in added:
+            renewal_time = self._renewal_time(domain)
+            if renewal_time <= now and wait:
+                due_now.append(domain)
+            else:
+                with self._condition:
+                    self._schedule(domain, renewal_time)
+        if due_now:
+            self._renew(sorted(due_now))
+        with self._condition:
+            self._condition.notify_all()
+        return due_now
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="nginx-proxy-renewal", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread is not threading.current_thread() and thread.is_alive():
+            thread.join(timeout=2)
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def _renewal_time(self, domain: str) -> float:
+        entry = self.lookup(domain)
+        if entry is None:
+            return 0
+        return entry[1].timestamp() - self.threshold_seconds
+
+    def _schedule(self, domain: str, renewal_time: float):
+        # caller holds the condition
+        self._due[domain] = renewal_time
+        heapq.heappush(self._heap, (renewal_time, domain))
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: float) -> List[str]:
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, domain = heapq.heappop(self._heap)
+            del self._due[domain]
+            due.append(domain)
+            self._drop_stale()
+        return due
+
+    def _renew(self, domains: List[str]):
+        with self._renew_lock:
+            try:
+                self.renewal_manager.update_watch_domains(domains)
+            except Exception as e:
+                print(f"[SSL] Renewal failed for {', '.join(domains)}: {e}", file=sys.stderr)
+
+        now = self.clock()
+        for domain in domains:
+            entry = self.lookup(domain)
+            renewal_time = 0 if entry is None else entry[1].timestamp() - self.threshold_seconds
+            if renewal_time <= now:
+                # still not renewed, the renewal manager keeps the existing or self-signed certificate meanwhile
+                renewal_time = now + (self.missing_retry_seconds if entry is None else self.renew_retry_seconds)
+            with self._condition:
+                if domain in self._watched:
+                    self._schedule(domain, renewal_time)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    now = self.clock()
+                    due = self._pop_due(now)
+                    if due:
+                        break
+                    wait_seconds = self.max_sleep_seconds
+                    if self._heap:
+                        wait_seconds = min(wait_seconds, self._heap[0][0] - now)
+                    self._condition.wait(wait_seconds)
+            print(f"[SSL] Renewing {len(due)} due certificate(s)")
+            self._renew(sorted(due))
+            if self.on_renewed is not None:
+                try:
+                    self.on_renewed()
+                except Exception as e:
+                    print(f"[SSL] Renewal callback failed: {e}", file=sys.stderr)
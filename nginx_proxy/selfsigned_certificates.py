@@ -0,0 +1,119 @@
+import grp
+import ipaddress
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple, Union
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from nginx.Nginx import write_file
+
+# (hostname, certificate path, key path)
+PlaceholderJob = Tuple[str, str, str]
+
+# group of the nginx worker processes, see `user` in vhosts_template/nginx.conf
+WORKER_GROUP = "nginx"
+
+
+def _subject_alternative_name(hostname: str) -> x509.GeneralName:
+    try:
+        return x509.IPAddress(ipaddress.ip_address(hostname))
+    except ValueError:
+        return x509.DNSName(hostname)
+
+
+def generate_selfsigned(hostnames: List[str], days: int = 30) -> Tuple[bytes, bytes]:
+    """
+    Create a self-signed placeholder certificate covering all hostnames, with an EC P-256 key.
+    :return: (certificate pem, key pem)
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    # CN is limited to 64 characters, the SAN list is what clients actually check
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostnames[0][:64])])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName([_subject_alternative_name(h) for h in hostnames]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+    )
+    return cert.public_bytes(serialization.Encoding.PEM), key_pem
+
+
+def worker_group_id(group: str = WORKER_GROUP) -> Union[int, None]:
+    try:
+        return grp.getgrnam(group).gr_gid
+    except KeyError:
+        print(f"[WARN] Group '{group}' not found, private keys stay readable by their owner only", file=sys.stderr)
+        return None
+
+
+def share_key_with_group(key_path: str, key_group: int):
+    """
+    Make an existing private key readable by key_group, for keys the nginx worker loads during the handshake.
+    """
+    stat = os.stat(key_path)
+    if stat.st_gid != key_group:
+        os.chown(key_path, -1, key_group)
+    if stat.st_mode & 0o777 != 0o640:
+        os.chmod(key_path, 0o640)
+
+
+def _write_placeholder(
+    cert_path: str, key_path: str, cert_pem: bytes, key_pem: bytes, key_group: Union[int, None] = None
+):
+    if key_group is None:
+        write_file(key_path, key_pem.decode("ascii"), mode=0o600)
+    else:
+        write_file(key_path, key_pem.decode("ascii"), mode=0o640)
+        os.chown(key_path, -1, key_group)
+    write_file(cert_path, cert_pem.decode("ascii"))
+
+
+def _create_placeholder(job: PlaceholderJob, days: int, key_group: Union[int, None] = None):
+    hostname, cert_path, key_path = job
+    cert_pem, key_pem = generate_selfsigned([hostname], days)
+    _write_placeholder(cert_path, key_path, cert_pem, key_pem, key_group)
+
+
+def create_selfsigned_placeholders(
+    jobs: List[PlaceholderJob],
+    shared: bool = False,
+    max_workers: int = 4,
+    days: int = 30,
+    key_group: Union[int, None] = None,
+) -> None:
+    """
+    Create the placeholder certificate files of all jobs in one batch.
+    With shared=True a single multi-SAN certificate and key is generated and written for every job,
+    otherwise each host gets its own key, generated in a thread pool.
+    :param key_group: group allowed to read the keys (mode 0640), otherwise they are only readable by their owner
+    """
+    if not jobs:
+        return
+    if shared:
+        cert_pem, key_pem = generate_selfsigned(sorted({hostname for hostname, _, _ in jobs}), days)
+        for _, cert_path, key_path in jobs:
+            _write_placeholder(cert_path, key_path, cert_pem, key_pem, key_group)
+        return
+    if len(jobs) == 1 or max_workers < 2:
+        for job in jobs:
+            _create_placeholder(job, days, key_group)
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        # list() re-raises the first failure
+        list(executor.map(lambda job: _create_placeholder(job, days, key_group), jobs))
@@ -0,0 +1,101 @@
+import math
+import os
+import re
+import sys
+import time
+from typing import Callable, List
+
+# 80 byte keys select AES256 for ticket encryption
+TICKET_KEY_SIZE = 80
+# nginx stores about 4000 sessions in one megabyte of ssl_session_cache
+SESSIONS_PER_MEGABYTE = 4000
+DEFAULT_SESSION_CACHE_SIZE = "50m"
+
+_KEY_FILE = re.compile(r"ticket-(\d+)\.key")
+
+
+def session_cache_size(expected_sessions: int) -> str:
+    """
+    Size for ``ssl_session_cache`` able to hold the expected number of sessions, or the default size when unknown.
+    """
+    if expected_sessions <= 0:
+        return DEFAULT_SESSION_CACHE_SIZE
+    return f"{max(1, math.ceil(expected_sessions / SESSIONS_PER_MEGABYTE))}m"
+
+
+class SessionTicketKeys:
+    """
+    Manages the key files for ``ssl_session_ticket_key``.
+    A key is named after the rotation period it was created for, ``ticket-<period>.key``, and is created exclusively,
+    so proxies sharing the directory end up with the same key for each period. nginx encrypts tickets with the first
+    configured key and only decrypts with the others, so the ``retain`` previous keys keep tickets issued before a
+    rotation valid. The key of the next period is published one period early as a decrypt-only key, so replicas whose
+    clocks or reloads are slightly behind accept tickets issued by those that already rotated.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        rotation_seconds: float = 12 * 3600,
+        retain: int = 2,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.directory = directory
+        self.rotation_seconds = max(60.0, float(rotation_seconds))
+        self.retain = max(0, int(retain))
+        self.clock = clock
+
+    def current_period(self) -> int:
+        return int(self.clock() // self.rotation_seconds)
+
+    def seconds_until_rotation(self) -> float:
+        return (self.current_period() + 1) * self.rotation_seconds - self.clock()
+
+    def key_path(self, period: int) -> str:
+        return os.path.join(self.directory, f"ticket-{period}.key")
+
+    def ensure_keys(self) -> List[str]:
+        """
+        Create the keys of the current and the next period if no proxy did yet, and remove keys that are no longer
+        retained.
+        :return: paths of the keys to configure, the current one first, then the next one and the previous ones
+        """
+        period = self.current_period()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._create_key(period)
+        self._create_key(period + 1)
+        self._remove_keys_before(period - self.retain)
+        periods = [period, period + 1] + list(range(period - 1, period - self.retain - 1, -1))
+        return [self.key_path(p) for p in periods if os.path.exists(self.key_path(p))]
+
+    def _create_key(self, period: int):
+        path = self.key_path(period)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(TICKET_KEY_SIZE))
+            # link fails if another proxy created the key meanwhile, the existing key wins
+            os.link(tmp_path, path)
+            print(f"[SSL] Created session ticket key {os.path.basename(path)}")
+        except FileExistsError:
+            pass
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _remove_keys_before(self, oldest_period: int):
+        for name in os.listdir(self.directory):
+            match = _KEY_FILE.fullmatch(name)
+            if match is None or int(match.group(1)) >= oldest_period:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[WARN] Could not remove old session ticket key {name}: {e}", file=sys.stderr)
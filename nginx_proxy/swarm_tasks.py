@@ -0,0 +1,74 @@
+import sys
+from typing import Dict, List, NamedTuple
+
+from docker import DockerClient
+
+
+class SwarmTask(NamedTuple):
+    id: str
+    node_id: str | None
+    zone: str | None
+    addresses: Dict[str, str]  # network id -> task IP on that network
+    address: str | None = None  # the address proxied to, set by host_generator
+
+
+class SwarmTopology:
+    """
+    Running tasks of Swarm services with the node and zone they run on, so nginx can route to task IPs directly
+    instead of through the IPVS service VIP, preferring tasks close to this proxy.
+    """
+
+    def __init__(self, swarm_client: DockerClient, docker_client: DockerClient | None = None, zone_label="zone"):
+        self.swarm_client = swarm_client
+        self.docker_client = docker_client if docker_client is not None else swarm_client
+        self.zone_label = zone_label
+        self.node_id: str | None = None
+        self.zone: str | None = None
+        self.node_zones: Dict[str, str | None] = {}
+
+    def refresh_nodes(self):
+        """
+        Read the node this proxy runs on and the zone label of every node.
+        """
+        try:
+            self.node_id = self.docker_client.info().get("Swarm", {}).get("NodeID") or None
+            self.node_zones = {
+                node.id: ((node.attrs.get("Spec") or {}).get("Labels") or {}).get(self.zone_label)
+                for node in self.swarm_client.nodes.list()
+            }
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            print(f"[WARN] Could not read Swarm nodes: {e}", file=sys.stderr)
+        self.zone = self.node_zones.get(self.node_id)
+
+    def service_tasks(self, service) -> List[SwarmTask]:
+        running = [
+            task
+            for task in service.tasks(filters={"desired-state": "running"})
+            if (task.get("Status") or {}).get("State") == "running"
+        ]
+        if any(task.get("NodeID") not in self.node_zones for task in running):
+            # a node joined since the last rescan
+            self.refresh_nodes()
+        tasks = []
+        for task in running:
+            addresses = {}
+            for attachment in task.get("NetworksAttachments") or []:
+                network_id = (attachment.get("Network") or {}).get("ID")
+                for address in attachment.get("Addresses") or []:
+                    if network_id and address:
+                        addresses.setdefault(network_id, address.split("/")[0])
+            node_id = task.get("NodeID")
+            tasks.append(SwarmTask(task["ID"], node_id, self.node_zones.get(node_id), addresses))
+        return sorted(tasks)
+
+    def proximity(self, task: SwarmTask) -> int:
+        """
+        0 for tasks on this node, 1 in the same zone, 2 for all others.
+        """
+        if self.node_id is not None and task.node_id == self.node_id:
+            return 0
+        if self.zone is not None and task.zone == self.zone:
+            return 1
+        return 2
@@ -0,0 +1,56 @@
+import re
+import sys
+
+from nginx_proxy.BackendTarget import BackendTarget
+
+# per backend settings, read from the container env or labels
+KEEPALIVE_SETTINGS = {
+    "keepalive": "NGINX_UPSTREAM_KEEPALIVE",
+    "keepalive_requests": "NGINX_UPSTREAM_KEEPALIVE_REQUESTS",
+    "keepalive_timeout": "NGINX_UPSTREAM_KEEPALIVE_TIMEOUT",
+}
+BALANCE_SETTING = "NGINX_UPSTREAM_BALANCE"
+WEIGHT_SETTING = "NGINX_UPSTREAM_WEIGHT"
+MAX_CONNS_SETTING = "NGINX_UPSTREAM_MAX_CONNS"
+# passive health checks of the upstream server and retries of the locations, applied by virtual_host_processor
+MAX_FAILS_SETTING = "NGINX_UPSTREAM_MAX_FAILS"
+FAIL_TIMEOUT_SETTING = "NGINX_UPSTREAM_FAIL_TIMEOUT"
+NEXT_UPSTREAM_SETTING = "NGINX_PROXY_NEXT_UPSTREAM"
+NEXT_UPSTREAM_TRIES_SETTING = "NGINX_PROXY_NEXT_UPSTREAM_TRIES"
+NEXT_UPSTREAM_TIMEOUT_SETTING = "NGINX_PROXY_NEXT_UPSTREAM_TIMEOUT"
+
+_TIME = r"\d+(ms|s|m|h|d)?"
+_NEXT_UPSTREAM_CONDITION = r"(error|timeout|invalid_header|http_50[0234]|http_40[34]|http_429|non_idempotent)"
+_SETTING_PATTERNS = {
+    "NGINX_UPSTREAM_KEEPALIVE": re.compile(r"\d+"),
+    "NGINX_UPSTREAM_KEEPALIVE_REQUESTS": re.compile(r"[1-9]\d*"),
+    "NGINX_UPSTREAM_KEEPALIVE_TIMEOUT": re.compile(_TIME),
+    BALANCE_SETTING: re.compile(
+        r"round_robin|least_conn|ip_hash|random( two( least_conn)?)?|hash [^\s;{}'\"]+( consistent)?"
+    ),
+    WEIGHT_SETTING: re.compile(r"[1-9]\d*"),
+    MAX_CONNS_SETTING: re.compile(r"\d+"),
+    MAX_FAILS_SETTING: re.compile(r"\d+"),
+    FAIL_TIMEOUT_SETTING: re.compile(_TIME),
+    NEXT_UPSTREAM_SETTING: re.compile(rf"off|{_NEXT_UPSTREAM_CONDITION}(\s+{_NEXT_UPSTREAM_CONDITION})*"),
+    NEXT_UPSTREAM_TRIES_SETTING: re.compile(r"\d+"),
+    NEXT_UPSTREAM_TIMEOUT_SETTING: re.compile(_TIME),
+}
+
+
+def is_valid_setting(key: str, value: str) -> bool:
+    return _SETTING_PATTERNS[key].fullmatch(value) is not None
+
+
+def backend_setting(backend, key: str) -> str | None:
+    """
+    Value of an upstream setting of the backend, the env wins over a label of the same name.
+    Invalid values are logged and ignored.
+    """
+    value = BackendTarget.get_setting(backend, key)
+    if value is None:
+        return None
+    if not is_valid_setting(key, value):
+        print(f"[WARN] Ignoring invalid {key}={value} on {backend.name or backend.id}", file=sys.stderr)
+        return None
+    return value
@@ -43,6 +43,28 @@ class TestBackendTarget:
         assert bt.network_settings["net1"]["NetworkID"] == "net1-id"
         assert bt.network_settings["net1"]["IPAddress"] == "172.18.0.2"
         assert "80/tcp" in bt.ports
+        assert bt.cpu_limit is None
+
+    @pytest.mark.parametrize(
+        "host_config, cpu_limit",
+        [
+            ({"NanoCpus": 1500000000, "CpuQuota": 0, "CpuPeriod": 0}, 1.5),
+            ({"NanoCpus": 0, "CpuQuota": 50000, "CpuPeriod": 100000}, 0.5),
+            ({"NanoCpus": 0, "CpuQuota": 200000, "CpuPeriod": 0}, 2.0),
+            ({"NanoCpus": 0, "CpuQuota": -1, "CpuPeriod": 0}, None),
+        ],
+    )
+    def test_backend_target_cpu_limit_from_host_config(self, host_config, cpu_limit):
+        container = MagicMock()
+        container.id = "abc123456789"
+        container.attrs = {
+            "Name": "/test-container",
+            "Config": {"Env": [], "Labels": {}},
+            "HostConfig": host_config,
+            "NetworkSettings": {"Networks": {}, "Ports": {}},
+        }
+
+        assert BackendTarget.from_container(container).cpu_limit == cpu_limit
 
 
 class TestBackendTargetFromService:
@@ -74,6 +96,20 @@ class TestBackendTargetFromService:
         assert "net1" in bt.network_settings
         assert bt.network_settings["net1"]["IPAddress"] == "10.0.0.5"
         assert "80/tcp" in bt.ports
+        assert bt.cpu_limit is None
+
+    def test_from_service_cpu_limit(self):
+        service = MagicMock()
+        service.id = "service123"
+        service.attrs = {
+            "Spec": {
+                "Name": "my-web-service",
+                "TaskTemplate": {"ContainerSpec": {}, "Resources": {"Limits": {"NanoCPUs": 250000000}}},
+            },
+            "Endpoint": {},
+        }
+
+        assert BackendTarget.from_service(service).cpu_limit == 0.25
 
 
 class TestVirtualHostProcessorWithBackendTarget:
@@ -586,3 +622,50 @@ class TestVirtualHostProcessorWithBackendTarget:
         assert "proxy_read_timeout 10" not in injections_after
         assert "client_max_body_size 5m" in injections_after
         assert "proxy_send_timeout 20" in injections_after
+
+    def test_health_settings_are_applied_to_server_and_locations(self):
+        bt = BackendTarget(
+            id="health-id",
+            name="health-test",
+            env={
+                "VIRTUAL_HOST": "health.test",
+                "NGINX_UPSTREAM_MAX_FAILS": "5",
+                "NGINX_PROXY_NEXT_UPSTREAM": "error  timeout http_503",
+            },
+            labels={"NGINX_UPSTREAM_FAIL_TIMEOUT": "30s", "NGINX_PROXY_NEXT_UPSTREAM_TRIES": "2"},
+            network_settings={"int-net": {"NetworkID": "int-net-id", "IPAddress": "10.0.0.99"}},
+        )
+
+        host = list(process_virtual_hosts(bt, {"int-net-id"}).host_list())[0]
+
+        location = host.locations["/"]
+        assert (location.backends[0].max_fails, location.backends[0].fail_timeout) == ("5", "30s")
+        assert location.extras["injected"] == [
+            "proxy_next_upstream error timeout http_503",
+            "proxy_next_upstream_tries 2",
+        ]
+
+    @pytest.mark.parametrize(
+        "setting",
+        [
+            {"NGINX_UPSTREAM_MAX_FAILS": "three"},
+            {"NGINX_UPSTREAM_FAIL_TIMEOUT": "10 seconds"},
+            {"NGINX_PROXY_NEXT_UPSTREAM": "off error"},
+            {"NGINX_PROXY_NEXT_UPSTREAM": "http_418"},
+            {"NGINX_PROXY_NEXT_UPSTREAM_TIMEOUT": "5s; return 200"},
+        ],
+    )
+    def test_invalid_health_settings_are_ignored(self, setting, capsys):
+        bt = BackendTarget(
+            id="health-id",
+            name="health-test",
+            env={"VIRTUAL_HOST": "health.test", **setting},
+            network_settings={"int-net": {"NetworkID": "int-net-id", "IPAddress": "10.0.0.99"}},
+        )
+
+        host = list(process_virtual_hosts(bt, {"int-net-id"}).host_list())[0]
+
+        location = host.locations["/"]
+        assert (location.backends[0].max_fails, location.backends[0].fail_timeout) == (None, None)
+        assert not location.extras.get("injected")
+        assert f"[WARN] Ignoring invalid {next(iter(setting))}=" in capsys.readouterr().err
@@ -0,0 +1,77 @@
+import os
+from unittest.mock import patch
+
+import bcrypt
+
+from nginx_proxy.Host import Host
+from nginx_proxy.post_processors import basic_auth_processor
+from nginx_proxy.post_processors.basic_auth_processor import BasicAuthProcessor
+
+
+def _secured_host(hostname, users):
+    host = Host(hostname, 80)
+    host.update_extras_content("security", dict(users))
+    return host
+
+
+def _verifies(file_path, user, password):
+    with open(file_path) as file:
+        entries = dict(line.strip().split(":", 1) for line in file if line.strip())
+    return bcrypt.checkpw(password.encode(), entries[user].replace("$2y$", "$2b$").encode())
+
+
+def test_unchanged_credentials_are_not_rehashed_or_rewritten(tmp_path):
+    processor = BasicAuthProcessor(str(tmp_path), max_workers=1)
+    processor.process_basic_auth([_secured_host("auth.example.com", {"alice": "secret", "bob": "hunter2"})])
+    auth_file = processor.htpasswd_file_path("auth.example.com", "_")
+    inode = os.stat(auth_file).st_ino
+
+    with patch.object(basic_auth_processor, "_hash_password", wraps=basic_auth_processor._hash_password) as hashing:
+        host = _secured_host("auth.example.com", {"alice": "secret", "bob": "hunter2"})
+        processor.process_basic_auth([host])
+
+    hashing.assert_not_called()
+    assert os.stat(auth_file).st_ino == inode
+    assert host.extras["security_file"] == auth_file
+
+
+def test_only_changed_password_is_rehashed(tmp_path):
+    processor = BasicAuthProcessor(str(tmp_path), max_workers=1)
+    processor.process_basic_auth([_secured_host("auth.example.com", {"alice": "secret", "bob": "hunter2"})])
+
+    with patch.object(basic_auth_processor, "_hash_password", wraps=basic_auth_processor._hash_password) as hashing:
+        processor.process_basic_auth([_secured_host("auth.example.com", {"alice": "secret", "bob": "changed"})])
+
+    hashing.assert_called_once_with("changed")
+    auth_file = processor.htpasswd_file_path("auth.example.com", "_")
+    assert _verifies(auth_file, "alice", "secret")
+    assert _verifies(auth_file, "bob", "changed")
+
+
+def test_hashes_on_disk_are_reused_after_restart(tmp_path):
+    BasicAuthProcessor(str(tmp_path), max_workers=1).process_basic_auth(
+        [_secured_host("auth.example.com", {"alice": "secret"})]
+    )
+    auth_file = os.path.join(str(tmp_path), "auth.example.com", "_")
+    with open(auth_file) as file:
+        original = file.read()
+
+    restarted = BasicAuthProcessor(str(tmp_path), max_workers=1)
+    with patch.object(basic_auth_processor, "_hash_password") as hashing:
+        restarted.process_basic_auth([_secured_host("auth.example.com", {"alice": "secret"})])
+
+    hashing.assert_not_called()
+    with open(auth_file) as file:
+        assert file.read() == original
+
+
+def test_hashing_is_batched_into_worker_pool(tmp_path):
+    processor = BasicAuthProcessor(str(tmp_path), max_workers=2)
+    hosts = [_secured_host(f"auth{i}.example.com", {"alice": f"secret{i}"}) for i in range(3)]
+    try:
+        processor.process_basic_auth(hosts)
+    finally:
+        processor.shutdown()
+
+    for i, host in enumerate(hosts):
+        assert _verifies(host.extras["security_file"], "alice", f"secret{i}")
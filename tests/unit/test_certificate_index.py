@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+from nginx_proxy.post_processors.certificate_index import CertificateIndex
+
+
+class _Store:
+    """Minimal file backed lookup: <name>.crt contains the expiry in days."""
+
+    def __init__(self, certs_dir):
+        self.certs_dir = certs_dir
+        self.loads = []
+
+    def write(self, name, days):
+        (self.certs_dir / (name + ".crt")).write_text(str(days))
+
+    def load(self, domain):
+        self.loads.append(domain)
+        for name in (domain, "*." + domain.split(".", 1)[-1]):
+            path = self.certs_dir / (name + ".crt")
+            if path.exists():
+                return name, datetime.now(timezone.utc) + timedelta(days=int(path.read_text()))
+        return None
+
+
+def test_lookups_are_served_from_memory_until_files_change(tmp_path):
+    store = _Store(tmp_path)
+    store.write("a.example.com", 30)
+    store.write("b.example.com", 30)
+    index = CertificateIndex([str(tmp_path)])
+    index.refresh()
+
+    for _ in range(3):
+        assert index.get("a.example.com", store.load)[0] == "a.example.com"
+        assert index.get("b.example.com", store.load)[0] == "b.example.com"
+        index.refresh()
+
+    assert store.loads == ["a.example.com", "b.example.com"]
+
+
+def test_refresh_drops_only_replaced_certificates(tmp_path):
+    store = _Store(tmp_path)
+    store.write("a.example.com", 5)
+    store.write("b.example.com", 30)
+    index = CertificateIndex([str(tmp_path)])
+    index.refresh()
+    index.get("a.example.com", store.load)
+    index.get("b.example.com", store.load)
+
+    store.write("a.example.com", 90)  # renewed in place
+    index.refresh()
+    renewed = index.get("a.example.com", store.load)
+    index.get("b.example.com", store.load)
+
+    assert store.loads == ["a.example.com", "b.example.com", "a.example.com"]
+    assert (renewed[1] - datetime.now(timezone.utc)).days >= 89
+
+
+def test_new_certificate_replaces_missing_entry(tmp_path):
+    store = _Store(tmp_path)
+    index = CertificateIndex([str(tmp_path)])
+    index.refresh()
+    assert index.get("api.example.com", store.load) is None
+
+    store.write("*.example.com", 30)
+    index.refresh()
+
+    assert index.get("api.example.com", store.load)[0] == "*.example.com"
+
+
+def test_index_without_directories_only_lives_for_one_refresh():
+    loads = []
+    index = CertificateIndex([])
+    index.get("a.example.com", lambda domain: loads.append(domain))
+    index.get("a.example.com", lambda domain: loads.append(domain))
+    index.refresh()
+    index.get("a.example.com", lambda domain: loads.append(domain))
+
+    assert loads == ["a.example.com", "a.example.com"]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from certapi.http.types import CertificateResponse, IssuedCert
+
+from nginx_proxy.certificate_scheduler import CertificateIssuanceScheduler, OrderBudget
+
+
+class _FakeManager:
+    key_store = object()
+
+    def __init__(self, delay=0.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def obtain(self, domains, **kwargs):
+        with self._lock:
+            self.calls.append((list(domains), kwargs))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if self.fail & set(domains):
+            raise RuntimeError("order failed")
+        return CertificateResponse(issued=[IssuedCert(domains=list(domains))])
+
+
+def test_batches_run_concurrently_with_bounded_parallelism():
+    manager = _FakeManager(delay=0.05)
+    issued_batches = []
+    scheduler = CertificateIssuanceScheduler(
+        manager, max_parallel=3, max_batch_size=2, on_batch_issued=issued_batches.append
+    )
+
+    response = scheduler.obtain([f"host{i}.example.com" for i in range(10)], batch_domains=True)
+
+    assert len(manager.calls) == 5
+    assert manager.peak == 3
+    assert all(kwargs["batch_domains"] is False for _, kwargs in manager.calls)
+    assert sorted(d for cert in response.issued for d in cert.domains) == sorted(
+        f"host{i}.example.com" for i in range(10)
+    )
+    assert len(issued_batches) == 5
+
+
+def test_wildcards_are_issued_first_and_cover_concrete_domains():
+    manager = _FakeManager()
+    scheduler = CertificateIssuanceScheduler(manager)
+
+    scheduler.obtain(["api.example.com", "*.example.com", "www.other.com"], batch_domains=True)
+
+    assert manager.calls[0][0] == ["*.example.com"]
+    assert [domains for domains, _ in manager.calls[1:]] == [["www.other.com"]]
+
+
+def test_failed_batch_does_not_fail_the_others():
+    manager = _FakeManager(fail=["bad.example.com"])
+    scheduler = CertificateIssuanceScheduler(manager, max_batch_size=1)
+
+    response = scheduler.obtain(["bad.example.com", "good.example.com"], batch_domains=True)
+
+    assert [cert.domains for cert in response.issued] == [["good.example.com"]]
+    assert [failure.domains for failure in response.failed] == [["bad.example.com"]]
+
+
+def test_orders_over_the_hourly_budget_are_deferred():
+    now = [0.0]
+    manager = _FakeManager()
+    scheduler = CertificateIssuanceScheduler(manager, max_orders_per_hour=2, max_batch_size=1, clock=lambda: now[0])
+
+    response = scheduler.obtain(["a.example.com", "b.example.com", "c.example.com"], batch_domains=True)
+
+    assert len(manager.calls) == 2
+    assert [failure.name for failure in response.failed] == ["RateBudgetExceeded"]
+
+    now[0] = 3601.0
+    scheduler.obtain(["c.example.com"], batch_domains=True)
+    assert len(manager.calls) == 3
+
+
+def test_schedulers_of_one_account_share_the_hourly_budget():
+    budget = OrderBudget(max_orders_per_hour=2)
+    ecdsa_manager, rsa_manager = _FakeManager(), _FakeManager()
+    ecdsa = CertificateIssuanceScheduler(ecdsa_manager, max_batch_size=1, order_budget=budget)
+    rsa = CertificateIssuanceScheduler(rsa_manager, max_batch_size=1, order_budget=budget)
+
+    ecdsa.obtain(["a.example.com"], batch_domains=True)
+    response = rsa.obtain(["a.example.com", "b.example.com"], batch_domains=True)
+
+    assert (len(ecdsa_manager.calls), len(rsa_manager.calls)) == (1, 1)
+    assert [failure.name for failure in response.failed] == ["RateBudgetExceeded"]
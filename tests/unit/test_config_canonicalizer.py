@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+from nginx.ConfigCanonicalizer import configs_equivalent
+from nginx.Nginx import Nginx
+
+BASE_CONFIG = """
+upstream example.com_abc {
+    server 10.0.0.2:80; # container: 1111
+    server 10.0.0.3:80; # container: 2222
+}
+upstream other.com_def {
+    server 10.0.0.4:80;
+}
+server {
+    listen 80;
+    server_name example.com;
+    location / {
+        proxy_pass http://example.com_abc; # container: 1111
+    }
+    location /api {
+        proxy_pass http://10.0.0.5:8080;
+    }
+    location ~ \\.php$ {
+        return 403;
+    }
+    location ~* \\.(png|jpg)$ {
+        expires 1d;
+    }
+}
+server {
+    listen 80;
+    server_name other.com;
+    location / {
+        proxy_pass http://other.com_def;
+    }
+}
+"""
+
+
+def test_comments_whitespace_and_quotes_are_ignored():
+    changed = (
+        BASE_CONFIG.replace("# container: 1111", "# container: 9999")
+        .replace("    server_name example.com;", "server_name\t'example.com' ;")
+        .replace("listen 80;", "listen   80;")
+    )
+    assert configs_equivalent(BASE_CONFIG, changed)
+
+
+def test_hash_inside_word_or_quotes_is_not_a_comment():
+    old = 'server { listen 80; return 301 "https://example.com/#a"; add_header X a#b; }'
+    assert not configs_equivalent(old, old.replace("#a", "#b"))
+    assert not configs_equivalent(old, old.replace("a#b", "a#c"))
+
+
+def test_independent_block_order_is_ignored():
+    upstreams_swapped = BASE_CONFIG.replace(
+        "upstream example.com_abc {\n    server 10.0.0.2:80; # container: 1111\n"
+        "    server 10.0.0.3:80; # container: 2222\n}\n"
+        "upstream other.com_def {\n    server 10.0.0.4:80;\n}\n",
+        "upstream other.com_def {\n    server 10.0.0.4:80;\n}\n"
+        "upstream example.com_abc {\n    server 10.0.0.2:80;\n    server 10.0.0.3:80;\n}\n",
+    )
+    prefix_swapped = BASE_CONFIG.replace(
+        "    location / {\n        proxy_pass http://example.com_abc; # container: 1111\n    }\n"
+        "    location /api {\n        proxy_pass http://10.0.0.5:8080;\n    }\n",
+        "    location /api {\n        proxy_pass http://10.0.0.5:8080;\n    }\n"
+        "    location / {\n        proxy_pass http://example.com_abc;\n    }\n",
+    )
+    assert upstreams_swapped != BASE_CONFIG and configs_equivalent(BASE_CONFIG, upstreams_swapped)
+    assert prefix_swapped != BASE_CONFIG and configs_equivalent(BASE_CONFIG, prefix_swapped)
+
+
+def test_regex_location_order_and_upstream_members_are_significant():
+    regex_swapped = BASE_CONFIG.replace(
+        "    location ~ \\.php$ {\n        return 403;\n    }\n"
+        "    location ~* \\.(png|jpg)$ {\n        expires 1d;\n    }\n",
+        "    location ~* \\.(png|jpg)$ {\n        expires 1d;\n    }\n"
+        "    location ~ \\.php$ {\n        return 403;\n    }\n",
+    )
+    assert regex_swapped != BASE_CONFIG
+    assert not configs_equivalent(BASE_CONFIG, regex_swapped)
+    assert not configs_equivalent(BASE_CONFIG, BASE_CONFIG.replace("10.0.0.3:80", "10.0.0.6:80"))
+
+
+def test_server_order_matters_only_for_implicit_default_server():
+    first = "server { listen 80; server_name a.com; }\n"
+    second = "server { listen 80; server_name b.com; }\n"
+    assert not configs_equivalent(first + second, second + first)
+
+    explicit_default = "server { listen 80 default_server; server_name _; }\n"
+    assert configs_equivalent(explicit_default + first + second, second + first + explicit_default)
+
+
+def test_update_config_skips_reload_for_semantically_equal_config(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"), history_dir=str(tmp_path / "history"))
+    commands = []
+
+    def fake_run(command, stdout=None, stderr=None):
+        commands.append(command)
+        return SimpleNamespace(returncode=0, stderr=b"")
+
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", fake_run)
+    assert nginx.update_config(BASE_CONFIG, validate=False) is True
+    commands.clear()
+
+    recreated = BASE_CONFIG.replace("# container: 1111", "# container: 9999")
+    assert nginx.update_config(recreated) is False
+    assert commands == []
+    assert config_file.read_text() == BASE_CONFIG
+
+    assert nginx.update_config(recreated, force=True, validate=False) is True
+    assert commands == [Nginx.command_reload]
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+from nginx.ConfigHistory import ConfigHistory, config_hash
+from nginx.Nginx import Nginx
+
+
+def test_history_is_content_addressed_and_bounded(tmp_path):
+    history = ConfigHistory(str(tmp_path / "history"), max_entries=2)
+
+    first = history.record("config 1", event="update container a", reload_duration=0.1)
+    history.record("config 2", event="update container b")
+    history.record("config 1", event="remove container b")
+    history.record("config 3", event="update container c")
+
+    entries = history.entries()
+    assert [entry.hash for entry in entries] == [config_hash("config 1"), config_hash("config 3")]
+    assert entries[0].event == "remove container b"
+    assert first.hash == config_hash("config 1")
+    assert not (tmp_path / "history" / (config_hash("config 2") + ".conf")).exists()
+    assert sorted(p.name for p in (tmp_path / "history").iterdir()) == sorted(
+        ["index.json", "index.lock", config_hash("config 1") + ".conf", config_hash("config 3") + ".conf"]
+    )
+
+
+def test_history_survives_restart(tmp_path):
+    ConfigHistory(str(tmp_path / "history")).record("config 1", event="rescan", reload_duration=0.5)
+
+    entries = ConfigHistory(str(tmp_path / "history")).entries()
+
+    assert len(entries) == 1
+    assert entries[0].event == "rescan"
+    assert entries[0].reload_duration == 0.5
+
+
+def test_update_config_records_history_with_event(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"), history_dir=str(tmp_path / "history"))
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", lambda *args, **kwargs: SimpleNamespace(returncode=0))
+
+    assert nginx.update_config("config 1", validate=False, event="update container app") is True
+
+    entry = nginx.history.latest()
+    assert entry.hash == config_hash("config 1")
+    assert entry.event == "update container app"
+    assert entry.reload_duration is not None
+
+
+def test_rollback_restores_previous_version_without_validation(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"), history_dir=str(tmp_path / "history"))
+    commands = []
+
+    def fake_run(command, stdout=None, stderr=None):
+        commands.append(command)
+        return SimpleNamespace(returncode=0, stderr=b"")
+
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", fake_run)
+    nginx.update_config("good config", validate=False)
+    nginx.update_config("bad config", validate=False)
+    commands.clear()
+
+    assert nginx.rollback() is True
+
+    assert config_file.read_text() == "good config"
+    assert nginx.last_working_config == "good config"
+    assert commands == [Nginx.command_reload]
+    assert nginx.history.latest().event == "rollback to " + config_hash("good config")[:12]
+
+
+def test_rollback_by_hash_prefix(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"), history_dir=str(tmp_path / "history"))
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", lambda *a, **k: SimpleNamespace(returncode=0, stderr=b""))
+    for config in ("config 1", "config 2", "config 3"):
+        nginx.update_config(config, validate=False)
+
+    assert nginx.rollback(config_hash("config 1")[:10]) is True
+    assert config_file.read_text() == "config 1"
+    assert nginx.rollback("unknown") is False
+
+
+def test_record_keeps_entries_written_by_another_process(tmp_path):
+    controller = ConfigHistory(str(tmp_path / "history"))
+    controller.record("config 1")
+    ConfigHistory(str(tmp_path / "history")).record("config 2", event="rollback to abc")
+
+    controller.record("config 3")
+
+    assert [entry.hash for entry in ConfigHistory(str(tmp_path / "history")).entries()] == [
+        config_hash("config 1"),
+        config_hash("config 2"),
+        config_hash("config 3"),
+    ]
+
+
+def test_read_of_evicted_version_returns_none(tmp_path):
+    history = ConfigHistory(str(tmp_path / "history"), max_entries=1)
+    entry = history.record("config 1")
+    ConfigHistory(str(tmp_path / "history"), max_entries=1).record("config 2")
+
+    assert history.read(entry) is None
+
+
+def test_requested_rollback_is_applied_by_the_controller(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"), history_dir=str(tmp_path / "history"))
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", lambda *a, **k: SimpleNamespace(returncode=0, stderr=b""))
+    nginx.update_config("good config", validate=False)
+    nginx.update_config("bad config", validate=False)
+
+    ConfigHistory(str(tmp_path / "history")).request_rollback(config_hash("good config"))
+    assert nginx.apply_rollback_request() is True
+
+    assert nginx.last_working_config == "good config"
+    assert not (tmp_path / "history" / ConfigHistory.rollback_request_file_name).exists()
+    # a failed update restores the rolled back config rather than the one before it
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", lambda *a, **k: SimpleNamespace(returncode=1, stderr=b""))
+    assert nginx.update_config("broken config", validate=False) is False
+    assert config_file.read_text() == "good config"
+    assert nginx.apply_rollback_request() is False
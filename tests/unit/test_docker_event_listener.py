@@ -1,11 +1,13 @@
 import pytest
 from unittest.mock import MagicMock, patch
+import socket
 import threading
 import time
 
 import docker
 
 from nginx_proxy.DockerEventListener import ContainerEvent, DockerEventListener
+from nginx_proxy.readiness_probe import ProbeTarget
 from nginx_proxy.WebServer import WebServer
 
 
@@ -489,3 +491,137 @@ def test_network_connect_is_ignored_for_unhealthy_container(web_server, docker_c
     )
 
     web_server.connect.assert_not_called()
+
+
+def _probed_container(port, env=None):
+    container = MagicMock()
+    container.id = "container1"
+    container.name = "probed-container"
+    container.attrs = {
+        "Config": {"Env": [f"VIRTUAL_HOST=probed.example.com -> :{port}", *(env or [])], "Labels": {}},
+        "State": {"Status": "running"},
+        "Name": "/probed-container",
+        "NetworkSettings": {"Networks": {"frontend": {"NetworkID": "net1", "IPAddress": "127.0.0.1"}}, "Ports": {}},
+    }
+    return container
+
+
+def test_start_probe_activates_container_once_it_accepts_connections(web_server, docker_client):
+    listening = socket.socket()
+    listening.bind(("127.0.0.1", 0))
+    port = listening.getsockname()[1]
+    web_server.config = {"docker_swarm": "ignore", "backend_start_grace_seconds": 10, "backend_start_probe": True}
+    web_server.networks = {"net1": "frontend", "frontend": "net1"}
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+    docker_client.containers.get.return_value = _probed_container(port)
+
+    try:
+        listener._process_container_event("start", {"Actor": {"ID": "container1", "Attributes": {}}})
+        time.sleep(0.2)
+        assert listener.drain_commands() == 0
+        assert listener._is_pending_startup("container1")
+
+        listening.listen()
+        time.sleep(0.5)
+        listener.drain_commands()
+    finally:
+        listening.close()
+        listener._cancel_all_timers()
+
+    web_server.update_backend.assert_called_once()
+    assert not listener._is_pending_startup("container1")
+
+
+def test_start_probe_abandons_container_after_timeout(web_server, docker_client):
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    port = closed.getsockname()[1]
+    closed.close()
+    web_server.config = {
+        "docker_swarm": "ignore",
+        "backend_start_probe": True,
+        "backend_start_probe_timeout": 0.3,
+    }
+    web_server.networks = {"net1": "frontend", "frontend": "net1"}
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+    docker_client.containers.get.return_value = _probed_container(port, env=["NGINX_START_PROBE_PATH=/ready"])
+
+    listener._process_container_event("start", {"Actor": {"ID": "container1", "Attributes": {}}})
+    time.sleep(0.6)
+    with patch("builtins.print") as mock_print:
+        listener.drain_commands()
+
+    web_server.update_backend.assert_not_called()
+    assert not listener._is_pending_startup("container1")
+    mock_print.assert_called_once_with(
+        "Container not ready ",
+        "Id:container1",
+        "    probed-container",
+        "after 0.3s, not registered",
+        sep="\t",
+    )
+
+
+def test_killed_container_is_drained_before_removal(web_server, docker_client):
+    web_server.config = {"docker_swarm": "ignore", "backend_drain_seconds": 0.1}
+    web_server.drain_backend.return_value = True
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+    docker_client.containers.get.side_effect = docker.errors.NotFound("gone")
+    attributes = {"name": "stopping-container", "signal": "15"}
+
+    with patch("builtins.print"):
+        listener._process_container_event("kill", {"Actor": {"ID": "container1", "Attributes": attributes}})
+        listener._process_container_event("die", {"Actor": {"ID": "container1", "Attributes": attributes}})
+    web_server.drain_backend.assert_called_once_with("container1")
+    web_server.remove_backend.assert_not_called()
+
+    time.sleep(0.2)
+    listener.drain_commands()
+    web_server.remove_backend.assert_called_once_with("container1")
+
+
+def test_drain_is_skipped_for_reload_signals_and_cancelled_on_restart(web_server, docker_client):
+    web_server.config = {"docker_swarm": "ignore", "backend_drain_seconds": 10}
+    web_server.drain_backend.return_value = True
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+
+    listener._process_container_event("kill", {"Actor": {"ID": "container1", "Attributes": {"signal": "1"}}})
+    web_server.drain_backend.assert_not_called()
+
+    with patch("builtins.print"):
+        listener._process_container_event("kill", {"Actor": {"ID": "container1", "Attributes": {"signal": "15"}}})
+    with patch.object(listener, "_handle_container_start"):
+        listener._process_container_event("start", {"Actor": {"ID": "container1", "Attributes": {}}})
+
+    web_server.undrain_backend.assert_called_once_with("container1")
+    assert listener._pending_drain_timers == {}
+
+
+def test_task_container_event_refreshes_service_routed_to_tasks(web_server, docker_client):
+    web_server.config = {"docker_swarm": "enable"}
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+    attributes = {"com.docker.swarm.service.id": "service1"}
+
+    with patch.object(listener, "_schedule_service_processing") as schedule:
+        listener._process_container_event("die", {"Actor": {"ID": "container1", "Attributes": attributes}})
+        web_server.swarm_topology = None
+        listener._process_container_event("start", {"Actor": {"ID": "container1", "Attributes": attributes}})
+
+    schedule.assert_called_once_with("service1", "update", 1, attempt=2)
+    web_server.remove_backend.assert_not_called()
+
+
+def test_rescan_start_probe_keeps_a_pending_probe(web_server, docker_client):
+    listener = DockerEventListener(web_server, docker_client, docker_client)
+    web_server.config = {"docker_swarm": "ignore", "backend_start_probe_timeout": 60}
+    targets = [ProbeTarget("127.0.0.1", 1, False, None)]
+
+    with patch("nginx_proxy.DockerEventListener.readiness_probe.is_ready", return_value=False):
+        try:
+            listener.probe_backend_start("container1", targets)
+            generation = listener._pending_backend_generations["container1"]
+            listener.probe_backend_start("container1", targets)
+
+            assert listener._pending_backend_generations["container1"] == generation
+        finally:
+            listener._cancel_all_timers()
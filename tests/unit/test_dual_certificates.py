@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from certapi import FileSystemKeyStore
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+from jinja2 import Template
+
+from nginx_proxy.certificate_backend import build_certificate_backend
+from nginx_proxy.Host import Host
+from nginx_proxy.post_processors.ssl_certificate_processor import SslCertificateProcessor
+
+TEMPLATE_PATH = Path(__file__).resolve().parents[2] / "vhosts_template" / "default.conf.jinja2"
+
+
+def _write_certificate(key_store, name, key, days=90):
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=days))
+        .sign(key, hashes.SHA256())
+    )
+    Path(key_store.keys_dir, name + ".key").write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+        )
+    )
+    Path(key_store.certs_dir, name + ".crt").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+
+
+def _build_processor(tmp_path):
+    key_store = FileSystemKeyStore(str(tmp_path), keys_dir_name="private")
+    rsa_key_store = FileSystemKeyStore(str(tmp_path), keys_dir_name="private/rsa", certs_dir_name="certs/rsa")
+    backend_info = SimpleNamespace(
+        backend=Mock(),
+        key_store=key_store,
+        certapi_url="https://certapi.example.com",
+        use_certapi_server=True,
+        batch_domains=True,
+        cert_manager=None,
+        certapi_client=None,
+        challenge_store=None,
+        rsa_backend=Mock(),
+        rsa_key_store=rsa_key_store,
+    )
+    server = SimpleNamespace(config={"cert_reload_batch_seconds": 0, "ssl_ocsp_prefetch": False})
+    with (
+        patch(
+            "nginx_proxy.post_processors.ssl_certificate_processor.build_certificate_backend",
+            return_value=backend_info,
+        ),
+        patch("nginx_proxy.post_processors.ssl_certificate_processor.RenewalManager") as renewal_cls,
+    ):
+        renewal_cls.side_effect = lambda *args, **kwargs: Mock(key_type=kwargs.get("key_type", "ecdsa"))
+        processor = SslCertificateProcessor(Mock(), server=server, ssl_dir=str(tmp_path))
+    return processor, rsa_key_store
+
+
+def test_dual_certificates_use_separate_rsa_key_store(tmp_path):
+    nginx = SimpleNamespace(challenge_dir=str(tmp_path / "challenges"))
+    with patch("certapi.manager.acme_cert_manager.AcmeCertManager.setup"):
+        backend = build_certificate_backend(str(tmp_path), nginx, config={"ssl_dual_certificates": True})
+
+    assert backend.rsa_key_store.certs_dir == str(tmp_path / "certs" / "rsa")
+    assert backend.rsa_key_store.keys_dir == str(tmp_path / "private" / "rsa")
+    assert backend.rsa_backend.key_store is backend.rsa_key_store
+    # one ACME account for both key types
+    assert backend.rsa_backend.cert_issuer is backend.cert_manager.cert_issuer
+
+
+def test_rsa_certificates_are_obtained_in_background(tmp_path):
+    processor, _rsa_key_store = _build_processor(tmp_path)
+    assert processor.rsa_renewal_manager.key_type == "rsa"
+
+    processor.process_ssl_certificates([Host("example.com", 443, {"https"})])
+
+    processor.rsa_renewal_manager.update_watch_domains.assert_not_called()
+    assert processor.rsa_renewal_scheduler.next_renewal_time() is not None
+
+
+def test_rsa_certificate_is_rendered_next_to_ecdsa(tmp_path):
+    processor, rsa_key_store = _build_processor(tmp_path)
+    _write_certificate(processor.key_store, "example.com", ec.generate_private_key(ec.SECP256R1()))
+    for name in ("example.com", "other.example.com"):
+        _write_certificate(rsa_key_store, name, rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    hosts = [Host("example.com", 443, {"https"}), Host("other.example.com", 443, {"https"})]
+
+    processor.process_ssl_certificates(hosts)
+
+    assert hosts[0].extras["ssl_rsa_certificate"] == str(tmp_path / "certs" / "rsa" / "example.com.crt")
+    assert hosts[0].extras["ssl_rsa_certificate_key"] == str(tmp_path / "private" / "rsa" / "example.com.key")
+    # served with the self-signed placeholder until its ECDSA certificate exists
+    assert "ssl_rsa_certificate" not in hosts[1].extras
+
+    hosts[0].locations = {}
+    hosts[0].is_down = True
+    output = Template(TEMPLATE_PATH.read_text()).render(
+        config={"ssl_certs_dir": "/etc/ssl/certs", "ssl_key_dir": "/etc/ssl/private"},
+        virtual_servers=hosts[:1],
+        upstreams=[],
+    )
+    certificates = [line.strip() for line in output.splitlines() if line.strip().startswith("ssl_certificate")]
+    assert certificates == [
+        "ssl_certificate /etc/ssl/certs/example.com.crt;",
+        "ssl_certificate_key /etc/ssl/private/example.com.key;",
+        f"ssl_certificate {tmp_path}/certs/rsa/example.com.crt;",
+        f"ssl_certificate_key {tmp_path}/private/rsa/example.com.key;",
+    ]
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from certapi import FileSystemKeyStore
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from jinja2 import Template
+
+from nginx_proxy.Host import Host
+from nginx_proxy.post_processors.ssl_certificate_processor import SslCertificateProcessor
+
+TEMPLATE_PATH = Path(__file__).resolve().parents[2] / "vhosts_template" / "default.conf.jinja2"
+
+
+def _write_certificate(key_store, name):
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=90))
+        .sign(key, hashes.SHA256())
+    )
+    Path(key_store.keys_dir, name + ".key").write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    Path(key_store.certs_dir, name + ".crt").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+
+
+def _build_processor(tmp_path, config):
+    backend_info = SimpleNamespace(
+        backend=Mock(),
+        key_store=FileSystemKeyStore(str(tmp_path), keys_dir_name="private"),
+        certapi_url="https://certapi.example.com",
+        use_certapi_server=True,
+        batch_domains=True,
+        cert_manager=None,
+        certapi_client=None,
+        challenge_store=None,
+    )
+    server = SimpleNamespace(config={"cert_reload_batch_seconds": 0, **config}, enqueue_reload=Mock())
+    with (
+        patch(
+            "nginx_proxy.post_processors.ssl_certificate_processor.build_certificate_backend",
+            return_value=backend_info,
+        ),
+        patch("nginx_proxy.post_processors.ssl_certificate_processor.RenewalManager"),
+    ):
+        return SslCertificateProcessor(Mock(), server=server, ssl_dir=str(tmp_path))
+
+
+def _render(hosts, certificate_map, cache=1000):
+    for host in hosts:
+        host.locations = {}
+        host.is_down = True
+    return Template(TEMPLATE_PATH.read_text()).render(
+        config={
+            "ssl_certs_dir": "/etc/ssl/certs",
+            "ssl_key_dir": "/etc/ssl/private",
+            "ssl_certificate_map": certificate_map,
+            "ssl_certificate_cache": cache,
+        },
+        virtual_servers=hosts,
+        upstreams=[],
+    )
+
+
+def test_dynamic_hosts_share_certificate_selected_by_server_name(tmp_path):
+    processor = _build_processor(tmp_path, {"ssl_certificate_loading": "dynamic"})
+    assert processor.ocsp_stapler is None
+    _write_certificate(processor.key_store, "example.com")
+    hosts = [Host("example.com", 443, {"https"}), Host("new.example.com", 443, {"https"})]
+
+    processor.process_ssl_certificates(hosts)
+    certificate_map = processor.certificate_map(hosts)
+
+    assert certificate_map == (
+        "example.com",
+        {"example.com": "example.com", "new.example.com": "new.example.com.selfsigned"},
+    )
+    lines = [line.strip() for line in _render(hosts, certificate_map).splitlines()]
+    assert lines[lines.index("map $ssl_server_name $ssl_certificate_name {") :][:6] == [
+        "map $ssl_server_name $ssl_certificate_name {",
+        "hostnames;",
+        'default "example.com";',
+        '"example.com" "example.com";',
+        '"new.example.com" "new.example.com.selfsigned";',
+        "}",
+    ]
+    assert [line for line in lines if line.startswith("ssl_certificate")] == [
+        "ssl_certificate /etc/ssl/certs/$ssl_certificate_name.crt;",
+        "ssl_certificate_key /etc/ssl/private/$ssl_certificate_name.key;",
+        "ssl_certificate_cache max=1000;",
+    ]
+
+
+def test_certificate_map_keeps_wildcards_and_prefers_default_server():
+    hosts = [Host("a.example.com", 443, {"https"}), Host("*.example.com", 443, {"https"})]
+    hosts[0].ssl_file = "*.example.com"
+    hosts[1].ssl_file = "*.example.com"
+    hosts[1].extras["default_server"] = "default_server"
+    static_host = Host("static.example.com", 443, {"https"})
+    for host in hosts:
+        host.extras["ssl_dynamic_certificate"] = True
+
+    assert SslCertificateProcessor.certificate_map([static_host]) is None
+    assert SslCertificateProcessor.certificate_map(hosts + [static_host]) == (
+        "*.example.com",
+        {"a.example.com": "*.example.com", "*.example.com": "*.example.com"},
+    )
+
+
+def test_renewed_certificate_is_used_without_forced_reload(tmp_path):
+    processor = _build_processor(tmp_path, {"ssl_certificate_loading": "dynamic"})
+    _write_certificate(processor.key_store, "example.com")
+    processor.process_ssl_certificates([Host("example.com", 443, {"https"})])
+
+    _write_certificate(processor.key_store, "example.com")
+    processor.ssl_renewal_callback()
+    processor.process_ssl_certificates([Host("example.com", 443, {"https"})])
+
+    assert processor.certificates_changed() is False
+
+
+def test_static_loading_keeps_certificate_per_server(tmp_path):
+    processor = _build_processor(tmp_path, {"ssl_ocsp_prefetch": False})
+    _write_certificate(processor.key_store, "example.com")
+    hosts = [Host("example.com", 443, {"https"})]
+
+    processor.process_ssl_certificates(hosts)
+
+    assert "ssl_dynamic_certificate" not in hosts[0].extras
+    lines = [line.strip() for line in _render(hosts, None).splitlines()]
+    assert "map $ssl_server_name $ssl_certificate_name {" not in lines
+    assert [line for line in lines if line.startswith("ssl_certificate")] == [
+        "ssl_certificate /etc/ssl/certs/example.com.crt;",
+        "ssl_certificate_key /etc/ssl/private/example.com.key;",
+    ]
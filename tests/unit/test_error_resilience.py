@@ -360,7 +360,8 @@ def test_fresh_wildcard_cert_remains_preferred(webserver_for_error_tests):
 
     assert hosts[0].ssl_file == "*.example.com"
     assert hosts[1].ssl_file == "*.example.com"
-    mock_update_watch_domains.assert_called_once_with(["*.example.com", "api.example.com"])
+    # the fresh wildcard is only scheduled for later renewal
+    mock_update_watch_domains.assert_called_once_with(["api.example.com"])
 
 
 def test_fresh_wildcard_is_preferred_over_existing_specific_cert(webserver_for_error_tests):
@@ -389,7 +390,12 @@ def test_fresh_wildcard_is_preferred_over_existing_specific_cert(webserver_for_e
 
     assert hosts[0].ssl_file == wildcard
     assert hosts[1].ssl_file == wildcard
-    mock_update_watch_domains.assert_called_once_with([wildcard, specific])
+    mock_update_watch_domains.assert_not_called()
+    # both certificates are fresh, the wildcard is the first one due for renewal
+    next_renewal = webserver.ssl_processor.renewal_scheduler.next_renewal_time()
+    assert next_renewal == pytest.approx(
+        fresh_wildcard_cert.not_valid_after_utc.timestamp() - webserver.ssl_processor.cert_min_renew_threshold_secs
+    )
 
 
 def test_wildcard_near_expiry_is_not_preferred(webserver_for_error_tests):
@@ -592,6 +598,8 @@ def test_ssl_uses_renewal_manager_for_background_startup():
             start_ssl_thread=True,
         )
 
-    renewal.start.assert_called_once_with()
+    renewal.start.assert_not_called()
+    assert processor.renewal_scheduler.is_running()
     processor.shutdown()
+    assert not processor.renewal_scheduler.is_running()
     renewal.stop.assert_called_once_with()
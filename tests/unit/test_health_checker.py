@@ -0,0 +1,170 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from jinja2 import Template
+
+from nginx_proxy.BackendTarget import BackendTarget
+from nginx_proxy.health_checker import ActiveHealthChecker, parse_status_ranges
+from nginx_proxy.Host import Host
+from nginx_proxy.post_processors.upstream_processor import UpstreamProcessor
+from nginx_proxy.readiness_probe import ProbeTarget, is_ready, probe_targets
+
+
+class _Backend:
+    """Local HTTP server answering every request with ``status``."""
+
+    def __init__(self):
+        self.status = 200
+        self.paths = []
+        self.hosts = []
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                backend.paths.append(self.path)
+                backend.hosts.append(self.headers["Host"])
+                self.send_response(backend.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def target(self, id, env=None):
+        return BackendTarget(
+            id=id, address="127.0.0.1", port=self.port, path="", name=id, env=env or {}, backend_type="container"
+        )
+
+
+@pytest.fixture
+def backend():
+    backend = _Backend()
+    yield backend
+    backend.server.shutdown()
+    backend.server.server_close()
+
+
+def _closed_port():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    port = server.server_address[1]
+    server.server_close()
+    return port
+
+
+def test_status_ranges():
+    assert parse_status_ranges("200-399") == [(200, 399)]
+    assert parse_status_ranges("200, 204") == [(200, 200), (204, 204)]
+    with pytest.raises(ValueError):
+        parse_status_ranges("ok")
+
+
+def test_server_is_marked_down_after_fall_and_up_after_rise(backend, tmp_path):
+    target = backend.target("container1", env={"NGINX_HEALTH_CHECK_PATH": "healthz"})
+    metrics_file = tmp_path / "health-check.prom"
+    checker = ActiveHealthChecker(rise=2, fall=2, timeout=1, metrics_path=str(metrics_file))
+    checker.update_targets([{"containers": [target]}])
+
+    backend.status = 503
+    assert checker.run_round() is False
+    assert checker.run_round() is True
+    assert checker.is_down(target)
+    assert 'nginx_proxy_health_check_up{server="127.0.0.1:%d"} 0' % backend.port in metrics_file.read_text()
+
+    backend.status = 204
+    assert checker.run_round() is False
+    assert checker.is_down(target)
+    assert checker.run_round() is True
+    assert not checker.is_down(target)
+    assert backend.paths == ["/healthz"] * 4
+    metrics = checker.render_metrics()
+    assert 'nginx_proxy_health_check_probes_total{result="failure"} 2' in metrics
+    assert 'nginx_proxy_health_check_probes_total{result="success"} 2' in metrics
+    assert "nginx_proxy_health_check_state_changes_total 2" in metrics
+
+
+def test_unreachable_and_excluded_servers(backend):
+    unreachable = BackendTarget(
+        id="container2", address="127.0.0.1", port=_closed_port(), path="", name="c2", env={}, backend_type="container"
+    )
+    excluded = backend.target("container3", env={"NGINX_HEALTH_CHECK": "false"})
+    checker = ActiveHealthChecker(fall=1, timeout=1)
+    checker.update_targets([{"containers": [unreachable, excluded]}])
+
+    assert checker.run_round() is True
+    assert checker.is_down(unreachable)
+    assert not checker.is_down(excluded)
+    assert backend.paths == []
+
+
+def test_health_reloads_are_rate_limited():
+    now = [0.0]
+    reloads = []
+    checker = ActiveHealthChecker(on_change=lambda: reloads.append(now[0]), reload_interval=30, clock=lambda: now[0])
+
+    checker._notify_change(True)
+    now[0] = 10
+    checker._notify_change(True)
+    now[0] = 20
+    checker._notify_change(False)
+    assert reloads == [0]
+
+    now[0] = 35
+    checker._notify_change(False)
+    now[0] = 70
+    checker._notify_change(False)
+    assert reloads == [0, 35]
+
+
+def test_down_servers_are_rendered_unless_all_fail():
+    host = Host("example.com", 80)
+    healthy = BackendTarget(
+        id="container1", address="172.18.0.2", port=80, path="", name="c1", env={}, backend_type="container"
+    )
+    failing = BackendTarget(
+        id="container2", address="172.18.0.3", port=80, path="", name="c2", env={}, backend_type="container"
+    )
+    host.add_container("/", healthy)
+    host.add_container("/", failing)
+    down = {"container2"}
+    processor = UpstreamProcessor(is_down=lambda b: b.id in down)
+
+    upstreams = processor.process([host])
+    rendered = Template(open("vhosts_template/default.conf.jinja2").read()).render(
+        virtual_servers=[], upstreams=upstreams, config={}
+    )
+    assert "server  172.18.0.2:80;" in rendered
+    assert "server  172.18.0.3:80 down;" in rendered
+
+    # failing open, nginx keeps trying the servers instead of answering with 502
+    down.add("container1")
+    processor.process([host])
+    assert healthy.down is False
+    assert failing.down is False
+
+
+def test_probes_are_sent_for_the_virtual_host(backend):
+    target = backend.target("container1")
+    checker = ActiveHealthChecker(fall=1, timeout=1)
+    checker.update_targets([{"hostname": "*.example.com", "containers": [target]}])
+
+    checker.run_round()
+    assert is_ready(ProbeTarget("127.0.0.1", backend.port, False, "/ready", "app.example.com"))
+
+    assert backend.hosts == ["example.com", "app.example.com"]
+
+
+def test_start_probe_targets_carry_the_virtual_host():
+    container = BackendTarget(
+        id="container1",
+        name="app",
+        env={"VIRTUAL_HOST": "app.example.com -> :8080", "NGINX_START_PROBE_PATH": "ready"},
+        network_settings={"net1": {"NetworkID": "net1", "IPAddress": "172.18.0.2"}},
+        backend_type="container",
+    )
+
+    assert probe_targets(container, ["net1"]) == [ProbeTarget("172.18.0.2", 8080, False, "/ready", "app.example.com")]
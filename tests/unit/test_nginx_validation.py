@@ -1,6 +1,6 @@
 from types import SimpleNamespace
 
-from nginx.Nginx import Nginx
+from nginx.Nginx import Nginx, write_file
 
 
 def test_validate_config_restores_previous_config_after_failure(tmp_path, monkeypatch):
@@ -121,3 +121,36 @@ def test_update_config_can_skip_validation_for_prevalidated_candidate(tmp_path,
     assert config_file.read_text() == "candidate config"
     assert nginx.last_working_config == "candidate config"
     assert commands == [Nginx.command_reload]
+
+
+def test_write_file_replaces_target_without_leaving_staged_files(tmp_path):
+    target = tmp_path / "nginx-proxy.conf"
+    target.write_text("old")
+    old_inode = target.stat().st_ino
+
+    write_file(str(target), "new")
+
+    assert target.read_text() == "new"
+    assert target.stat().st_ino != old_inode
+    assert [p.name for p in tmp_path.iterdir()] == ["nginx-proxy.conf"]
+
+
+def test_update_config_failure_swaps_back_retained_previous_file(tmp_path, monkeypatch):
+    config_file = tmp_path / "conf.d" / "nginx-proxy.conf"
+    config_file.parent.mkdir()
+    config_file.write_text("previous config")
+    previous_inode = config_file.stat().st_ino
+
+    nginx = Nginx(str(config_file), str(tmp_path / "challenges"))
+
+    def fake_run(command, stdout=None, stderr=None):
+        assert config_file.read_text() == "candidate config"
+        return SimpleNamespace(returncode=1, stderr=b"reload failed\n")
+
+    monkeypatch.setattr("nginx.Nginx.subprocess.run", fake_run)
+
+    assert nginx.update_config("candidate config", validate=False) is False
+
+    assert config_file.read_text() == "previous config"
+    assert config_file.stat().st_ino == previous_inode
+    assert not (config_file.parent / ".nginx-proxy.conf.previous").exists()
@@ -0,0 +1,198 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+from nginx_proxy.Host import Host
+from nginx_proxy.ocsp_stapling import OcspStapler
+from nginx_proxy.post_processors.ssl_certificate_processor import SslCertificateProcessor
+
+
+def _name(common_name):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+
+class _Responder:
+    """Local OCSP responder answering GOOD for every certificate of its CA."""
+
+    def __init__(self):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        now = datetime.now(timezone.utc)
+        self.cert = (
+            x509.CertificateBuilder()
+            .subject_name(_name("Test CA"))
+            .issuer_name(_name("Test CA"))
+            .public_key(self.key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=365))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(self.key, hashes.SHA256())
+        )
+        self.requests = 0
+        responder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = ocsp.load_der_ocsp_request(self.rfile.read(int(self.headers["Content-Length"])))
+                responder.requests += 1
+                body = responder.respond(request.serial_number)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/ocsp-response")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.issued = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def issue(self, path, hostname):
+        key = ec.generate_private_key(ec.SECP256R1())
+        now = datetime.now(timezone.utc)
+        responder_url = x509.UniformResourceIdentifier(self.url)
+        ocsp_access = x509.AccessDescription(AuthorityInformationAccessOID.OCSP, responder_url)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(_name(hostname))
+            .issuer_name(self.cert.subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=90))
+            .add_extension(x509.AuthorityInformationAccess([ocsp_access]), critical=False)
+            .sign(self.key, hashes.SHA256())
+        )
+        self.issued[cert.serial_number] = cert
+        path.write_bytes(
+            cert.public_bytes(serialization.Encoding.PEM) + self.cert.public_bytes(serialization.Encoding.PEM)
+        )
+        return cert
+
+    def respond(self, serial_number):
+        now = datetime.now(timezone.utc)
+        return (
+            ocsp.OCSPResponseBuilder()
+            .add_response(
+                cert=self.issued[serial_number],
+                issuer=self.cert,
+                algorithm=hashes.SHA1(),
+                cert_status=ocsp.OCSPCertStatus.GOOD,
+                this_update=now,
+                next_update=now + timedelta(days=7),
+                revocation_time=None,
+                revocation_reason=None,
+            )
+            .responder_id(ocsp.OCSPResponderEncoding.HASH, self.cert)
+            .sign(self.key, hashes.SHA256())
+            .public_bytes(serialization.Encoding.DER)
+        )
+
+
+@pytest.fixture
+def responder():
+    responder = _Responder()
+    yield responder
+    responder.server.shutdown()
+    responder.server.server_close()
+
+
+def test_response_is_prefetched_stored_and_reused(tmp_path, responder):
+    cert_path = tmp_path / "example.com.crt"
+    responder.issue(cert_path, "example.com")
+    stapler = OcspStapler()
+    stapler.track([str(cert_path)])
+    assert stapler.stapling_file(str(cert_path)) is None
+
+    assert stapler.refresh_due() is True
+    assert stapler.stapling_file(str(cert_path)) == str(tmp_path / "example.com.ocsp")
+    stored = ocsp.load_der_ocsp_response((tmp_path / "example.com.ocsp").read_bytes())
+    assert stored.certificate_status == ocsp.OCSPCertStatus.GOOD
+
+    # fresh until half of the validity has passed, also after a restart
+    assert stapler.refresh_due() is False
+    restarted = OcspStapler()
+    restarted.track([str(cert_path)])
+    assert restarted.stapling_file(str(cert_path)) == str(tmp_path / "example.com.ocsp")
+    assert restarted.refresh_due() is False
+    assert responder.requests == 1
+
+
+def test_renewed_certificate_needs_a_new_response(tmp_path, responder):
+    cert_path = tmp_path / "example.com.crt"
+    responder.issue(cert_path, "example.com")
+    stapler = OcspStapler()
+    stapler.track([str(cert_path)])
+    stapler.refresh_due()
+
+    responder.issue(cert_path, "example.com")
+    assert stapler.stapling_file(str(cert_path)) is None
+    assert stapler.refresh_due() is True
+    assert stapler.stapling_file(str(cert_path)) is not None
+    assert responder.requests == 2
+
+
+def test_unreachable_responder_is_retried_later(tmp_path, responder):
+    cert_path = tmp_path / "example.com.crt"
+    responder.issue(cert_path, "example.com")
+    responder.server.shutdown()
+    responder.server.server_close()
+    now = [1000.0]
+    stapler = OcspStapler(retry_seconds=600, timeout=1, clock=lambda: now[0])
+    stapler.track([str(cert_path)])
+
+    assert stapler.refresh_due() is False
+    assert stapler._refresh_time(str(cert_path)) == 1600.0
+
+
+def test_prefetch_thread_survives_errors(tmp_path, responder):
+    cert_path = tmp_path / "example.com.crt"
+    responder.issue(cert_path, "example.com")
+    updated = threading.Event()
+    stapler = OcspStapler(on_updated=updated.set, retry_seconds=0.1)
+    failures = []
+    next_wait = stapler._next_wait
+
+    def failing_next_wait():
+        if not failures:
+            failures.append(True)
+            raise KeyError(str(cert_path))
+        return next_wait()
+
+    stapler._next_wait = failing_next_wait
+    stapler.start()
+    try:
+        stapler.track([str(cert_path)])
+        assert updated.wait(5)
+        assert failures
+        assert stapler._thread.is_alive()
+    finally:
+        stapler.stop()
+
+
+def test_processor_sets_stapling_file_for_issued_certificates(tmp_path, responder):
+    responder.issue(tmp_path / "example.com.crt", "example.com")
+    processor = SimpleNamespace(key_store=SimpleNamespace(certs_dir=str(tmp_path)), ocsp_stapler=OcspStapler())
+    apply_stapling_files = SslCertificateProcessor._apply_stapling_files
+    hosts = [Host("example.com", 443, {"https"}), Host("other.example.com", 443, {"https"})]
+    hosts[0].ssl_file = "example.com"
+    hosts[1].ssl_file = "other.example.com.selfsigned"
+
+    apply_stapling_files(processor, hosts, track=True)
+    assert "ssl_stapling_file" not in hosts[0].extras
+    processor.ocsp_stapler.refresh_due()
+    apply_stapling_files(processor, hosts, track=True)
+
+    assert hosts[0].extras["ssl_stapling_file"] == str(tmp_path / "example.com.ocsp")
+    assert "ssl_stapling_file" not in hosts[1].extras
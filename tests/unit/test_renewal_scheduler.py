@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+from nginx_proxy.renewal_scheduler import ExpiryRenewalScheduler
+
+DAY = 24 * 3600
+NOW = 1_000_000_000.0
+
+
+class _Certificates:
+    """domain -> expiry in days from NOW, recording every lookup"""
+
+    def __init__(self, **expiry_days):
+        self.expiry_days = dict(expiry_days)
+        self.lookups = []
+
+    def lookup(self, domain):
+        self.lookups.append(domain)
+        days = self.expiry_days.get(domain.replace(".", "_"))
+        if days is None:
+            return None
+        return domain, datetime.fromtimestamp(NOW + days * DAY, timezone.utc)
+
+
+def _scheduler(certificates, clock=lambda: NOW):
+    manager = Mock()
+    scheduler = ExpiryRenewalScheduler(manager, certificates.lookup, 10 * DAY, clock=clock)
+    return scheduler, manager
+
+
+def test_only_changed_domains_are_looked_up():
+    certificates = _Certificates(**{f"d{i}_example_com": 30 + i for i in range(100)})
+    scheduler, manager = _scheduler(certificates)
+
+    scheduler.update([f"d{i}.example.com" for i in range(100)], [])
+    certificates.lookups.clear()
+    scheduler.update(["d100.example.com"], ["d5.example.com"])
+
+    # d100 has no certificate, so it was renewed right away and looked up again to be rescheduled
+    assert certificates.lookups == ["d100.example.com", "d100.example.com"]
+    assert len(scheduler) == 100
+    manager.update_watch_domains.assert_called_once_with(["d100.example.com"])
+
+
+def test_heap_orders_by_renewal_time_and_skips_removed_domains():
+    certificates = _Certificates(a_example_com=40, b_example_com=20, c_example_com=30)
+    now = [NOW]
+    scheduler, manager = _scheduler(certificates, clock=lambda: now[0])
+    scheduler.update(["a.example.com", "b.example.com", "c.example.com"], [])
+    manager.update_watch_domains.assert_not_called()
+    assert scheduler.next_renewal_time() == NOW + 10 * DAY
+
+    scheduler.update([], ["b.example.com"])
+    assert scheduler.next_renewal_time() == NOW + 20 * DAY
+
+    now[0] = NOW + 25 * DAY
+    with scheduler._condition:
+        assert scheduler._pop_due(now[0]) == ["c.example.com"]
+    assert scheduler.next_renewal_time() == NOW + 30 * DAY
+
+
+def test_failed_renewal_is_retried_later():
+    certificates = _Certificates(old_example_com=5)
+    scheduler, manager = _scheduler(certificates)
+
+    assert scheduler.update(["old.example.com", "new.example.com"], []) == ["old.example.com", "new.example.com"]
+
+    manager.update_watch_domains.assert_called_once_with(["new.example.com", "old.example.com"])
+    assert scheduler._due == {
+        "new.example.com": NOW + scheduler.missing_retry_seconds,
+        "old.example.com": NOW + scheduler.renew_retry_seconds,
+    }
+
+
+def test_worker_renews_due_domains_and_notifies():
+    certificates = _Certificates(a_example_com=30)
+    now = [NOW]
+    scheduler, manager = _scheduler(certificates, clock=lambda: now[0])
+    scheduler.update(["a.example.com"], [])
+
+    def renew(domains):
+        certificates.expiry_days["a_example_com"] = 120
+
+    manager.update_watch_domains.side_effect = renew
+    scheduler.on_renewed = Mock(side_effect=lambda: scheduler.stop())
+    now[0] = NOW + 21 * DAY
+    scheduler.start()
+    worker = scheduler._thread
+    worker.join(timeout=5)
+
+    assert not worker.is_alive()
+    manager.update_watch_domains.assert_called_once_with(["a.example.com"])
+    scheduler.on_renewed.assert_called_once_with()
+    assert scheduler.next_renewal_time() == NOW + 110 * DAY
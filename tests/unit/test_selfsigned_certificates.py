@@ -0,0 +1,48 @@
+import os
+
+from cryptography import x509
+
+from nginx_proxy.selfsigned_certificates import create_selfsigned_placeholders, share_key_with_group
+
+
+def _jobs(tmp_path, hostnames):
+    return [(hostname, str(tmp_path / f"{hostname}.crt"), str(tmp_path / f"{hostname}.key")) for hostname in hostnames]
+
+
+def _san(cert_path):
+    with open(cert_path, "rb") as cert_file:
+        cert = x509.load_pem_x509_certificate(cert_file.read())
+    return cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+
+
+def test_each_host_gets_its_own_placeholder(tmp_path):
+    jobs = _jobs(tmp_path, ["a.example.com", "b.example.com", "*.example.net"])
+
+    create_selfsigned_placeholders(jobs, max_workers=2)
+
+    assert [_san(cert_path) for _, cert_path, _ in jobs] == [["a.example.com"], ["b.example.com"], ["*.example.net"]]
+    assert len({(tmp_path / "a.example.com.key").read_text(), (tmp_path / "b.example.com.key").read_text()}) == 2
+    assert oct((tmp_path / "a.example.com.key").stat().st_mode & 0o777) == oct(0o600)
+
+
+def test_shared_placeholder_covers_all_hosts(tmp_path):
+    jobs = _jobs(tmp_path, ["b.example.com", "a.example.com"])
+
+    create_selfsigned_placeholders(jobs, shared=True)
+
+    assert _san(jobs[0][1]) == _san(jobs[1][1]) == ["a.example.com", "b.example.com"]
+    assert (tmp_path / "a.example.com.key").read_text() == (tmp_path / "b.example.com.key").read_text()
+
+
+def test_keys_are_readable_by_the_worker_group(tmp_path):
+    jobs = _jobs(tmp_path, ["a.example.com"])
+    old_key = tmp_path / "b.example.com.key"
+    old_key.write_text("key")
+    old_key.chmod(0o600)
+
+    create_selfsigned_placeholders(jobs, key_group=os.getgid())
+    share_key_with_group(str(old_key), os.getgid())
+
+    for key in (tmp_path / "a.example.com.key", old_key):
+        assert oct(key.stat().st_mode & 0o777) == oct(0o640)
+        assert key.stat().st_gid == os.getgid()
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+from jinja2 import Template
+
+from nginx_proxy.session_tickets import TICKET_KEY_SIZE, SessionTicketKeys, session_cache_size
+
+HOUR = 3600
+TEMPLATE_PATH = Path(__file__).resolve().parents[2] / "vhosts_template" / "default.conf.jinja2"
+
+
+def _keys(directory, now, retain=2):
+    return SessionTicketKeys(str(directory), rotation_seconds=HOUR, retain=retain, clock=lambda: now[0])
+
+
+def test_key_is_created_once_per_period(tmp_path):
+    now = [100 * HOUR + 10]
+    keys = _keys(tmp_path, now)
+
+    first = keys.ensure_keys()
+    assert first == [str(tmp_path / "ticket-100.key"), str(tmp_path / "ticket-101.key")]
+    content = (tmp_path / "ticket-100.key").read_bytes()
+    assert len(content) == TICKET_KEY_SIZE
+    assert oct(os.stat(first[0]).st_mode & 0o777) == "0o600"
+
+    now[0] += 60
+    assert keys.ensure_keys() == first
+    assert (tmp_path / "ticket-100.key").read_bytes() == content
+    assert keys.seconds_until_rotation() == HOUR - 70
+
+
+def test_rotation_keeps_previous_keys_and_prunes_older(tmp_path):
+    now = [100 * HOUR]
+    keys = _keys(tmp_path, now, retain=2)
+    for _ in range(4):
+        keys.ensure_keys()
+        now[0] += HOUR
+
+    assert keys.ensure_keys() == [str(tmp_path / f"ticket-{period}.key") for period in (104, 105, 103, 102)]
+    assert sorted(os.listdir(tmp_path)) == ["ticket-102.key", "ticket-103.key", "ticket-104.key", "ticket-105.key"]
+
+
+def test_replicas_sharing_the_directory_agree_on_keys(tmp_path):
+    now = [100 * HOUR]
+    replica_a = _keys(tmp_path, now)
+    replica_b = _keys(tmp_path, now)
+
+    assert replica_a.ensure_keys() == replica_b.ensure_keys()
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_next_key_is_published_before_rotation(tmp_path):
+    now = [100 * HOUR + HOUR - 1]
+    ahead = _keys(tmp_path, [now[0] + 2])
+    behind = _keys(tmp_path, now)
+
+    # the replica that rotated encrypts with the key the other one already decrypts with
+    encrypting = ahead.ensure_keys()[0]
+    assert encrypting == str(tmp_path / "ticket-101.key")
+    assert encrypting in behind.ensure_keys()[1:]
+
+
+def test_session_cache_size_follows_expected_sessions():
+    assert session_cache_size(0) == "50m"
+    assert session_cache_size(100) == "1m"
+    assert session_cache_size(100_000) == "25m"
+
+
+def test_template_configures_ticket_keys(tmp_path):
+    template = Template(TEMPLATE_PATH.read_text())
+    keys = [str(tmp_path / "ticket-2.key"), str(tmp_path / "ticket-1.key")]
+
+    managed = template.render(
+        config={"ssl_session_ticket_keys": keys, "ssl_session_cache_size": "25m"}, virtual_servers=[], upstreams=[]
+    )
+    default = template.render(config={}, virtual_servers=[], upstreams=[])
+
+    assert "ssl_session_cache shared:SSL:25m;" in managed
+    assert "ssl_session_tickets on;" in managed
+    assert [line for line in managed.splitlines() if line.startswith("ssl_session_ticket_key")] == [
+        f"ssl_session_ticket_key {key};" for key in keys
+    ]
+    assert "ssl_session_cache shared:SSL:50m;" in default
+    assert "ssl_session_tickets off;" in default
+    assert "ssl_session_ticket_key" not in default
@@ -19,7 +19,8 @@ def _make_server():
                 "host": "certapi.example.com",
                 "scheme": "https",
                 "port": 443,
-            }
+            },
+            "cert_reload_batch_seconds": 0,
         },
         reload=Mock(),
         enqueue_reload=Mock(),
@@ -79,7 +80,7 @@ def test_certapi_batch_domains_passed_to_renewal_manager(monkeypatch):
     assert processor.certapi_batch_domains is False
     backend.obtain.assert_not_called()
     assert processor._test_renewal_cls_call_args.kwargs["batch_domains"] is False
-    assert processor._test_renewal_cls_call_args.kwargs["renewal_callback"] == processor.ssl_renewal_callback
+    assert processor.renewal_scheduler.on_renewed == processor.ssl_renewal_callback
 
 
 def test_processor_does_not_obtain_directly_and_triggers_renewal_once(monkeypatch):
@@ -98,9 +99,11 @@ def test_processor_does_not_obtain_directly_and_triggers_renewal_once(monkeypatc
 
 def test_ssl_starts_and_stops_certapi_renewal_manager(monkeypatch):
     processor, _backend, renewal = _build_processor(monkeypatch, None, start_ssl_thread=True)
-    renewal.start.assert_called_once_with()
+    renewal.start.assert_not_called()
+    assert processor.renewal_scheduler.is_running()
 
     processor.shutdown()
+    assert not processor.renewal_scheduler.is_running()
     renewal.stop.assert_called_once_with()
 
 
@@ -112,10 +115,53 @@ def test_ssl_renewal_callback_enqueues_server_reload(monkeypatch):
     processor.ssl_renewal_callback()
 
     renewal.update_watch_domains.assert_not_called()
-    server.enqueue_reload.assert_called_once_with(force=True)
+    server.enqueue_reload.assert_called_once_with(event="certificate renewal")
     server.reload.assert_not_called()
 
 
+def test_renewals_within_batch_window_share_one_reload(monkeypatch):
+    server = _make_server()
+    processor, _backend, _renewal = _build_processor(monkeypatch, None)
+    processor.server = server
+    processor.reload_batch_seconds = 60
+
+    processor.ssl_renewal_callback()
+    processor.ssl_renewal_callback()
+    processor._on_certificates_issued(["a.example.com"])
+    server.enqueue_reload.assert_not_called()
+
+    timer = processor._reload_timer
+    timer.cancel()
+    timer.function(*timer.args)
+    server.enqueue_reload.assert_called_once_with(event="certificate renewal")
+
+    processor.shutdown()
+    assert processor._reload_timer is None
+
+
+def test_reload_is_forced_only_when_used_certificate_changed(monkeypatch, tmp_path):
+    processor, _backend, _renewal = _build_processor(monkeypatch, None)
+    processor.key_store.certs_dir = str(tmp_path)
+    processor.key_store.find_key_and_cert_by_domain.return_value = None
+    processor._select_ssl_file = lambda host: host.hostname
+    cert_file = tmp_path / "a.example.com.crt"
+    cert_file.write_text("first")
+
+    def render():
+        processor.process_ssl_certificates([Host("a.example.com", 443, {"https"})])
+        return processor.certificates_changed()
+
+    assert render() is False
+    assert render() is False
+    cert_file.write_text("renewed")
+    assert render() is True
+    # kept until nginx reloaded successfully
+    assert render() is True
+    processor.certificates_reloaded()
+    assert processor.certificates_changed() is False
+    assert render() is False
+
+
 def test_ssl_renewal_callback_ignores_missing_server(monkeypatch):
     processor, _backend, renewal = _build_processor(monkeypatch, None)
     processor.server = None
@@ -187,3 +233,18 @@ def test_getssl_passes_self_verify_true_to_local_backend_by_default(monkeypatch,
         runpy.run_path(str(REPO_ROOT / "getssl"), run_name="__main__")
 
     backend.obtain.assert_called_once_with(["api.example.com"], key_type="ecdsa", batch_domains=True, self_verify=True)
+
+
+def test_issued_batches_share_one_pending_reload(monkeypatch):
+    server = _make_server()
+    processor, _backend, _renewal = _build_processor(monkeypatch, None)
+    processor.server = server
+    processor.key_store.find_key_and_cert_by_domain.return_value = None
+
+    processor._on_certificates_issued(["a.example.com"])
+    processor._on_certificates_issued(["b.example.com"])
+    server.enqueue_reload.assert_called_once_with(event="certificate issued")
+
+    processor.process_ssl_certificates([Host("a.example.com", 443, {"https"})])
+    processor._on_certificates_issued(["c.example.com"])
+    assert server.enqueue_reload.call_count == 2
@@ -0,0 +1,172 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from nginx_proxy.BackendTarget import BackendTarget
+from nginx_proxy.Host import Host
+from nginx_proxy.post_processors.upstream_processor import UpstreamProcessor
+from nginx_proxy.pre_processors.virtual_host_processor import host_generator
+from nginx_proxy.swarm_tasks import SwarmTask, SwarmTopology
+from nginx_proxy.WebServer import WebServer
+
+
+def _task(task_id, node_id, address, state="running"):
+    return {
+        "ID": task_id,
+        "NodeID": node_id,
+        "Status": {"State": state},
+        "NetworksAttachments": [
+            {"Network": {"ID": "ingress"}, "Addresses": ["10.0.0.9/24"]},
+            {"Network": {"ID": "net1"}, "Addresses": [address + "/24"]},
+        ],
+    }
+
+
+def _topology():
+    swarm_client = MagicMock()
+    swarm_client.info.return_value = {"Swarm": {"NodeID": "node1"}}
+    swarm_client.nodes.list.return_value = [
+        SimpleNamespace(id=node_id, attrs={"Spec": {"Labels": {"zone": zone} if zone else {}}})
+        for node_id, zone in (("node1", "a"), ("node2", "a"), ("node3", "b"))
+    ]
+    return SwarmTopology(swarm_client)
+
+
+def test_service_tasks_carry_node_zone_and_addresses():
+    topology = _topology()
+    service = MagicMock()
+    service.tasks.return_value = [
+        _task("task2", "node2", "10.0.1.3"),
+        _task("task1", "node3", "10.0.1.2"),
+        _task("task3", "node1", "10.0.1.4", state="starting"),
+    ]
+
+    tasks = topology.service_tasks(service)
+
+    service.tasks.assert_called_once_with(filters={"desired-state": "running"})
+    assert topology.node_id == "node1" and topology.zone == "a"
+    assert tasks == [
+        SwarmTask("task1", "node3", "b", {"ingress": "10.0.0.9", "net1": "10.0.1.2"}),
+        SwarmTask("task2", "node2", "a", {"ingress": "10.0.0.9", "net1": "10.0.1.3"}),
+    ]
+    assert [topology.proximity(task) for task in tasks] == [2, 1]
+
+
+def _service_backend(tasks, env=None):
+    service = BackendTarget(
+        id="service1",
+        name="web",
+        env={"VIRTUAL_HOST": "example.com -> :8080", **(env or {})},
+        network_settings={"net1": {"NetworkID": "net1", "IPAddress": "10.0.1.100"}},
+        backend_type="service",
+        tasks=tasks,
+    )
+    host = Host("example.com", 80)
+    for generated_host, location, target, _extras in host_generator(service, known_networks={"net1"}):
+        host.add_container(location, target)
+    return host
+
+
+def test_closest_tasks_take_traffic_and_others_are_backup():
+    topology = _topology()
+    topology.refresh_nodes()
+    host = _service_backend(
+        [
+            SwarmTask("task1", "node3", "b", {"net1": "10.0.1.2"}),
+            SwarmTask("task2", "node2", "a", {"net1": "10.0.1.3"}),
+            SwarmTask("task3", "node2", "a", {"net1": "10.0.1.4"}),
+        ]
+    )
+
+    upstreams = UpstreamProcessor(topology=topology).process([host])
+
+    assert [(b.address, b.port, b.type, b.backup) for b in upstreams[0]["containers"]] == [
+        ("10.0.1.100", 8080, "service", True),
+        ("10.0.1.2", 8080, "task", True),
+        ("10.0.1.3", 8080, "task", False),
+        ("10.0.1.4", 8080, "task", False),
+    ]
+    assert host.locations["/"].upstream == upstreams[0]["id"]
+
+
+def test_single_task_without_topology_is_routed_directly():
+    host = _service_backend([SwarmTask("task1", "node3", None, {"net1": "10.0.1.2"})])
+
+    upstreams = UpstreamProcessor().process([host])
+
+    assert [(b.address, b.backup) for b in upstreams[0]["containers"]] == [("10.0.1.100", True), ("10.0.1.2", False)]
+
+
+def test_sticky_sessions_route_to_all_tasks_without_vip_backup():
+    topology = _topology()
+    topology.refresh_nodes()
+    tasks = [
+        SwarmTask("task1", "node3", "b", {"net1": "10.0.1.2"}),
+        SwarmTask("task2", "node2", "a", {"net1": "10.0.1.3"}),
+    ]
+
+    for env, sticky, balance in (
+        ({"NGINX_STICKY_SESSION": "true"}, "ip_hash", None),
+        ({"NGINX_UPSTREAM_BALANCE": "hash $request_uri consistent"}, None, "hash $request_uri consistent"),
+    ):
+        upstreams = UpstreamProcessor(topology=topology).process([_service_backend(tasks, env)])
+
+        assert [(b.address, b.backup) for b in upstreams[0]["containers"]] == [("10.0.1.2", False), ("10.0.1.3", False)]
+        assert (upstreams[0]["sticky"], upstreams[0]["balance"]) == (sticky, balance)
+
+
+def _dnsrr_service(task_addresses):
+    service = MagicMock()
+    service.id = "service1"
+    service.attrs = {
+        "Spec": {
+            "Name": "web",
+            "Labels": {},
+            "TaskTemplate": {
+                "ContainerSpec": {"Env": ["VIRTUAL_HOST=example.com"]},
+                "Networks": [{"Target": "net1"}],
+            },
+            "EndpointSpec": {"Mode": "dnsrr"},
+        },
+        "Endpoint": {},
+    }
+    service.tasks.return_value = [
+        _task(f"task{i}", "node2", address) for i, address in enumerate(task_addresses, start=1)
+    ]
+    return service
+
+
+def test_dnsrr_service_is_routed_to_its_tasks():
+    service = _dnsrr_service(["10.0.1.2", "10.0.1.3"])
+    backend = BackendTarget.from_service(service)
+    assert backend.network_settings == {"net1": {"NetworkID": "net1", "IPAddress": None}}
+    backend.tasks = _topology().service_tasks(service)
+
+    host = Host("example.com", 80)
+    for _host, location, target, _extras in host_generator(backend, known_networks={"net1"}):
+        host.add_container(location, target)
+    upstreams = UpstreamProcessor().process([host])
+
+    assert [(b.address, b.type, b.backup) for b in upstreams[0]["containers"]] == [
+        ("10.0.1.2", "task", False),
+        ("10.0.1.3", "task", False),
+    ]
+
+
+def test_refresh_updates_only_services_whose_tasks_changed():
+    unchanged, changed, other = (_dnsrr_service(["10.0.1.2"]) for _ in range(3))
+    changed.id = "service2"
+    other.id = "service3"
+    other.attrs["Spec"]["TaskTemplate"]["ContainerSpec"]["Env"] = []
+    topology = _topology()
+    server = SimpleNamespace(
+        swarm_topology=topology,
+        swarm_client=MagicMock(),
+        _swarm_tasks={"service1": topology.service_tasks(unchanged), "service2": []},
+        update_backend=MagicMock(),
+    )
+    server.swarm_client.services.list.return_value = [unchanged, changed, other]
+    server.attach_swarm_tasks = lambda backend, service: WebServer.attach_swarm_tasks(server, backend, service)
+
+    WebServer.refresh_swarm_tasks(server)
+
+    assert [call.args[0].id for call in server.update_backend.call_args_list] == ["service2"]
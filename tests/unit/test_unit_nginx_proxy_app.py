@@ -24,6 +24,7 @@ def test_load_config_from_env(mock_docker_client, mock_from_env):
             "DOCKER_SWARM": "strict",
             "SWARM_DOCKER_HOST": "tcp://swarm:2375",
             "DEFAULT_SSL_DOMAINS": "*.xyz.com, *.example.com",
+            "UPSTREAM_MAX_FAILS": "",
         },
     ):
         with patch("sys.exit"):
@@ -40,6 +41,11 @@ def test_load_config_from_env(mock_docker_client, mock_from_env):
             assert config["swarm_docker_host"] == "tcp://swarm:2375"
             assert config["static_site_root"] == "/static"
             assert config["default_ssl_domains"] == ["*.xyz.com", "*.example.com"]
+            assert config["upstream_max_fails"] == 3
+            # nginx's own retry policy applies unless it's configured
+            assert config["proxy_next_upstream"] is None
+            assert config["proxy_next_upstream_tries"] is None
+            assert config["proxy_next_upstream_timeout"] is None
 
 
 def test_detect_nginx_resolvers_reads_resolv_conf(tmp_path):
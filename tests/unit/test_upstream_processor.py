@@ -170,3 +170,284 @@ def test_backup_service_vip_is_rendered_in_upstream():
     assert "server  10.0.0.5:80 backup;" in rendered
     assert "# container: container1" in rendered
     assert "# service: service1" in rendered
+
+
+def test_upstream_ids_and_order_do_not_depend_on_discovery_order():
+    def build(reverse):
+        hosts = [Host("b.example.com", 80), Host("a.example.com", 80)]
+        backends = [
+            _backend("container1", "172.18.0.2", "container"),
+            _backend("container2", "172.18.0.3", "container"),
+        ]
+        if reverse:
+            hosts.reverse()
+            backends.reverse()
+        for host in hosts:
+            for backend in backends:
+                host.add_container("/", backend)
+        other = Host("c.example.com", 80)
+        other.add_container("/", _backend("container3", "172.18.0.4", "container"))
+        other.add_container("/", _backend("container4", "172.18.0.5", "container"))
+        hosts.insert(0 if reverse else len(hosts), other)
+        return hosts, UpstreamProcessor().process(hosts)
+
+    hosts, upstreams = build(reverse=False)
+    reversed_hosts, reversed_upstreams = build(reverse=True)
+
+    assert [u["id"] for u in upstreams] == [u["id"] for u in reversed_upstreams]
+    assert [u["id"] for u in upstreams] == sorted(u["id"] for u in upstreams)
+    assert [u["id"].split("_")[0] for u in upstreams] == ["a.example.com", "c.example.com"]
+    assert [[c.id for c in u["containers"]] for u in upstreams] == [
+        [c.id for c in u["containers"]] for u in reversed_upstreams
+    ]
+    assert {h.hostname: h.locations["/"].upstream for h in hosts} == {
+        h.hostname: h.locations["/"].upstream for h in reversed_hosts
+    }
+
+
+def _render(hosts, upstreams):
+    with open("vhosts_template/default.conf.jinja2") as template_file:
+        return Template(template_file.read()).render(
+            virtual_servers=hosts,
+            upstreams=upstreams,
+            config={"client_max_body_size": "1m", "default_server": False},
+        )
+
+
+def test_single_backend_gets_keepalive_upstream():
+    host = Host("example.com", 80)
+    host.add_container("/", _backend("container1", "172.18.0.2", "container"))
+    host.is_down = False
+    host.locations["/"].container = host.locations["/"].backends[0]
+
+    upstreams = UpstreamProcessor(keepalive=32, keepalive_requests=1000, keepalive_timeout="4s").process([host])
+
+    assert len(upstreams) == 1
+    assert host.locations["/"].upstream == upstreams[0]["id"]
+    assert upstreams[0]["sticky"] is None
+    lines = [line.strip() for line in _render([host], upstreams).splitlines()]
+    upstream_block = lines[lines.index(f"upstream {upstreams[0]['id']} {{") :]
+    assert upstream_block[1:5] == [
+        "server  172.18.0.2:80;   # container: container1",
+        "keepalive 32;",
+        "keepalive_requests 1000;",
+        "keepalive_timeout 4s;",
+    ]
+    assert f"proxy_pass http://{upstreams[0]['id']};    # container: container1" in lines
+    assert 'proxy_set_header Connection "";' in lines
+
+
+def test_keepalive_disabled_keeps_single_backend_direct():
+    host = Host("example.com", 80)
+    host.add_container("/", _backend("container1", "172.18.0.2", "container"))
+
+    assert UpstreamProcessor(keepalive=0).process([host]) == []
+    assert host.locations["/"].upstream is False
+
+
+def test_static_site_is_not_put_in_a_keepalive_upstream():
+    host = Host("static.example.com", 443, scheme={"https"})
+    site = BackendTarget(
+        id="static-site:static.example.com", name="static.example.com", path="/static", backend_type="static_site"
+    )
+    host.add_container("/", site, websocket=False, http=True)
+    host.is_down = False
+    host.locations["/"].container = site
+
+    upstreams = UpstreamProcessor(keepalive=32).process([host])
+
+    assert upstreams == []
+    assert host.locations["/"].upstream is False
+    assert "None:None" not in _render([host], upstreams)
+
+
+def test_backend_env_and_labels_override_keepalive():
+    host = Host("example.com", 80)
+    first = _backend("container1", "172.18.0.2", "container", labels={"NGINX_UPSTREAM_KEEPALIVE_TIMEOUT": "30s"})
+    second = _backend("container2", "172.18.0.3", "container")
+    first.env = {"NGINX_UPSTREAM_KEEPALIVE": "8", "NGINX_UPSTREAM_KEEPALIVE_REQUESTS": "-1"}
+    second.env = {"NGINX_UPSTREAM_KEEPALIVE_REQUESTS": "200"}
+    host.add_container("/", first)
+    host.add_container("/", second)
+    other = Host("api.example.com", 80)
+    disabled = _backend("container3", "172.18.0.4", "container", labels={"NGINX_UPSTREAM_KEEPALIVE": "0"})
+    other.add_container("/", disabled)
+
+    upstreams = UpstreamProcessor(keepalive=32, keepalive_timeout="4s").process([host, other])
+
+    assert len(upstreams) == 1
+    assert {name: upstreams[0][name] for name in ("keepalive", "keepalive_requests", "keepalive_timeout")} == {
+        "keepalive": "8",
+        "keepalive_requests": "200",
+        "keepalive_timeout": "30s",
+    }
+    assert other.locations["/"].upstream is False
+
+
+def _upstream_lines(upstreams):
+    lines = [line.strip() for line in _render([], upstreams).splitlines()]
+    start = lines.index(f"upstream {upstreams[0]['id']} {{")
+    return lines[start + 1 : lines.index("}", start)]
+
+
+def test_balance_method_weight_and_max_conns_are_rendered():
+    host = Host("example.com", 80)
+    small = _backend("container1", "172.18.0.2", "container", labels={"NGINX_UPSTREAM_BALANCE": "least_conn"})
+    big = _backend("container2", "172.18.0.3", "container")
+    big.env = {"NGINX_UPSTREAM_WEIGHT": "4", "NGINX_UPSTREAM_MAX_CONNS": "200"}
+    host.add_container("/", big)
+    host.add_container("/", small)
+
+    upstreams = UpstreamProcessor().process([host])
+
+    assert upstreams[0]["balance"] == "least_conn"
+    assert _upstream_lines(upstreams) == [
+        "least_conn;",
+        "server  172.18.0.2:80;   # container: container1",
+        "server  172.18.0.3:80 weight=4 max_conns=200;   # container: container2",
+    ]
+
+
+def test_conflicting_and_invalid_balance_methods():
+    host = Host("example.com", 80)
+    first = _backend("container1", "172.18.0.2", "container")
+    second = _backend("container2", "172.18.0.3", "container")
+    third = _backend("container3", "172.18.0.4", "container")
+    first.env = {"NGINX_UPSTREAM_BALANCE": "hash  $request_uri   consistent", "NGINX_UPSTREAM_WEIGHT": "0"}
+    second.env = {"NGINX_UPSTREAM_BALANCE": "random two least_conn"}
+    third.env = {"NGINX_UPSTREAM_BALANCE": "hash $uri; return 200"}
+    for backend in (third, second, first):
+        host.add_container("/", backend)
+
+    upstreams = UpstreamProcessor().process([host])
+
+    assert upstreams[0]["balance"] == "hash $request_uri consistent"
+    assert first.weight is None
+
+
+def test_sticky_session_and_backup_servers_limit_balance_method():
+    sticky_host = Host("sticky.example.com", 80)
+    sticky_backend = _backend("container1", "172.18.0.2", "container")
+    sticky_backend.env = {"NGINX_STICKY_SESSION": "true", "NGINX_UPSTREAM_BALANCE": "least_conn"}
+    sticky_host.add_container("/", sticky_backend)
+    sticky_host.add_container("/", _backend("container2", "172.18.0.3", "container"))
+
+    backup_host = Host("backup.example.com", 80)
+    local_labels = {"com.docker.swarm.service.id": "service1", "NGINX_UPSTREAM_BALANCE": "random"}
+    backup_host.add_container("/", _backend("container3", "172.18.0.4", "container", labels=local_labels))
+    backup_host.add_container("/", _backend("service1", "10.0.0.5", "service"))
+
+    upstreams = {u["containers"][0].id: u for u in UpstreamProcessor().process([sticky_host, backup_host], True)}
+
+    assert (upstreams["container1"]["sticky"], upstreams["container1"]["balance"]) == ("ip_hash", None)
+    assert upstreams["service1"]["balance"] is None
+
+
+def test_weights_follow_cpu_limits():
+    host = Host("example.com", 80)
+    backends = [_backend(f"container{i}", f"172.18.0.{i}", "container") for i in (2, 3, 4)]
+    for backend, cpu_limit in zip(backends, (0.5, 2.0, 1.0)):
+        backend.cpu_limit = cpu_limit
+        host.add_container("/", backend)
+    backends[2].labels = {"NGINX_UPSTREAM_WEIGHT": "3"}
+
+    UpstreamProcessor().process([host])
+
+    assert [backend.weight for backend in backends] == ["1", "4", "3"]
+
+
+def test_cpu_weights_need_a_limit_on_every_backend():
+    host = Host("example.com", 80)
+    limited = _backend("container1", "172.18.0.2", "container")
+    limited.cpu_limit = 2.0
+    host.add_container("/", limited)
+    host.add_container("/", _backend("container2", "172.18.0.3", "container"))
+    other = Host("api.example.com", 80)
+    unequal = [_backend(f"container{i}", f"172.18.0.{i}", "container") for i in (4, 5)]
+    for backend, cpu_limit in zip(unequal, (0.5, 0.75)):
+        backend.cpu_limit = cpu_limit
+        other.add_container("/", backend)
+
+    UpstreamProcessor().process([host])
+    assert limited.weight is None
+    UpstreamProcessor(cpu_weights=False).process([other])
+    assert [backend.weight for backend in unequal] == [None, None]
+    UpstreamProcessor().process([other])
+    assert [backend.weight for backend in unequal] == ["5", "8"]
+
+
+def test_passive_health_defaults_and_backend_overrides():
+    host = Host("example.com", 80)
+    tuned = _backend("container1", "172.18.0.2", "container")
+    tuned.max_fails, tuned.fail_timeout = "1", "30s"
+    host.add_container("/", tuned)
+    host.add_container("/", _backend("container2", "172.18.0.3", "container"))
+
+    upstreams = UpstreamProcessor(max_fails=3, fail_timeout="10s").process([host])
+
+    assert _upstream_lines(upstreams) == [
+        "server  172.18.0.2:80 max_fails=1 fail_timeout=30s;   # container: container1",
+        "server  172.18.0.3:80 max_fails=3 fail_timeout=10s;   # container: container2",
+    ]
+
+
+def test_retry_policy_defaults_are_rendered_at_http_level():
+    with open("vhosts_template/default.conf.jinja2") as template_file:
+        template = Template(template_file.read())
+    config = {
+        "proxy_next_upstream": "error timeout http_502",
+        "proxy_next_upstream_tries": 0,
+        "proxy_next_upstream_timeout": "10s",
+    }
+
+    lines = [line.strip() for line in template.render(virtual_servers=[], upstreams=[], config=config).splitlines()]
+
+    assert "proxy_next_upstream error timeout http_502;" in lines
+    assert "proxy_next_upstream_tries 0;" in lines
+    assert "proxy_next_upstream_timeout 10s;" in lines
+
+
+def test_retry_policy_is_left_to_nginx_when_not_configured():
+    with open("vhosts_template/default.conf.jinja2") as template_file:
+        template = Template(template_file.read())
+
+    for config in ({}, {"proxy_next_upstream": None, "proxy_next_upstream_tries": None}):
+        rendered = template.render(virtual_servers=[], upstreams=[], config=config)
+        assert "proxy_next_upstream" not in rendered
+
+
+def test_upstream_id_is_kept_when_replicas_change():
+    def build(addresses, labels=None):
+        host = Host("example.com", 80)
+        for i, address in enumerate(addresses):
+            host.add_container("/", _backend(f"container{i}", address, "container", labels=labels))
+        host.add_container("/api", _backend("api1", "172.18.1.2", "container"))
+        host.add_container("/api", _backend("api2", "172.18.1.3", "container"))
+        UpstreamProcessor(keepalive=32).process([host])
+        return host.locations["/"].upstream, host.locations["/api"].upstream
+
+    scaled_up = build(["172.18.0.2", "172.18.0.3", "172.18.0.4"])
+    assert build(["172.18.0.2", "172.18.0.3"]) == scaled_up
+    assert scaled_up[0].startswith("example.com_") and scaled_up[0] != scaled_up[1]
+
+    service = {"com.docker.compose.project": "shop", "com.docker.compose.service": "web"}
+    assert build(["172.18.0.2", "172.18.0.3"], labels=service) == build(["172.18.0.5"], labels=service)
+    assert build(["172.18.0.5"], labels=service)[0] != scaled_up[0]
+
+
+def test_service_proxied_on_two_ports_gets_two_upstreams():
+    host = Host("example.com", 80)
+    labels = {"com.docker.swarm.service.id": "service1"}
+    host.add_container("/", _backend("task1", "172.18.0.2", "container", labels=labels))
+    host.add_container("/", _backend("task2", "172.18.0.3", "container", labels=labels))
+    host.add_container("/admin", _backend("task1", "172.18.0.2", "container", port=8080, labels=labels))
+    host.add_container("/admin", _backend("task2", "172.18.0.3", "container", port=8080, labels=labels))
+    shared = Host("www.example.com", 80)
+    shared.add_container("/", _backend("task1", "172.18.0.2", "container", labels=labels))
+    shared.add_container("/", _backend("task2", "172.18.0.3", "container", labels=labels))
+
+    upstreams = UpstreamProcessor().process([shared, host])
+
+    assert len(upstreams) == 2
+    assert shared.locations["/"].upstream == host.locations["/"].upstream
+    assert host.locations["/admin"].upstream != host.locations["/"].upstream
@@ -3,10 +3,15 @@ import os
 from unittest.mock import MagicMock, patch, mock_open
 from datetime import datetime, timedelta, timezone
 
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
 from nginx_proxy.BackendTarget import BackendTarget
 from nginx_proxy.DockerEventListener import Reload
 from nginx_proxy.Host import Host
 from nginx_proxy.ProxyConfigData import ProxyConfigData
+from nginx_proxy.readiness_probe import ProbeTarget
 from nginx_proxy.WebServer import WebServer
 
 
@@ -28,7 +33,10 @@ def web_server(mock_config):
     with (
         patch("builtins.open", mock_open(read_data="template_content")),
         patch("nginx_proxy.WebServer.DummyNginx"),
-        patch("nginx_proxy.post_processors.SslCertificateProcessor"),
+        patch(
+            "nginx_proxy.post_processors.SslCertificateProcessor",
+            **{"return_value.certificates_changed.return_value": False},
+        ),
     ):
         server = WebServer(MagicMock(), mock_config, swarm_client=MagicMock())
         return server
@@ -43,7 +51,10 @@ def test_init_bypasses_startup_grace_on_initial_rescan(mock_config):
     with (
         patch("builtins.open", mock_open(read_data="template_content")),
         patch("nginx_proxy.WebServer.DummyNginx"),
-        patch("nginx_proxy.post_processors.SslCertificateProcessor"),
+        patch(
+            "nginx_proxy.post_processors.SslCertificateProcessor",
+            **{"return_value.certificates_changed.return_value": False},
+        ),
         patch.object(WebServer, "rescan_and_reload") as mock_rescan,
     ):
         WebServer(MagicMock(), mock_config, swarm_client=MagicMock())
@@ -110,6 +121,31 @@ def test_remove_backend(web_server):
         config_data.remove_backend.assert_called_with("container1")
 
 
+def test_drained_backend_is_down_until_removed(web_server):
+    config_data = ProxyConfigData()
+    host = Host("example.com", 80)
+    for backend_id, address in (("container1", "172.18.0.2"), ("container2", "172.18.0.3")):
+        host.add_container(
+            "/",
+            BackendTarget(
+                id=backend_id, name=backend_id, address=address, port=80, path="", backend_type="container"
+            ),
+        )
+    config_data.add_host(host)
+    web_server.config_data = config_data
+
+    with patch.object(web_server.throttler, "throttle") as mock_run:
+        assert web_server.drain_backend("container2") is True
+        assert web_server.drain_backend("unknown") is False
+        mock_run.assert_called_once()
+    web_server.upstream_processor.process([host])
+    assert [backend.down for backend in host.locations["/"].backends] == [False, True]
+
+    with patch.object(web_server.throttler, "throttle"):
+        web_server.remove_backend("container2")
+    assert web_server._draining_backends == set()
+
+
 def _backend_target(backend_id, hostname, address, port=80, backend_type="container"):
     return BackendTarget(
         id=backend_id,
@@ -202,23 +238,12 @@ def test_register_static_sites_generates_missing_default_ssl_selfsigned_files(we
         for rendered_host in hosts:
             rendered_host.ssl_file = f"{rendered_host.hostname}.selfsigned"
 
-    def fake_openssl(command, **kwargs):
-        with open(command[command.index("-out") + 1], "w") as cert_file:
-            cert_file.write("cert")
-        with open(command[command.index("-keyout") + 1], "w") as key_file:
-            key_file.write("key")
-        return MagicMock(returncode=0)
-
     web_server.ssl_processor.process_ssl_certificates.side_effect = set_ssl_file
-    with (
-        patch("nginx_proxy.WebServer.pre_processors.process_static_sites") as process_static_sites,
-        patch("nginx_proxy.WebServer.subprocess.run", side_effect=fake_openssl) as openssl_run,
-    ):
+    with patch("nginx_proxy.WebServer.pre_processors.process_static_sites") as process_static_sites:
         process_static_sites.return_value = ProxyConfigData()
         web_server._register_static_sites()
         web_server._do_reload(forced=True)
 
-    openssl_run.assert_called_once()
     assert os.path.exists(cert_path)
     assert os.path.exists(key_path)
 
@@ -437,15 +462,17 @@ def test_validation_prepares_missing_selfsigned_certificate_files(web_server, tm
 
     web_server.ssl_processor.process_ssl_certificates.side_effect = set_ssl_file
 
-    with patch("nginx_proxy.WebServer.subprocess.run") as mock_run:
-        valid = web_server._validate_config_data(candidate)
+    valid = web_server._validate_config_data(candidate)
 
     assert valid is True
-    mock_run.assert_called_once()
-    command = mock_run.call_args.args[0]
-    assert command[0] == "openssl"
-    assert command[command.index("-out") + 1] == os.path.join(certs_dir, f"{hostname}.selfsigned.crt")
-    assert command[command.index("-keyout") + 1] == os.path.join(keys_dir, f"{hostname}.selfsigned.key")
+    with open(os.path.join(certs_dir, f"{hostname}.selfsigned.crt"), "rb") as cert_file:
+        cert = x509.load_pem_x509_certificate(cert_file.read())
+    with open(os.path.join(keys_dir, f"{hostname}.selfsigned.key"), "rb") as key_file:
+        key = serialization.load_pem_private_key(key_file.read(), password=None)
+    assert isinstance(key, ec.EllipticCurvePrivateKey)
+    assert cert.public_key().public_numbers() == key.public_key().public_numbers()
+    san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    assert san.get_values_for_type(x509.DNSName) == [hostname]
 
 
 def test_rescan_and_reload(web_server):
@@ -513,6 +540,32 @@ def test_should_register_container_now_can_bypass_startup_grace(web_server):
     assert web_server._should_register_container_now(container, bypass_start_grace=True) is True
 
 
+def test_should_register_container_now_hands_start_probe_to_listener(web_server):
+    web_server.config["backend_start_probe"] = True
+    web_server.docker_event_listener = MagicMock()
+    container = MagicMock()
+    container.id = "container1"
+    container.status = "running"
+    container.attrs = {
+        "Config": {"Env": [], "Labels": {}},
+        "State": {"Status": "running"},
+        "Name": "/app",
+        "NetworkSettings": {"Networks": {}, "Ports": {}},
+    }
+    targets = [ProbeTarget("172.18.0.2", 80, False, None, "app.example.com")]
+
+    with (
+        patch("nginx_proxy.WebServer.readiness_probe.probe_targets", return_value=targets),
+        patch("nginx_proxy.WebServer.readiness_probe.is_ready") as is_ready,
+    ):
+        assert web_server._should_register_container_now(container) is False
+        web_server.config_data.has_backend = lambda container_id: container_id == "container1"
+        assert web_server._should_register_container_now(container) is True
+
+    is_ready.assert_not_called()
+    web_server.docker_event_listener.probe_backend_start.assert_called_once_with("container1", targets)
+
+
 def test_connect_skips_unhealthy_healthchecked_container(web_server):
     web_server.networks = {"network1": "frontend", "frontend": "network1"}
     container = MagicMock()
@@ -632,3 +685,18 @@ def test_rescan_prefer_local_keeps_health_gate_for_swarm_task(web_server):
         web_server.rescan_all_container(bypass_start_grace=True)
 
     mock_register.assert_not_called()
+
+
+def test_changed_certificates_force_reloads_until_one_succeeds(web_server):
+    web_server.ssl_processor.certificates_changed.return_value = True
+    web_server.nginx.update_config.return_value = False
+
+    with patch.object(web_server, "_render_config", return_value="config"):
+        web_server._do_reload()
+        assert web_server.nginx.update_config.call_args.kwargs["force"] is True
+        web_server.ssl_processor.certificates_reloaded.assert_not_called()
+
+        web_server.nginx.update_config.return_value = True
+        web_server._do_reload()
+
+    web_server.ssl_processor.certificates_reloaded.assert_called_once_with()
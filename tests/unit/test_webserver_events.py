@@ -548,7 +548,8 @@ def test_webserver_add_two_containers_with_same_virtual_host(docker_client: Dock
     # Verify upstream block is created
     assert len(config.upstreams) == 1
     upstream = config.upstreams[0]
-    assert hostname in upstream.parameters
+    upstream_name = upstream.parameters.strip()
+    assert upstream_name.startswith(hostname + "_")
 
     # Verify both container IPs are in the upstream
     ip1 = c1.attrs["NetworkSettings"]["Networks"]["frontend"]["IPAddress"]
@@ -559,7 +560,7 @@ def test_webserver_add_two_containers_with_same_virtual_host(docker_client: Dock
 
     # Verify server block uses upstream
     server = expect_server_up(nginx, hostname)
-    assert f"http://{hostname}" in next(l.proxy_pass for l in server.locations if l.path == "/")
+    assert f"http://{upstream_name}" in next(l.proxy_pass for l in server.locations if l.path == "/")
 
 
 def test_webserver_restart_container_extras_do_not_duplicate_servers(
@@ -0,0 +1,117 @@
+from unittest.mock import MagicMock, mock_open, patch
+
+import pytest
+
+from nginx.Nginx import DrainingWorkers, Nginx
+from nginx_proxy.NginxConfig import get_nginx_config
+from nginx_proxy.WebServer import WebServer
+
+
+def _fake_process(proc_dir, pid, title, rss_kb, start_time):
+    process_dir = proc_dir / str(pid)
+    process_dir.mkdir()
+    (process_dir / "cmdline").write_bytes(title.encode() + b"\0")
+    (process_dir / "status").write_text(f"Name:\tnginx\nVmRSS:\t  {rss_kb} kB\n")
+    stat_fields = ["S"] + ["0"] * 18 + [str(start_time)] + ["0"] * 10
+    (process_dir / "stat").write_text(f"{pid} (nginx) " + " ".join(stat_fields))
+
+
+def test_draining_workers_counts_shutting_down_workers(tmp_path):
+    proc_dir = tmp_path / "proc"
+    proc_dir.mkdir()
+    _fake_process(proc_dir, 10, "nginx: master process nginx", 4096, 100)
+    _fake_process(proc_dir, 11, "nginx: worker process", 8192, 200)
+    _fake_process(proc_dir, 12, "nginx: worker process is shutting down", 1024, 150)
+    _fake_process(proc_dir, 13, "nginx: worker process is shutting down", 2048, 150)
+    _fake_process(proc_dir, 14, "nginx: worker process is shutting down", 1024, 170)
+    (proc_dir / "self").mkdir()
+
+    nginx = Nginx(str(tmp_path / "nginx-proxy.conf"), str(tmp_path / "challenges"))
+    draining = nginx.draining_workers(proc_dir=str(proc_dir))
+
+    assert draining.count == 3
+    assert draining.generations == 2
+    assert draining.rss_bytes == 4096 * 1024
+    assert sorted(draining.pids) == [12, 13, 14]
+
+
+def test_worker_shutdown_timeout_is_read_from_env(monkeypatch):
+    monkeypatch.setenv("NGINX_WORKER_SHUTDOWN_TIMEOUT", "10m")
+    assert get_nginx_config()["worker_shutdown_timeout"] == "10m"
+
+    monkeypatch.setenv("NGINX_WORKER_SHUTDOWN_TIMEOUT", "ten minutes")
+    assert get_nginx_config()["worker_shutdown_timeout"] is None
+
+
+@pytest.fixture
+def web_server(tmpdir):
+    config = {
+        "dummy_nginx": True,
+        "conf_dir": str(tmpdir.mkdir("nginx")),
+        "challenge_dir": str(tmpdir.mkdir("challenges")),
+        "vhosts_template_dir": "vhosts_template",
+        "ssl_dir": str(tmpdir.mkdir("ssl")),
+        "cert_renew_threshold_days": 30,
+        "docker_swarm": "ignore",
+        "max_draining_workers": 4,
+    }
+    with (
+        patch("builtins.open", mock_open(read_data="template_content")),
+        patch("nginx_proxy.WebServer.DummyNginx"),
+        patch(
+            "nginx_proxy.post_processors.SslCertificateProcessor",
+            **{"return_value.certificates_changed.return_value": False},
+        ),
+    ):
+        server = WebServer(MagicMock(), config, swarm_client=MagicMock())
+    yield server
+    server.cleanup()
+
+
+def test_non_urgent_reload_is_deferred_when_drain_budget_exceeded(web_server):
+    web_server.nginx.draining_workers.return_value = DrainingWorkers(count=8, rss_bytes=0, generations=4)
+
+    with patch.object(web_server, "_render_config") as render:
+        assert web_server._do_reload() is False
+
+    render.assert_not_called()
+    assert web_server.drain_status()["reload_deferred"] is True
+
+
+def test_urgent_reload_during_deferred_retry_is_applied(web_server):
+    web_server.nginx.draining_workers.return_value = DrainingWorkers(count=8, rss_bytes=0, generations=4)
+    with patch.object(web_server, "_render_config", return_value="config") as render:
+        assert web_server._do_reload(event="health check") is False
+
+        with patch.object(web_server.throttler, "throttle", side_effect=lambda task, immediate=False: task()):
+            web_server.reload(urgent=True, event="container removed")
+
+    render.assert_called_once()
+    assert web_server.nginx.update_config.call_args.kwargs["event"] == "health check, container removed"
+    assert web_server._urgent_reload_pending is False
+    assert web_server.drain_status()["reload_deferred"] is True
+
+
+def test_drain_status_is_logged_on_request(web_server, capsys):
+    web_server.nginx.draining_workers.return_value = DrainingWorkers(count=3, rss_bytes=64 * 1024 * 1024, generations=2)
+
+    status = web_server.log_drain_status()
+
+    assert status["draining_workers"] == 3
+    assert "[drain] draining_workers=3 generations=2 rss=64MiB" in capsys.readouterr().err
+
+
+def test_backend_removal_reload_ignores_drain_budget(web_server):
+    web_server.nginx.draining_workers.return_value = DrainingWorkers(count=8, rss_bytes=0, generations=4)
+    web_server.config_data = MagicMock()
+    web_server.config_data.remove_backend.return_value = (MagicMock(labels={}, type="container"), set())
+
+    with (
+        patch.object(web_server, "_register_static_sites"),
+        patch.object(web_server.throttler, "throttle", side_effect=lambda task, immediate=False: task()),
+        patch.object(web_server, "_render_config", return_value="config") as render,
+    ):
+        web_server.remove_backend("container1")
+
+    render.assert_called_once()
+    assert web_server._urgent_reload_pending is False